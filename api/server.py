@@ -0,0 +1,315 @@
+# api/server.py
+"""
+API HTTP de solo lectura (JSON) sobre el progreso de las solicitudes, pensada
+para el ERP y las herramientas del equipo comercial.
+
+    python -m api.server        # escucha en API_HOST:API_PORT (0.0.0.0:8000)
+
+Autenticación: cabecera "X-API-Key" (o "Authorization: Bearer <clave>").
+Cada clave se asocia a un correo en secrets [api_keys] (clave = "correo") o en
+la variable API_KEYS="clave1=correo1,clave2=correo2". El rol sale de
+identity_role(): "compliance" ve todas las solicitudes; el resto solo las que creó.
+
+Endpoints:
+    GET /api/requests?page=&page_size=&company_id=
+    GET /api/requests/<id>
+    GET /api/companies/<company_id>/progress?page=&page_size=
+
+Las respuestas llevan ETag y Last-Modified derivados de la última carga o
+modificación del alcance consultado; con If-None-Match / If-Modified-Since
+se responde 304 tras una única consulta agregada.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from database.db import run_read
+from database.crud.documents import (
+    get_progress_version,
+    get_progress_summaries,
+    get_request_documents,
+)
+from services.authentication import identity_role
+from services.cache import get_cache
+
+log = logging.getLogger("api")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PROGRESS_CACHE_TTL_SECONDS = 300
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def load_api_keys() -> dict[str, str]:
+    keys = {}
+    try:
+        import streamlit as st
+        keys.update({k: v for k, v in st.secrets["api_keys"].items()})
+    except Exception:
+        pass
+    for pair in (os.getenv("API_KEYS") or "").split(","):
+        if "=" in pair:
+            k, v = pair.split("=", 1)
+            keys[k.strip()] = v.strip()
+    return keys
+
+
+def _split_csv(s: str | None) -> list[str]:
+    if not s:
+        return []
+    return [x.strip() for x in s.split(",") if x and x.strip()]
+
+
+def _as_utc(dt: datetime | None) -> datetime | None:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _json_default(o):
+    if isinstance(o, datetime):
+        return _as_utc(o).isoformat()
+    raise TypeError(f"No serializable: {type(o)}")
+
+
+def _summary_json(r: dict) -> dict:
+    return {
+        "id": r["id"],
+        "company_id": r["company_id"],
+        "company_name": r["company_name"],
+        "profile": r["profile_name"],
+        "created_at": r["created_at"],
+        "created_by_email": r["created_by_email"],
+        "required_total": r["required_total"],
+        "required_uploaded": r["required_uploaded"],
+        "completion": r["completion"],
+        "complete": r["required_uploaded"] >= r["required_total"],
+        "last_upload_at": r["last_upload_at"],
+    }
+
+
+def _document_json(d: dict) -> dict:
+    links = _split_csv(d.get("drive_link"))
+    names = _split_csv(d.get("file_name"))
+    return {
+        "document_type_id": d["document_type_id"],
+        "name": d["name"],
+        "is_required": bool(d["is_required"]),
+        "uploaded": bool(links),
+        "files": [
+            {"name": names[i] if i < len(names) else None, "link": link}
+            for i, link in enumerate(links)
+        ],
+        "uploaded_at": d.get("uploaded_at"),
+        "uploaded_by": d.get("uploaded_by"),
+    }
+
+
+def _progress_summaries(version: dict, scope_email: str | None, company: int | None, request_id: int | None = None,
+                        limit: int | None = None, offset: int = 0) -> list[dict]:
+    """
+    get_progress_summaries en la caché compartida. La versión del alcance va en
+    la clave: cualquier carga o modificación produce una clave nueva.
+    """
+    key = repr((scope_email, company, request_id, limit, offset,
+                version["total"], version["uploads"], version["last_modified"]))
+    return get_cache().get_or_set(
+        "progress", key,
+        lambda: run_read(get_progress_summaries, scope_email, company, request_id, limit, offset),
+        ttl=PROGRESS_CACHE_TTL_SECONDS,
+    )
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = "ComplianceAPI/1.0"
+    api_keys: dict[str, str] = {}
+
+    # --------------------
+    # Infraestructura
+    # --------------------
+    def log_message(self, format, *args):
+        log.info("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: int, body: dict | None = None, headers: dict | None = None):
+        payload = json.dumps(body, default=_json_default, ensure_ascii=False).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _principal_email(self) -> str:
+        key = self.headers.get("X-API-Key")
+        auth = self.headers.get("Authorization") or ""
+        if not key and auth.lower().startswith("bearer "):
+            key = auth[7:].strip()
+        email = self.api_keys.get(key or "")
+        if not email:
+            raise ApiError(401, "API key inválida o ausente.")
+        return email
+
+    def _pagination(self, qs: dict) -> tuple[int, int]:
+        try:
+            page = int(qs.get("page", ["1"])[0])
+            page_size = int(qs.get("page_size", [str(DEFAULT_PAGE_SIZE)])[0])
+        except ValueError:
+            raise ApiError(400, "page y page_size deben ser enteros.")
+        if page < 1 or page_size < 1:
+            raise ApiError(400, "page y page_size deben ser >= 1.")
+        return page, min(page_size, MAX_PAGE_SIZE)
+
+    def _int_param(self, value: str, name: str) -> int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ApiError(400, f"{name} debe ser un entero.")
+
+    def _validators(self, version: dict, *variant) -> dict:
+        last_modified = _as_utc(version.get("last_modified"))
+        raw = "|".join(str(x) for x in (*variant, version["total"], version["uploads"], last_modified))
+        headers = {"ETag": f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"', "Cache-Control": "private, no-cache"}
+        if last_modified:
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+        return headers
+
+    def _not_modified(self, headers: dict) -> bool:
+        inm = self.headers.get("If-None-Match")
+        if inm:
+            tags = [t.strip() for t in inm.split(",")]
+            return "*" in tags or headers["ETag"] in tags
+        ims = self.headers.get("If-Modified-Since")
+        if ims and "Last-Modified" in headers:
+            try:
+                since = parsedate_to_datetime(ims)
+            except (TypeError, ValueError):
+                return False
+            current = parsedate_to_datetime(headers["Last-Modified"])
+            return current <= since
+        return False
+
+    # --------------------
+    # Rutas
+    # --------------------
+    def do_GET(self):
+        try:
+            url = urlsplit(self.path)
+            qs = parse_qs(url.query)
+            parts = [p for p in url.path.split("/") if p]
+
+            email = self._principal_email()
+            scope_email = None if identity_role(email) == "compliance" else email
+
+            if parts == ["api", "requests"]:
+                self._list_requests(scope_email, qs)
+            elif len(parts) == 3 and parts[:2] == ["api", "requests"]:
+                try:
+                    request_id = int(parts[2])
+                except ValueError:
+                    raise ApiError(404, "Solicitud no encontrada.")
+                self._request_detail(scope_email, request_id)
+            elif len(parts) == 4 and parts[:2] == ["api", "companies"] and parts[3] == "progress":
+                self._company_progress(scope_email, self._int_param(parts[2], "company_id"), qs)
+            else:
+                raise ApiError(404, "Ruta no encontrada.")
+
+        except ApiError as e:
+            self._send(e.status, {"error": e.message})
+        except Exception:
+            log.exception("Error atendiendo %s", self.path)
+            self._send(500, {"error": "Error interno."})
+
+    def _list_requests(self, scope_email: str | None, qs: dict):
+        page, page_size = self._pagination(qs)
+        company_id = qs.get("company_id", [None])[0]
+        company = self._int_param(company_id, "company_id") if company_id else None
+
+        version = run_read(get_progress_version, scope_email, company)
+        headers = self._validators(version, "requests", scope_email, company, page, page_size)
+        if self._not_modified(headers):
+            return self._send(304, headers=headers)
+
+        rows = _progress_summaries(version, scope_email, company, None, page_size, (page - 1) * page_size)
+        total = version["total"]
+        self._send(200, {
+            "items": [_summary_json(r) for r in rows],
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "next_page": page + 1 if page * page_size < total else None,
+        }, headers)
+
+    def _request_detail(self, scope_email: str | None, request_id: int):
+        version = run_read(get_progress_version, scope_email, None, request_id)
+        if not version["total"]:
+            raise ApiError(404, "Solicitud no encontrada.")
+        headers = self._validators(version, "request", scope_email, request_id)
+        if self._not_modified(headers):
+            return self._send(304, headers=headers)
+
+        summary = _progress_summaries(version, scope_email, None, request_id)[0]
+        documents = run_read(get_request_documents, request_id)
+        body = _summary_json(summary)
+        body["documents"] = [_document_json(d) for d in documents]
+        self._send(200, body, headers)
+
+    def _company_progress(self, scope_email: str | None, company: int, qs: dict):
+        page, page_size = self._pagination(qs)
+
+        version = run_read(get_progress_version, scope_email, company)
+        if not version["total"]:
+            raise ApiError(404, "Compañía sin solicitudes visibles.")
+        headers = self._validators(version, "company", scope_email, company, page, page_size)
+        if self._not_modified(headers):
+            return self._send(304, headers=headers)
+
+        rows = _progress_summaries(version, scope_email, company)
+        required_total = sum(r["required_total"] for r in rows)
+        required_uploaded = sum(r["required_uploaded"] for r in rows)
+        start = (page - 1) * page_size
+        self._send(200, {
+            "company_id": company,
+            "company_name": rows[0]["company_name"],
+            "requests_total": len(rows),
+            "requests_complete": sum(1 for r in rows if r["required_uploaded"] >= r["required_total"]),
+            "required_total": required_total,
+            "required_uploaded": required_uploaded,
+            "completion": int(round((required_uploaded / required_total) * 100)) if required_total else 100,
+            "items": [_summary_json(r) for r in rows[start:start + page_size]],
+            "page": page,
+            "page_size": page_size,
+            "next_page": page + 1 if start + page_size < len(rows) else None,
+        }, headers)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    ApiHandler.api_keys = load_api_keys()
+    if not ApiHandler.api_keys:
+        log.warning("No hay API keys configuradas: todas las peticiones recibirán 401.")
+
+    host = os.getenv("API_HOST", "0.0.0.0")
+    port = int(os.getenv("API_PORT", "8000"))
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    log.info("API escuchando en %s:%s", host, port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
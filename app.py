@@ -1,22 +1,9 @@
 import streamlit as st
-from services.authentication import check_authentication
+from services.authentication import check_authentication, identity_role
 
 st.set_page_config(page_title="Compliance Platform", layout="wide")
 
 
-# --- Roles ---
-def identity_role(email: str | None) -> str:
-
-    if not email:
-        return "other"
-
-    usernames = {"compliance", "compliance1", "compliance2", "sjaafar"}
-    domains = {"@tradingsolutions.com", "@tradingsol.com"}
-
-    allowed_emails = {u + d for u in usernames for d in domains}
-    return "compliance" if email.lower() in allowed_emails else "other"
-
-
 col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
     st.image("images/logo_trading.png")
@@ -31,8 +18,8 @@ is_admin = (role == "compliance")
 
 # Páginas visibles por rol
 pages_by_role: dict[str, list[str]] = {
-    "compliance": ["Home", "Solicitud de Creación", "Registro de Proveedores/ Clientes", "Progreso"],
-    "other":      ["Home", "Solicitud de Creación", "Progreso"],
+    "compliance": ["Home", "Solicitud de Creación", "Registro de Proveedores/ Clientes", "Progreso", "Búsqueda", "Analítica"],
+    "other":      ["Home", "Solicitud de Creación", "Progreso", "Búsqueda"],
 }
 
 allowed_pages = pages_by_role.get(role, pages_by_role["other"])
@@ -50,4 +37,12 @@ elif page == "Registro de Proveedores/ Clientes":
 
 elif page == "Progreso":
     import views.visualization as nt
-    nt.show(current_user_email=user_email, is_admin=is_admin)
\ No newline at end of file
+    nt.show(current_user_email=user_email, is_admin=is_admin)
+
+elif page == "Búsqueda":
+    import views.search as sr
+    sr.show(current_user_email=user_email, is_admin=is_admin)
+
+elif page == "Analítica":
+    import views.analytics as an
+    an.show()
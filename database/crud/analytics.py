@@ -0,0 +1,161 @@
+# database/crud/analytics.py
+from datetime import date
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+ONBOARDING_ROLLUP = "onboarding_daily_rollup"
+
+# Margen hacia atrás al leer cambios: cubre transacciones que confirmaron
+# después del refresco anterior con un updated_at previo a su marca de agua.
+_LOOKBACK = "INTERVAL '10 minutes'"
+
+# Fuente de los rollups: las solicitudes archivadas siguen contando en el histórico
+_ROLLUP_SOURCE = """(
+    SELECT created_at, updated_at, first_upload_at, completed_at, trading, requested_by, profile_id
+    FROM clients_requests
+    UNION ALL
+    SELECT created_at, updated_at, first_upload_at, completed_at, trading, requested_by, profile_id
+    FROM clients_requests_archive
+)"""
+
+
+def refresh_onboarding_rollup(session: Session) -> int:
+    """
+    Refresco incremental: toma solo las solicitudes modificadas desde la marca de
+    agua, calcula los grupos (día, trading, comercial, perfil) que tocan y
+    recalcula únicamente esos grupos. Devuelve cuántos grupos se recalcularon.
+    Debe ejecutarse dentro de una transacción.
+    """
+    # Un solo refresco a la vez (worker y botón de la página pueden coincidir)
+    session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:n))"), {"n": ONBOARDING_ROLLUP})
+
+    watermark = session.execute(
+        text("SELECT watermark FROM rollup_state WHERE name = :n"),
+        {"n": ONBOARDING_ROLLUP}
+    ).scalar()
+    new_watermark = session.execute(text("SELECT CAST(CURRENT_TIMESTAMP AS TIMESTAMP)")).scalar()
+
+    session.execute(text("""
+        CREATE TEMP TABLE IF NOT EXISTS tmp_rollup_keys (
+            day DATE, trading TEXT, requested_by TEXT, profile_id INTEGER
+        ) ON COMMIT DROP
+    """))
+    session.execute(text("TRUNCATE tmp_rollup_keys"))
+    session.execute(
+        text(f"""
+            INSERT INTO tmp_rollup_keys (day, trading, requested_by, profile_id)
+            SELECT DISTINCT v.d, COALESCE(cr.trading, ''), COALESCE(cr.requested_by, ''), cr.profile_id
+            FROM {_ROLLUP_SOURCE} cr
+            CROSS JOIN LATERAL (
+                VALUES (cr.created_at::date), (cr.first_upload_at::date), (cr.completed_at::date)
+            ) v(d)
+            WHERE v.d IS NOT NULL
+              AND (
+                  CAST(:wm AS TIMESTAMP) IS NULL
+                  OR GREATEST(cr.created_at, COALESCE(cr.updated_at, cr.created_at)) > CAST(:wm AS TIMESTAMP) - {_LOOKBACK}
+              )
+        """),
+        {"wm": watermark}
+    )
+
+    session.execute(text("""
+        DELETE FROM onboarding_daily_rollup r
+        USING tmp_rollup_keys k
+        WHERE r.day = k.day AND r.trading = k.trading
+          AND r.requested_by = k.requested_by AND r.profile_id = k.profile_id
+    """))
+
+    groups = session.execute(text(f"""
+        INSERT INTO onboarding_daily_rollup (
+            day, trading, requested_by, profile_id,
+            created_count, first_upload_count, completed_count,
+            hours_to_first_upload_sum, hours_to_completion_sum
+        )
+        SELECT
+            k.day, k.trading, k.requested_by, k.profile_id,
+            COUNT(*) FILTER (WHERE cr.created_at::date = k.day),
+            COUNT(*) FILTER (WHERE cr.first_upload_at::date = k.day),
+            COUNT(*) FILTER (WHERE cr.completed_at::date = k.day),
+            COALESCE(SUM(EXTRACT(EPOCH FROM cr.first_upload_at - cr.created_at) / 3600)
+                     FILTER (WHERE cr.first_upload_at::date = k.day), 0),
+            COALESCE(SUM(EXTRACT(EPOCH FROM cr.completed_at - cr.created_at) / 3600)
+                     FILTER (WHERE cr.completed_at::date = k.day), 0)
+        FROM (SELECT DISTINCT * FROM tmp_rollup_keys) k
+        JOIN {_ROLLUP_SOURCE} cr
+          ON cr.profile_id = k.profile_id
+         AND COALESCE(cr.trading, '') = k.trading
+         AND COALESCE(cr.requested_by, '') = k.requested_by
+         AND (
+              (cr.created_at >= k.day AND cr.created_at < k.day + 1)
+           OR (cr.first_upload_at >= k.day AND cr.first_upload_at < k.day + 1)
+           OR (cr.completed_at >= k.day AND cr.completed_at < k.day + 1)
+         )
+        GROUP BY k.day, k.trading, k.requested_by, k.profile_id
+    """)).rowcount
+
+    session.execute(
+        text("""
+            INSERT INTO rollup_state (name, watermark) VALUES (:n, :wm)
+            ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark
+        """),
+        {"n": ONBOARDING_ROLLUP, "wm": new_watermark}
+    )
+    return groups
+
+
+def get_rollup_last_refresh(session: Session):
+    return session.execute(
+        text("SELECT watermark FROM rollup_state WHERE name = :n"),
+        {"n": ONBOARDING_ROLLUP}
+    ).scalar()
+
+
+def get_rollup_dimensions(session: Session):
+    """Valores disponibles para filtrar (leídos del rollup, no de las tablas fuente)."""
+    tradings = session.execute(text(
+        "SELECT DISTINCT trading FROM onboarding_daily_rollup WHERE trading <> '' ORDER BY trading"
+    )).scalars().all()
+    requesters = session.execute(text(
+        "SELECT DISTINCT requested_by FROM onboarding_daily_rollup WHERE requested_by <> '' ORDER BY requested_by"
+    )).scalars().all()
+    return {"trading": list(tradings), "requested_by": list(requesters)}
+
+
+def get_onboarding_series(session: Session, date_from: date, date_to: date, trading: str | None = None,
+                          requested_by: str | None = None, profile_id: int | None = None):
+    """
+    Serie diaria del rango: creadas, primeras cargas, completadas, promedios de horas
+    y backlog (abiertas acumuladas desde el inicio del historial).
+    """
+    rows = session.execute(
+        text("""
+            WITH daily AS (
+                SELECT day,
+                       SUM(created_count) AS created,
+                       SUM(first_upload_count) AS first_uploads,
+                       SUM(completed_count) AS completed,
+                       SUM(hours_to_first_upload_sum) AS h_first,
+                       SUM(hours_to_completion_sum) AS h_complete
+                FROM onboarding_daily_rollup
+                WHERE day <= :date_to
+                  AND (:trading IS NULL OR trading = :trading)
+                  AND (:requested_by IS NULL OR requested_by = :requested_by)
+                  AND (:profile_id IS NULL OR profile_id = :profile_id)
+                GROUP BY day
+            ),
+            cumulative AS (
+                SELECT daily.*,
+                       SUM(created - completed) OVER (ORDER BY day) AS backlog
+                FROM daily
+            )
+            SELECT day, created, first_uploads, completed, backlog,
+                   CASE WHEN first_uploads > 0 THEN h_first / first_uploads END AS avg_hours_to_first_upload,
+                   CASE WHEN completed > 0 THEN h_complete / completed END AS avg_hours_to_completion
+            FROM cumulative
+            WHERE day >= :date_from
+            ORDER BY day
+        """),
+        {"date_from": date_from, "date_to": date_to, "trading": trading,
+         "requested_by": requested_by, "profile_id": profile_id}
+    ).mappings().all()
+    return [dict(r) for r in rows]
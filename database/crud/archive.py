@@ -0,0 +1,173 @@
+# database/crud/archive.py
+from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, text
+
+from database.crud.documents import REQUEST_CHANGED_CHANNEL, notify_request_changed
+
+# Tablas activas con copia en <tabla>_archive
+_ARCHIVED_TABLES = ("clients_requests", "uploaded_documents", "request_notes")
+
+
+def _archived_columns(session: Session) -> tuple[str, str, str]:
+    """
+    Columnas que se copian entre cada tabla activa y su archivo, leídas del
+    catálogo: las que existen en ambas, sin las generadas (search_tsv).
+    Devuelve (solicitudes, documentos, notas).
+    """
+    rows = session.execute(
+        text("""
+            SELECT a.table_name, string_agg(quote_ident(a.column_name), ', ' ORDER BY a.ordinal_position)
+            FROM information_schema.columns a
+            JOIN information_schema.columns z
+              ON z.table_schema = a.table_schema
+             AND z.table_name = a.table_name || '_archive'
+             AND z.column_name = a.column_name
+            WHERE a.table_schema = current_schema()
+              AND a.table_name IN :tables
+              AND a.is_generated = 'NEVER'
+            GROUP BY a.table_name
+        """).bindparams(bindparam("tables", expanding=True)),
+        {"tables": list(_ARCHIVED_TABLES)}
+    ).fetchall()
+    columns = dict(rows)
+    missing = [t for t in _ARCHIVED_TABLES if t not in columns]
+    if missing:
+        raise RuntimeError(f"Faltan tablas de archivo para: {', '.join(missing)}")
+    return tuple(columns[t] for t in _ARCHIVED_TABLES)
+
+
+def archive_requests_batch(session: Session, completed_after_days: int, inactive_after_days: int,
+                           batch_size: int = 200) -> int:
+    """
+    Mueve al archivo un lote de solicitudes completadas hace más de completed_after_days
+    días o sin actividad (cambios ni notas) hace más de inactive_after_days días, con sus
+    documentos y notas. Las que tienen cargas en cola se omiten. Una sola sentencia
+    (DELETE ... RETURNING -> INSERT) por lote, que además avisa por NOTIFY cada
+    solicitud movida; devuelve cuántas movió.
+    """
+    request_cols, document_cols, note_cols = _archived_columns(session)
+    return session.execute(
+        text(f"""
+            WITH batch AS (
+                SELECT cr.id
+                FROM clients_requests cr
+                WHERE (
+                        cr.completed_at < CURRENT_TIMESTAMP - make_interval(days => :completed_days)
+                     OR (
+                        GREATEST(cr.created_at, COALESCE(cr.updated_at, cr.created_at))
+                            < CURRENT_TIMESTAMP - make_interval(days => :inactive_days)
+                        AND NOT EXISTS (
+                            SELECT 1 FROM request_notes n
+                            WHERE n.request_id = cr.id
+                              AND n.created_at >= CURRENT_TIMESTAMP - make_interval(days => :inactive_days)
+                        )
+                     )
+                  )
+                  AND NOT EXISTS (
+                      SELECT 1 FROM upload_jobs j
+                      WHERE j.request_id = cr.id AND j.status IN ('queued', 'in_progress')
+                  )
+                ORDER BY cr.id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            ),
+            moved_docs AS (
+                DELETE FROM uploaded_documents ud USING batch b
+                WHERE ud.request_id = b.id
+                RETURNING {document_cols}
+            ),
+            archived_docs AS (
+                INSERT INTO uploaded_documents_archive ({document_cols})
+                SELECT {document_cols} FROM moved_docs
+            ),
+            moved_notes AS (
+                DELETE FROM request_notes n USING batch b
+                WHERE n.request_id = b.id
+                RETURNING {note_cols}
+            ),
+            archived_notes AS (
+                INSERT INTO request_notes_archive ({note_cols})
+                SELECT {note_cols} FROM moved_notes
+            ),
+            moved_requests AS (
+                DELETE FROM clients_requests cr USING batch b
+                WHERE cr.id = b.id
+                RETURNING {request_cols}
+            ),
+            archived AS (
+                INSERT INTO clients_requests_archive ({request_cols})
+                SELECT {request_cols} FROM moved_requests
+                RETURNING id
+            )
+            SELECT COUNT(*) FROM (SELECT pg_notify(:channel, id::text) FROM archived) notified
+        """),
+        {"completed_days": completed_after_days, "inactive_days": inactive_after_days, "batch_size": batch_size,
+         "channel": REQUEST_CHANGED_CHANNEL}
+    ).scalar()
+
+
+def restore_request(session: Session, request_id: int) -> bool:
+    """Devuelve una solicitud archivada (con documentos y notas) a las tablas activas."""
+    request_cols, document_cols, note_cols = _archived_columns(session)
+    restored = session.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM clients_requests_archive WHERE id = :rid
+                RETURNING {request_cols}
+            )
+            INSERT INTO clients_requests ({request_cols})
+            SELECT {request_cols} FROM moved
+        """),
+        {"rid": request_id}
+    ).rowcount
+    if not restored:
+        return False
+
+    session.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM uploaded_documents_archive WHERE request_id = :rid
+                RETURNING {document_cols}
+            )
+            INSERT INTO uploaded_documents ({document_cols})
+            SELECT {document_cols} FROM moved
+        """),
+        {"rid": request_id}
+    )
+    session.execute(
+        text(f"""
+            WITH moved AS (
+                DELETE FROM request_notes_archive WHERE request_id = :rid
+                RETURNING {note_cols}
+            )
+            INSERT INTO request_notes ({note_cols})
+            SELECT {note_cols} FROM moved
+        """),
+        {"rid": request_id}
+    )
+    # Actividad nueva: que no vuelva a archivarse en la próxima pasada
+    session.execute(
+        text("UPDATE clients_requests SET updated_at = CURRENT_TIMESTAMP WHERE id = :rid"),
+        {"rid": request_id}
+    )
+    notify_request_changed(session, request_id)
+    return True
+
+
+def get_archived_requests(session: Session, only_for_email: str | None = None,
+                          company_id: int | None = None, profile_id: int | None = None):
+    """Solicitudes archivadas con la misma forma que get_requests_for_progress (+ archived_at)."""
+    rows = session.execute(
+        text("""
+            SELECT cr.id, cr.company_id, COALESCE(c.name, cr.company_name) AS company_name,
+                   cr.profile_id, cr.created_at, cr.created_by_email, cr.archived_at
+            FROM clients_requests_archive cr
+            LEFT JOIN companies c ON c.id = cr.company_id
+            WHERE (:email IS NULL OR LOWER(cr.created_by_email) = LOWER(:email))
+              AND (:company IS NULL OR cr.company_id = :company)
+              AND (:profile IS NULL OR cr.profile_id = :profile)
+            ORDER BY cr.created_at DESC
+        """),
+        {"email": only_for_email, "company": company_id, "profile": profile_id}
+    ).mappings().all()
+    return [{**dict(r), "archived": True} for r in rows]
@@ -24,17 +24,18 @@ def get_profile_id(profile_name):
     return result[0] if result else None
 
 def insert_client_request(profile_id, company_name=None, email=None, trading=None, location=None, language=None, reminder_frequency=None,
-                            colaborador_nombre=None,colaborador_cedula=None, requested_by: str = None,  requested_by_type: str = None):
+                            colaborador_nombre=None,colaborador_cedula=None, requested_by: str = None,  requested_by_type: str = None,
+                            company_id: int = None):
     conn = get_connection()
     cur = conn.cursor()
 
     cur.execute("""
         INSERT INTO clients_requests (
-            profile_id, company_name, email, trading, location, language, reminder_frequency, colaborador_nombre, colaborador_cedula, requested_by, requested_by_type)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            profile_id, company_name, email, trading, location, language, reminder_frequency, colaborador_nombre, colaborador_cedula, requested_by, requested_by_type, company_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id;
     """, (
-        profile_id, company_name, email, trading, location, language, reminder_frequency, colaborador_nombre, colaborador_cedula, requested_by, requested_by_type))
+        profile_id, company_name, email, trading, location, language, reminder_frequency, colaborador_nombre, colaborador_cedula, requested_by, requested_by_type, company_id))
 
     request_id = cur.fetchone()[0]
     conn.commit()
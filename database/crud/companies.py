@@ -0,0 +1,57 @@
+# database/crud/companies.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from ui.helpers import company_key
+
+def get_companies(session: Session, include_archived: bool = False):
+    """
+    Compañías canónicas con al menos una solicitud: [{id, name}] por nombre.
+    Con include_archived también las que solo tienen solicitudes archivadas.
+    """
+    rows = session.execute(
+        text("""
+            SELECT c.id, c.name
+            FROM companies c
+            WHERE EXISTS (SELECT 1 FROM clients_requests cr WHERE cr.company_id = c.id)
+               OR (:archived AND EXISTS (SELECT 1 FROM clients_requests_archive a WHERE a.company_id = c.id))
+            ORDER BY c.name ASC
+        """),
+        {"archived": include_archived}
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+def find_similar_companies(session: Session, name: str, limit: int = 5, threshold: float = 0.45):
+    """
+    Posibles duplicados de `name` por similitud de trigramas sobre la clave normalizada
+    (índice GIN pg_trgm). La coincidencia exacta, si existe, viene primero con similarity = 1.
+    """
+    key = company_key(name)
+    if not key:
+        return []
+    rows = session.execute(
+        text("""
+            SELECT id, name, normalized_key, similarity(normalized_key, :k) AS similarity
+            FROM companies
+            WHERE normalized_key = :k
+               OR (normalized_key % :k AND similarity(normalized_key, :k) >= :threshold)
+            ORDER BY (normalized_key = :k) DESC, similarity DESC, name ASC
+            LIMIT :limit
+        """),
+        {"k": key, "threshold": threshold, "limit": limit}
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+def get_or_create_company(session: Session, name: str) -> int:
+    key = company_key(name)
+    if not key:
+        raise ValueError("El nombre de la compañía no tiene caracteres válidos.")
+    return session.execute(
+        text("""
+            INSERT INTO companies (name, normalized_key)
+            VALUES (:name, :k)
+            ON CONFLICT (normalized_key) DO UPDATE SET name = companies.name
+            RETURNING id
+        """),
+        {"name": name.strip(), "k": key}
+    ).scalar()
@@ -1,10 +1,14 @@
 # db_utils.py
+import hashlib
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-def get_all_company_names(session: Session):
-    rows = session.execute(text("SELECT DISTINCT company_name FROM clients_requests ORDER BY company_name ASC")).fetchall()
-    return [r[0] for r in rows]
+# Canal de NOTIFY con el id de la solicitud modificada (ver database/notifications.py)
+REQUEST_CHANGED_CHANNEL = "request_changed"
+
+def notify_request_changed(session: Session, request_id: int):
+    """Se entrega a los oyentes al confirmar la transacción; los repetidos en la misma se fusionan."""
+    session.execute(text("SELECT pg_notify(:channel, :rid)"), {"channel": REQUEST_CHANGED_CHANNEL, "rid": str(request_id)})
 
 def get_profiles_list(session: Session):
     rows = session.execute(text("SELECT name FROM profiles ORDER BY name ASC")).fetchall()
@@ -13,16 +17,16 @@ def get_profiles_list(session: Session):
 def get_profile_id_by_name(session: Session, profile_name: str):
     return session.execute(text("SELECT id FROM profiles WHERE name = :n"), {"n": profile_name}).scalar()
 
-def get_requests_by_company_and_profile(session: Session, company_name: str, profile_id: int, limit: int = 20):
+def get_requests_by_company_and_profile(session: Session, company_id: int, profile_id: int, limit: int = 20):
     rows = session.execute(
         text("""
             SELECT id, created_at
             FROM clients_requests
-            WHERE company_name = :company_name AND profile_id = :profile_id
+            WHERE company_id = :company_id AND profile_id = :profile_id
             ORDER BY created_at DESC
             LIMIT :limit
         """),
-        {"company_name": company_name, "profile_id": profile_id, "limit": limit}
+        {"company_id": company_id, "profile_id": profile_id, "limit": limit}
     ).mappings().all()
     # rows es una lista de dict-like rows con keys: id, created_at
     return rows
@@ -39,11 +43,12 @@ def get_required_document_types(session: Session, profile_id: int):
     ).mappings().all()
     return rows
 
-def get_uploaded_documents_map(session: Session, request_id: int):
+def get_uploaded_documents_map(session: Session, request_id: int, archived: bool = False):
+    table = "uploaded_documents_archive" if archived else "uploaded_documents"
     rows = session.execute(
-        text("""
+        text(f"""
             SELECT id, document_type_id, file_name, drive_link, uploaded_at, uploaded_by
-            FROM uploaded_documents
+            FROM {table}
             WHERE request_id = :rid
         """),
         {"rid": request_id}
@@ -70,41 +75,135 @@ def upsert_uploaded_document(session: Session, request_id: int, document_type_id
             "uploaded_by": uploaded_by
         }
     )
+    notify_request_changed(session, request_id)
 
-def get_request_meta(session, request_id: int):
+def append_uploaded_document_file(session: Session, request_id: int, document_type_id: int, file_name: str, drive_link: str, uploaded_by: str) -> bool:
     """
-    Devuelve {'notification_followup': str|None, 'general_comments': str|None}
-    para la solicitud dada. {} si no existe.
+    Agrega un archivo a un documento de varios archivos (CSV en file_name/drive_link)
+    en una sola sentencia, segura ante cargas concurrentes del mismo documento.
+    No hace nada si el enlace ya está. Devuelve True si agregó.
     """
     row = session.execute(
         text("""
-            SELECT notification_followup, general_comments
-            FROM clients_requests
-            WHERE id = :rid
+            INSERT INTO uploaded_documents (request_id, document_type_id, file_name, drive_link, uploaded_by)
+            VALUES (:request_id, :document_type_id, :file_name, :drive_link, :uploaded_by)
+            ON CONFLICT (request_id, document_type_id)
+            DO UPDATE SET
+                file_name = CASE WHEN COALESCE(TRIM(uploaded_documents.drive_link), '') = '' THEN EXCLUDED.file_name
+                                 ELSE uploaded_documents.file_name || ', ' || EXCLUDED.file_name END,
+                drive_link = CASE WHEN COALESCE(TRIM(uploaded_documents.drive_link), '') = '' THEN EXCLUDED.drive_link
+                                  ELSE uploaded_documents.drive_link || ', ' || EXCLUDED.drive_link END,
+                uploaded_at = CURRENT_TIMESTAMP,
+                uploaded_by = EXCLUDED.uploaded_by
+            WHERE position(EXCLUDED.drive_link IN COALESCE(uploaded_documents.drive_link, '')) = 0
+            RETURNING id
         """),
-        {"rid": request_id}
+        {
+            "request_id": request_id,
+            "document_type_id": document_type_id,
+            "file_name": file_name,
+            "drive_link": drive_link,
+            "uploaded_by": uploaded_by
+        }
     ).one_or_none()
+    if row is not None:
+        notify_request_changed(session, request_id)
+    return row is not None
 
-    if not row:
-        return {}
-    # row = (notification_followup, general_comments)
-    return {
-        "notification_followup": row[0],
-        "general_comments": row[1],
-    }
-
-def update_request_meta(session, request_id: int, notification_followup: str = None, general_comments: str = None):
-
+def record_document_version(session: Session, request_id: int, document_type_id: int, file_name: str, drive_link: str, uploaded_by: str):
+    """
+    Registra una carga como versión inmutable en uploaded_document_versions
+    (particionada por mes; la partición del mes en curso se crea si falta).
+    """
+    session.execute(text("SELECT ensure_document_versions_partition(CAST(CURRENT_TIMESTAMP AS TIMESTAMP))"))
     session.execute(
         text("""
-            UPDATE clients_requests
-            SET notification_followup = :nf,
-                general_comments      = :gc
-            WHERE id = :rid
+            INSERT INTO uploaded_document_versions (request_id, document_type_id, file_name, drive_link, uploaded_by)
+            VALUES (:request_id, :document_type_id, :file_name, :drive_link, :uploaded_by)
         """),
-        {"nf": notification_followup, "gc": general_comments, "rid": request_id}
+        {
+            "request_id": request_id,
+            "document_type_id": document_type_id,
+            "file_name": file_name,
+            "drive_link": drive_link,
+            "uploaded_by": uploaded_by
+        }
     )
 
+def list_document_versions(session: Session, request_id: int, document_type_id: int | None = None):
+    """Versiones de los documentos de la solicitud (o de un tipo), de la más reciente a la más antigua."""
+    rows = session.execute(
+        text("""
+            SELECT id, document_type_id, file_name, drive_link, uploaded_by, uploaded_at
+            FROM uploaded_document_versions
+            WHERE request_id = :rid
+              AND (:dtid IS NULL OR document_type_id = :dtid)
+            ORDER BY uploaded_at DESC, id DESC
+        """),
+        {"rid": request_id, "dtid": document_type_id}
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+def note_hash(body: str) -> str:
+    return hashlib.sha256(body.strip().encode("utf-8")).hexdigest()
+
+def get_request_notes(session, request_id: int, kind: str, limit: int = 5, before_id: int | None = None,
+                      archived: bool = False):
+    """
+    Entradas de la bitácora ('seguimiento' | 'comentario'), de la más reciente a la más antigua.
+    before_id pagina hacia atrás (keyset sobre created_at, id) para el botón "cargar más".
+    archived=True lee las de una solicitud archivada.
+    """
+    table = "request_notes_archive" if archived else "request_notes"
+    rows = session.execute(
+        text(f"""
+            SELECT id, author, created_at, body, body_hash
+            FROM {table}
+            WHERE request_id = :rid AND kind = :kind
+              AND (:before_id IS NULL OR (created_at, id) < (SELECT created_at, id FROM {table} WHERE id = :before_id))
+            ORDER BY created_at DESC, id DESC
+            LIMIT :limit
+        """),
+        {"rid": request_id, "kind": kind, "before_id": before_id, "limit": limit}
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+def append_request_note(session, request_id: int, kind: str, body: str, author: str | None = None) -> bool:
+    """
+    Agrega una entrada a la bitácora y marca updated_at de la solicitud (lo usan
+    los validadores del API). No escribe nada si el texto está vacío o si es
+    idéntico (mismo hash) a la última entrada de ese tipo. Devuelve True si insertó.
+    """
+    body = (body or "").strip()
+    if not body:
+        return False
+    row = session.execute(
+        text("""
+            WITH ins AS (
+                INSERT INTO request_notes (request_id, kind, author, body, body_hash)
+                SELECT :rid, :kind, :author, :body, :h
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM (
+                        SELECT body_hash FROM request_notes
+                        WHERE request_id = :rid AND kind = :kind
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT 1
+                    ) last
+                    WHERE last.body_hash = :h
+                )
+                RETURNING id, request_id
+            ), touched AS (
+                UPDATE clients_requests SET updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT request_id FROM ins)
+            )
+            SELECT id FROM ins
+        """),
+        {"rid": request_id, "kind": kind, "author": author, "body": body, "h": note_hash(body)}
+    ).one_or_none()
+    if row is not None:
+        notify_request_changed(session, request_id)
+    return row is not None
+
 def get_first_upload_at(session, request_id: int):
     row = session.execute(
         text("SELECT first_upload_at FROM clients_requests WHERE id = :rid"),
@@ -122,27 +221,203 @@ def set_first_upload_at_if_null(session, request_id: int, dt):
         {"rid": request_id, "dt": dt}
     )
 
+def touch_request_progress(session, request_id: int):
+    """
+    Tras registrar cargas: actualiza updated_at y fija completed_at la primera vez
+    que todos los documentos requeridos tienen archivo.
+    """
+    session.execute(
+        text("""
+            UPDATE clients_requests cr
+            SET updated_at = CURRENT_TIMESTAMP,
+                completed_at = CASE
+                    WHEN cr.completed_at IS NULL AND NOT EXISTS (
+                        SELECT 1
+                        FROM document_types dt
+                        LEFT JOIN uploaded_documents ud
+                               ON ud.request_id = cr.id AND ud.document_type_id = dt.id
+                        WHERE dt.profile_id = cr.profile_id AND dt.is_required
+                          AND COALESCE(TRIM(ud.drive_link), '') = ''
+                    ) THEN CURRENT_TIMESTAMP
+                    ELSE cr.completed_at
+                END
+            WHERE cr.id = :rid
+        """),
+        {"rid": request_id}
+    )
+
 def get_requests_for_progress(session, only_for_email: str | None = None):
 
     sql = text("""
         SELECT
-            id,
-            company_name,
-            profile_id,
-            created_at,
-            created_by_email
-        FROM clients_requests
-        WHERE (:email IS NULL OR LOWER(created_by_email) = LOWER(:email))
-        ORDER BY created_at DESC
+            cr.id,
+            cr.company_id,
+            COALESCE(c.name, cr.company_name) AS company_name,
+            cr.profile_id,
+            cr.created_at,
+            cr.created_by_email
+        FROM clients_requests cr
+        LEFT JOIN companies c ON c.id = cr.company_id
+        WHERE (:email IS NULL OR LOWER(cr.created_by_email) = LOWER(:email))
+        ORDER BY cr.created_at DESC
     """)
     rows = session.execute(sql, {"email": only_for_email}).fetchall()
     return [
         {
             "id": r.id,
+            "company_id": r.company_id,
             "company_name": r.company_name,
             "profile_id": r.profile_id,
             "created_at": r.created_at,
             "created_by_email": r.created_by_email,
         }
         for r in rows
-    ]
\ No newline at end of file
+    ]
+
+# Filtro común de alcance: por creador (no admin), compañía y/o solicitud
+_PROGRESS_SCOPE = """
+    (:email IS NULL OR LOWER(cr.created_by_email) = LOWER(:email))
+    AND (:company IS NULL OR cr.company_id = :company)
+    AND (:rid IS NULL OR cr.id = :rid)
+"""
+
+def get_progress_version(session, only_for_email: str | None = None, company_id: int | None = None, request_id: int | None = None):
+    """
+    Consulta barata para validadores HTTP: total de solicitudes del alcance,
+    número de documentos cargados y última modificación (creación, notas o carga).
+    """
+    row = session.execute(
+        text(f"""
+            SELECT
+                COUNT(*) AS total,
+                COALESCE(SUM(u.n), 0) AS uploads,
+                MAX(GREATEST(cr.created_at, COALESCE(cr.updated_at, cr.created_at), COALESCE(u.last_upload, cr.created_at))) AS last_modified
+            FROM clients_requests cr
+            LEFT JOIN LATERAL (
+                SELECT COUNT(*) AS n, MAX(ud.uploaded_at) AS last_upload
+                FROM uploaded_documents ud
+                WHERE ud.request_id = cr.id
+            ) u ON TRUE
+            WHERE {_PROGRESS_SCOPE}
+        """),
+        {"email": only_for_email, "company": company_id, "rid": request_id}
+    ).mappings().one()
+    return dict(row)
+
+def get_progress_summaries(session, only_for_email: str | None = None, company_id: int | None = None,
+                           request_id: int | None = None, limit: int | None = None, offset: int = 0):
+    """
+    Progreso por solicitud calculado en SQL: requeridos totales vs. requeridos cargados.
+    limit=None devuelve todas las del alcance.
+    """
+    rows = session.execute(
+        text(f"""
+            WITH req AS (
+                SELECT cr.id, cr.company_id, COALESCE(c.name, cr.company_name) AS company_name,
+                       cr.profile_id, p.name AS profile_name,
+                       cr.created_at, cr.created_by_email, cr.updated_at
+                FROM clients_requests cr
+                JOIN profiles p ON p.id = cr.profile_id
+                LEFT JOIN companies c ON c.id = cr.company_id
+                WHERE {_PROGRESS_SCOPE}
+                ORDER BY cr.created_at DESC, cr.id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT
+                req.*,
+                (SELECT COUNT(*) FROM document_types dt
+                  WHERE dt.profile_id = req.profile_id AND dt.is_required) AS required_total,
+                (SELECT COUNT(*) FROM uploaded_documents ud
+                   JOIN document_types dt ON dt.id = ud.document_type_id
+                  WHERE ud.request_id = req.id AND dt.is_required
+                    AND COALESCE(TRIM(ud.drive_link), '') <> '') AS required_uploaded,
+                (SELECT MAX(ud.uploaded_at) FROM uploaded_documents ud
+                  WHERE ud.request_id = req.id) AS last_upload_at
+            FROM req
+            ORDER BY req.created_at DESC, req.id DESC
+        """),
+        {"email": only_for_email, "company": company_id, "rid": request_id, "limit": limit, "offset": offset}
+    ).mappings().all()
+
+    result = []
+    for r in rows:
+        d = dict(r)
+        total = d["required_total"] or 0
+        d["completion"] = int(round((d["required_uploaded"] / total) * 100)) if total else 100
+        result.append(d)
+    return result
+
+def get_request_documents(session, request_id: int):
+    """Checklist de la solicitud: tipos de documento del perfil con su carga (si existe)."""
+    rows = session.execute(
+        text("""
+            SELECT dt.id AS document_type_id, dt.name, dt.is_required,
+                   ud.file_name, ud.drive_link, ud.uploaded_at, ud.uploaded_by
+            FROM clients_requests cr
+            JOIN document_types dt ON dt.profile_id = cr.profile_id
+            LEFT JOIN uploaded_documents ud
+                   ON ud.request_id = cr.id AND ud.document_type_id = dt.id
+            WHERE cr.id = :rid
+            ORDER BY dt.name ASC
+        """),
+        {"rid": request_id}
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+_SHEET_REQUEST_COLUMNS = """
+    id, created_at, requested_by, profile_id, company_id, company_name, colaborador_nombre,
+    colaborador_cedula, email, trading, location, language, reminder_frequency, completed_at
+"""
+
+def get_requests_for_sheet(session):
+    """
+    Filas del espejo en Sheets: una por solicitud con su avance en requeridos.
+    Incluye las archivadas: su fila se conserva en la hoja.
+    status: 'completa' (completed_at), 'en_progreso' (algún requerido cargado) o 'pendiente'.
+    """
+    rows = session.execute(
+        text(f"""
+            SELECT cr.id, cr.created_at, cr.requested_by, p.name AS profile_name,
+                   COALESCE(c.name, cr.company_name) AS company_name,
+                   cr.colaborador_nombre, cr.colaborador_cedula, cr.email, cr.trading,
+                   cr.location, cr.language, cr.reminder_frequency, cr.completed_at,
+                   COALESCE(req.total, 0) AS required_total,
+                   COALESCE(up.uploaded, 0) AS required_uploaded
+            FROM (
+                SELECT {_SHEET_REQUEST_COLUMNS} FROM clients_requests
+                UNION ALL
+                SELECT {_SHEET_REQUEST_COLUMNS} FROM clients_requests_archive
+            ) cr
+            JOIN profiles p ON p.id = cr.profile_id
+            LEFT JOIN companies c ON c.id = cr.company_id
+            LEFT JOIN (
+                SELECT profile_id, COUNT(*) AS total
+                FROM document_types WHERE is_required
+                GROUP BY profile_id
+            ) req ON req.profile_id = cr.profile_id
+            LEFT JOIN (
+                SELECT ud.request_id, COUNT(*) AS uploaded
+                FROM (
+                    SELECT request_id, document_type_id, drive_link FROM uploaded_documents
+                    UNION ALL
+                    SELECT request_id, document_type_id, drive_link FROM uploaded_documents_archive
+                ) ud
+                JOIN document_types dt ON dt.id = ud.document_type_id
+                WHERE dt.is_required AND COALESCE(TRIM(ud.drive_link), '') <> ''
+                GROUP BY ud.request_id
+            ) up ON up.request_id = cr.id
+            ORDER BY cr.id ASC
+        """)
+    ).mappings().all()
+
+    result = []
+    for r in rows:
+        d = dict(r)
+        if d["completed_at"]:
+            d["status"] = "completa"
+        elif d["required_uploaded"]:
+            d["status"] = "en_progreso"
+        else:
+            d["status"] = "pendiente"
+        result.append(d)
+    return result
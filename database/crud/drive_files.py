@@ -0,0 +1,80 @@
+# database/crud/drive_files.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+def get_drive_sync_state(session: Session, drive_id: str):
+    row = session.execute(
+        text("SELECT page_token, last_synced_at FROM drive_sync_state WHERE drive_id = :d"),
+        {"d": drive_id}
+    ).mappings().one_or_none()
+    return dict(row) if row else None
+
+def save_drive_sync_state(session: Session, drive_id: str, page_token: str):
+    session.execute(
+        text("""
+            INSERT INTO drive_sync_state (drive_id, page_token, last_synced_at)
+            VALUES (:d, :t, now())
+            ON CONFLICT (drive_id)
+            DO UPDATE SET page_token = EXCLUDED.page_token, last_synced_at = now()
+        """),
+        {"d": drive_id, "t": page_token}
+    )
+
+def get_last_drive_sync_at(session: Session):
+    """Última sincronización completada de cualquier unidad (None si el worker nunca corrió)."""
+    return session.execute(text("SELECT MAX(last_synced_at) FROM drive_sync_state")).scalar()
+
+def upsert_drive_files(session: Session, files: list[dict]):
+    """
+    files: dicts con la forma de la API de Drive (id, name, parents, size, trashed, modifiedTime).
+    """
+    if not files:
+        return
+    params = [
+        {
+            "file_id": f["id"],
+            "parent_id": (f.get("parents") or [None])[0],
+            "name": f.get("name"),
+            "size_bytes": int(f["size"]) if f.get("size") else None,
+            "trashed": bool(f.get("trashed")),
+            "modified_time": f.get("modifiedTime"),
+        }
+        for f in files
+    ]
+    session.execute(
+        text("""
+            INSERT INTO drive_files (file_id, parent_id, name, size_bytes, trashed, modified_time, synced_at)
+            VALUES (:file_id, :parent_id, :name, :size_bytes, :trashed, CAST(:modified_time AS TIMESTAMPTZ), now())
+            ON CONFLICT (file_id)
+            DO UPDATE SET
+                parent_id = EXCLUDED.parent_id,
+                name = EXCLUDED.name,
+                size_bytes = EXCLUDED.size_bytes,
+                trashed = EXCLUDED.trashed,
+                modified_time = EXCLUDED.modified_time,
+                synced_at = now()
+        """),
+        params
+    )
+
+def delete_drive_files(session: Session, file_ids: list[str]):
+    if not file_ids:
+        return
+    session.execute(
+        text("DELETE FROM drive_files WHERE file_id = ANY(:ids)"),
+        {"ids": list(file_ids)}
+    )
+
+def get_drive_files_by_ids(session: Session, file_ids: list[str]):
+    """Devuelve {file_id: {name, size_bytes, trashed, modified_time}} usando la PK."""
+    if not file_ids:
+        return {}
+    rows = session.execute(
+        text("""
+            SELECT file_id, name, size_bytes, trashed, modified_time
+            FROM drive_files
+            WHERE file_id = ANY(:ids)
+        """),
+        {"ids": list(set(file_ids))}
+    ).mappings().all()
+    return {r["file_id"]: dict(r) for r in rows}
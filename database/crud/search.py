@@ -0,0 +1,78 @@
+# database/crud/search.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+# ts_headline resalta con ** para que el fragmento se pinte en Markdown. Va como
+# parámetro: las comillas de FragmentDelimiter romperían un literal SQL
+_HEADLINE_OPTS = "MaxFragments=2, MaxWords=20, MinWords=5, FragmentDelimiter=' … ', StartSel=**, StopSel=**"
+
+def search_requests(session: Session, query: str, only_for_email: str | None = None, limit: int = 20, offset: int = 0):
+    """
+    Búsqueda de texto completo (config es_unaccent) sobre compañía, bitácora de
+    seguimiento/comentarios y nombres de archivo cargados. Resultados ordenados por relevancia;
+    cada fila trae 'total' con el número de solicitudes que coinciden.
+    """
+    rows = session.execute(
+        text(f"""
+            WITH q AS (
+                SELECT websearch_to_tsquery('es_unaccent', :q) AS query
+            ),
+            hits AS (
+                SELECT cr.id AS request_id, ts_rank(cr.search_tsv, q.query) AS rank
+                FROM clients_requests cr, q
+                WHERE cr.search_tsv @@ q.query
+                UNION ALL
+                SELECT ud.request_id, ts_rank(ud.search_tsv, q.query)
+                FROM uploaded_documents ud, q
+                WHERE ud.search_tsv @@ q.query
+                UNION ALL
+                SELECT n.request_id, ts_rank(n.search_tsv, q.query)
+                FROM request_notes n, q
+                WHERE n.search_tsv @@ q.query
+            ),
+            ranked AS (
+                SELECT h.request_id, SUM(h.rank) AS rank, COUNT(*) OVER () AS total
+                FROM hits h
+                JOIN clients_requests cr ON cr.id = h.request_id
+                WHERE (:email IS NULL OR LOWER(cr.created_by_email) = LOWER(:email))
+                GROUP BY h.request_id
+                ORDER BY rank DESC, h.request_id DESC
+                LIMIT :limit OFFSET :offset
+            )
+            SELECT
+                r.request_id AS id,
+                r.rank,
+                r.total,
+                cr.company_name,
+                p.name AS profile_name,
+                cr.created_at,
+                cr.created_by_email,
+                COALESCE(
+                    (
+                        SELECT ts_headline('es_unaccent', n.body, q.query, :headline_opts)
+                        FROM request_notes n
+                        WHERE n.request_id = r.request_id AND n.search_tsv @@ q.query
+                        ORDER BY ts_rank(n.search_tsv, q.query) DESC, n.id DESC
+                        LIMIT 1
+                    ),
+                    ts_headline(
+                        'es_unaccent',
+                        coalesce(cr.notification_followup, '') || E'\\n' || coalesce(cr.general_comments, ''),
+                        q.query,
+                        :headline_opts
+                    )
+                ) AS snippet,
+                (
+                    SELECT string_agg(ud.file_name, ', ')
+                    FROM uploaded_documents ud
+                    WHERE ud.request_id = r.request_id AND ud.search_tsv @@ q.query
+                ) AS matched_files
+            FROM ranked r
+            JOIN clients_requests cr ON cr.id = r.request_id
+            JOIN profiles p ON p.id = cr.profile_id
+            CROSS JOIN q
+            ORDER BY r.rank DESC, r.request_id DESC
+        """),
+        {"q": query, "email": only_for_email, "limit": limit, "offset": offset, "headline_opts": _HEADLINE_OPTS}
+    ).mappings().all()
+    return [dict(r) for r in rows]
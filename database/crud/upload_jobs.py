@@ -0,0 +1,171 @@
+# database/crud/upload_jobs.py
+import os
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+# Un trabajo fallido se puede reintentar desde la UI durante este tiempo; después
+# su archivo de staging se borra
+FAILED_RETRY_WINDOW = "INTERVAL '1 day'"
+
+# Trabajos que la UI muestra: pendientes y fallidos recientes
+VISIBLE_JOBS_WHERE = f"""
+    status IN ('queued', 'in_progress')
+    OR (status = 'failed' AND updated_at > CURRENT_TIMESTAMP - {FAILED_RETRY_WINDOW})
+"""
+
+# Directorio compartido entre la app (que deja los archivos) y workers/upload_worker.py
+STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "/tmp/compliance_staging")
+
+def enqueue_upload_job(session: Session, request_id: int, document_type_id: int, multi: bool, file_name: str,
+                       staging_path: str, folder_name: str, uploaded_by: str) -> int:
+    return session.execute(
+        text("""
+            INSERT INTO upload_jobs (request_id, document_type_id, multi, file_name, staging_path, folder_name, uploaded_by)
+            VALUES (:request_id, :document_type_id, :multi, :file_name, :staging_path, :folder_name, :uploaded_by)
+            RETURNING id
+        """),
+        {
+            "request_id": request_id,
+            "document_type_id": document_type_id,
+            "multi": multi,
+            "file_name": file_name,
+            "staging_path": staging_path,
+            "folder_name": folder_name,
+            "uploaded_by": uploaded_by
+        }
+    ).scalar()
+
+def claim_upload_job(session: Session, lease_seconds: int = 600):
+    """
+    Toma el siguiente trabajo listo (o uno en curso cuyo lease venció) con
+    FOR UPDATE SKIP LOCKED, así varios workers no compiten por la misma fila.
+    """
+    row = session.execute(
+        text("""
+            UPDATE upload_jobs
+            SET status = 'in_progress',
+                attempts = attempts + 1,
+                locked_until = CURRENT_TIMESTAMP + make_interval(secs => :lease),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM upload_jobs
+                WHERE (status = 'queued' AND run_after <= CURRENT_TIMESTAMP)
+                   OR (status = 'in_progress' AND locked_until < CURRENT_TIMESTAMP)
+                ORDER BY run_after, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING *
+        """),
+        {"lease": lease_seconds}
+    ).mappings().one_or_none()
+    return dict(row) if row else None
+
+def set_upload_job_link(session: Session, job_id: int, drive_link: str):
+    session.execute(
+        text("UPDATE upload_jobs SET drive_link = :link, updated_at = CURRENT_TIMESTAMP WHERE id = :id"),
+        {"id": job_id, "link": drive_link}
+    )
+
+def save_upload_progress(session: Session, job_id: int, attempt: int, lease_seconds: int, resumable_uri: str,
+                         bytes_uploaded: int, bytes_total: int, retries: int, bytes_per_second: float) -> bool:
+    """
+    Guarda la sesión reanudable y el avance (un reintento u otro worker continúa
+    desde aquí) y renueva el lease. attempt identifica la reclamación: devuelve
+    False si el trabajo ya no pertenece a este worker.
+    """
+    row = session.execute(
+        text("""
+            UPDATE upload_jobs
+            SET resumable_uri = :uri,
+                bytes_uploaded = :sent,
+                bytes_total = :total,
+                upload_retries = :retries,
+                bytes_per_second = :bps,
+                locked_until = CURRENT_TIMESTAMP + make_interval(secs => :lease),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id AND status = 'in_progress' AND attempts = :attempt
+            RETURNING id
+        """),
+        {"id": job_id, "attempt": attempt, "lease": lease_seconds, "uri": resumable_uri, "sent": bytes_uploaded,
+         "total": bytes_total, "retries": retries, "bps": bytes_per_second}
+    ).one_or_none()
+    return row is not None
+
+def complete_upload_job(session: Session, job_id: int):
+    session.execute(
+        text("""
+            UPDATE upload_jobs
+            SET status = 'done', locked_until = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """),
+        {"id": job_id}
+    )
+
+def fail_upload_job(session: Session, job_id: int, error: str, retry_in_seconds: int | None):
+    """Reprograma el trabajo (retry_in_seconds) o lo deja en 'failed' si ya no quedan intentos."""
+    session.execute(
+        text("""
+            UPDATE upload_jobs
+            SET status = CASE WHEN :retry IS NULL OR attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => COALESCE(:retry, 0)),
+                locked_until = NULL,
+                last_error = :error,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id
+        """),
+        {"id": job_id, "error": error[:2000], "retry": retry_in_seconds}
+    )
+
+def retry_upload_job(session: Session, job_id: int):
+    session.execute(
+        text("""
+            UPDATE upload_jobs
+            SET status = 'queued', attempts = 0, run_after = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = :id AND status = 'failed' AND staging_removed_at IS NULL
+        """),
+        {"id": job_id}
+    )
+
+def take_expired_staging_files(session: Session, limit: int = 100) -> list[str]:
+    """
+    Marca como borrados los archivos de staging de trabajos fallidos que ya no se
+    pueden reintentar y devuelve sus rutas para que el worker los elimine.
+    """
+    rows = session.execute(
+        text(f"""
+            UPDATE upload_jobs
+            SET staging_removed_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM upload_jobs
+                WHERE status = 'failed' AND staging_removed_at IS NULL
+                  AND updated_at <= CURRENT_TIMESTAMP - {FAILED_RETRY_WINDOW}
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT :limit
+            )
+            RETURNING staging_path
+        """),
+        {"limit": limit}
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def get_upload_jobs_status(session: Session, request_id: int):
+    """
+    Trabajos visibles en la UI por tipo de documento: en cola, en curso y
+    fallidos de las últimas 24 h. {document_type_id: [jobs]}
+    """
+    rows = session.execute(
+        text(f"""
+            SELECT id, document_type_id, file_name, status, attempts, max_attempts, last_error, updated_at,
+                   bytes_uploaded, bytes_total, upload_retries, bytes_per_second
+            FROM upload_jobs
+            WHERE request_id = :rid AND ({VISIBLE_JOBS_WHERE})
+            ORDER BY created_at, id
+        """),
+        {"rid": request_id}
+    ).mappings().all()
+    by_doc = {}
+    for r in rows:
+        by_doc.setdefault(r["document_type_id"], []).append(dict(r))
+    return by_doc
@@ -0,0 +1,149 @@
+# database/crud/upload_page.py
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from database.crud.upload_jobs import VISIBLE_JOBS_WHERE
+
+
+@dataclass
+class UploadPage:
+    """Todo lo que pinta el formulario de carga para una compañía/perfil/solicitud."""
+    profile_id: int | None
+    requests: list[dict]                # [{id, created_at}], más recientes primero
+    request_id: int | None              # solicitud elegida (o la única que hay)
+    checklist: list[dict]               # tipos de documento del perfil con su carga, si existe
+    notes: dict[str, list[dict]]        # primera página de cada bitácora
+    jobs: dict[int, list[dict]]         # {document_type_id: trabajos visibles de la cola}
+    drive_mirror: dict[str, dict]       # {file_id: {name, size_bytes, trashed}}
+    last_drive_sync_at: datetime | None
+
+    @property
+    def required_docs(self) -> list[dict]:
+        return [{"id": d["id"], "name": d["name"], "is_required": d["is_required"]} for d in self.checklist]
+
+    @property
+    def uploaded_map(self) -> dict[int, dict]:
+        return {
+            d["id"]: {
+                "file_name": d["file_name"],
+                "drive_link": d["drive_link"],
+                "uploaded_at": d["uploaded_at"],
+                "uploaded_by": d["uploaded_by"],
+            }
+            for d in self.checklist if d["has_upload"]
+        }
+
+
+def _ts(epoch) -> datetime | None:
+    # json_agg serializa timestamps en ISO con precisión variable; se envían como epoch
+    return datetime.fromtimestamp(float(epoch), tz=timezone.utc) if epoch is not None else None
+
+
+def load_upload_page(session: Session, company_id: int, profile_name: str, request_id: int | None,
+                     notes_limit: int = 6, requests_limit: int = 20) -> UploadPage:
+    """
+    Carga en una sola sentencia (un viaje a la DB) las solicitudes de la
+    compañía/perfil, el checklist con su estado de carga, la primera página de
+    cada bitácora, la cola de cargas y el espejo de Drive de los archivos.
+    Si request_id es None y solo hay una solicitud, se toma esa.
+    """
+    row = session.execute(
+        text(f"""
+            WITH prof AS (
+                SELECT id FROM profiles WHERE name = :profile
+            ),
+            reqs AS (
+                SELECT cr.id, cr.created_at
+                FROM clients_requests cr
+                WHERE cr.company_id = :company_id AND cr.profile_id = (SELECT id FROM prof)
+                ORDER BY cr.created_at DESC
+                LIMIT :requests_limit
+            ),
+            sel AS (
+                SELECT id FROM reqs
+                WHERE id = :rid OR (:rid IS NULL AND (SELECT COUNT(*) FROM reqs) = 1)
+            ),
+            checklist AS (
+                SELECT dt.id, dt.name, dt.is_required, ud.request_id IS NOT NULL AS has_upload,
+                       ud.file_name, ud.drive_link, ud.uploaded_by,
+                       EXTRACT(EPOCH FROM ud.uploaded_at) AS uploaded_at
+                FROM document_types dt
+                LEFT JOIN uploaded_documents ud
+                       ON ud.document_type_id = dt.id AND ud.request_id = (SELECT id FROM sel)
+                WHERE dt.profile_id = (SELECT id FROM prof)
+            ),
+            notes AS (
+                SELECT k.kind, n.id, n.author, n.body, n.created_at AS created_ts,
+                       EXTRACT(EPOCH FROM n.created_at) AS created_at
+                FROM (VALUES ('seguimiento'), ('comentario')) AS k(kind)
+                CROSS JOIN LATERAL (
+                    SELECT id, author, body, created_at
+                    FROM request_notes
+                    WHERE request_id = (SELECT id FROM sel) AND kind = k.kind
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT :notes_limit
+                ) n
+            ),
+            jobs AS (
+                SELECT id, document_type_id, file_name, status, attempts, max_attempts, last_error, created_at,
+                       bytes_uploaded, bytes_total, upload_retries, bytes_per_second
+                FROM upload_jobs
+                WHERE request_id = (SELECT id FROM sel) AND ({VISIBLE_JOBS_WHERE})
+            ),
+            mirror AS (
+                SELECT DISTINCT df.file_id, df.name, df.size_bytes, df.trashed
+                FROM checklist c
+                CROSS JOIN LATERAL regexp_split_to_table(c.drive_link, ',') AS link
+                JOIN drive_files df ON df.file_id = COALESCE(
+                    substring(link FROM '/d/([A-Za-z0-9_-]+)'),
+                    substring(link FROM '[?&]id=([A-Za-z0-9_-]+)')
+                )
+            )
+            SELECT
+                (SELECT id FROM prof) AS profile_id,
+                (SELECT id FROM sel) AS request_id,
+                (SELECT COALESCE(json_agg(json_build_object('id', r.id, 'created_at', EXTRACT(EPOCH FROM r.created_at))
+                                          ORDER BY r.created_at DESC), '[]')
+                   FROM reqs r) AS requests,
+                (SELECT COALESCE(json_agg(c ORDER BY c.name), '[]') FROM checklist c) AS checklist,
+                (SELECT COALESCE(json_agg(json_build_object('kind', n.kind, 'id', n.id, 'author', n.author,
+                                                            'body', n.body, 'created_at', n.created_at)
+                                          ORDER BY n.created_ts DESC, n.id DESC), '[]')
+                   FROM notes n) AS notes,
+                (SELECT COALESCE(json_agg(j ORDER BY j.created_at, j.id), '[]') FROM jobs j) AS jobs,
+                (SELECT COALESCE(json_agg(m), '[]') FROM mirror m) AS drive_mirror,
+                (SELECT EXTRACT(EPOCH FROM MAX(last_synced_at)) FROM drive_sync_state) AS last_drive_sync_at
+        """),
+        {
+            "company_id": company_id,
+            "profile": profile_name,
+            "rid": request_id,
+            "notes_limit": notes_limit,
+            "requests_limit": requests_limit,
+        }
+    ).mappings().one()
+
+    checklist = [{**d, "uploaded_at": _ts(d["uploaded_at"])} for d in row["checklist"]]
+
+    notes = {"seguimiento": [], "comentario": []}
+    for n in row["notes"]:
+        notes[n.pop("kind")].append({**n, "created_at": _ts(n["created_at"])})
+
+    jobs = {}
+    for j in row["jobs"]:
+        j.pop("created_at")
+        jobs.setdefault(j["document_type_id"], []).append(j)
+
+    return UploadPage(
+        profile_id=row["profile_id"],
+        requests=[{**r, "created_at": _ts(r["created_at"])} for r in row["requests"]],
+        request_id=row["request_id"],
+        checklist=checklist,
+        notes=notes,
+        jobs=jobs,
+        drive_mirror={m["file_id"]: m for m in row["drive_mirror"]},
+        last_drive_sync_at=_ts(row["last_drive_sync_at"]),
+    )
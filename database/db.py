@@ -1,7 +1,10 @@
 # database/db.py
 
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 
 try:
@@ -15,6 +18,159 @@ except Exception:
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL no está definida. Revisa tus secretos o tu archivo .env")
 
+
+def _optional_setting(name: str, default=None):
+    try:
+        import streamlit as st
+        return st.secrets[name]
+    except Exception:
+        return os.getenv(name, default)
+
+
 engine = create_engine(DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# --------------------
+# Réplica de lectura (opcional)
+# --------------------
+# READ_REPLICA_URL: DSN de la réplica. Si no está definida, todo va al primario.
+# REPLICA_MAX_LAG_SECONDS: retraso máximo tolerado antes de volver al primario.
+READ_REPLICA_URL = _optional_setting("READ_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(_optional_setting("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_CHECK_INTERVAL_SECONDS = 10
+
+replica_engine = (
+    create_engine(READ_REPLICA_URL, pool_pre_ping=True, connect_args={"connect_timeout": 3})
+    if READ_REPLICA_URL else None
+)
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    if replica_engine is not None else None
+)
+
+_replica_lock = threading.Lock()
+# write_lsn: posición WAL del primario tras la última escritura (o el último estado
+# leído del primario) que la réplica todavía no ha confirmado haber reproducido
+_replica_state = {"checked_at": 0.0, "lag": None, "write_lsn": None}
+
+
+def _primary_lsn() -> str:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+
+def _measure_replica_lag() -> float | None:
+    """
+    Segundos de retraso de la réplica; None si no responde. Se compara con la
+    posición actual del primario: que la réplica haya reproducido todo lo que
+    recibió no basta (si se cortó la replicación, no recibe nada nuevo).
+    """
+    try:
+        primary_lsn = _primary_lsn()
+        with replica_engine.connect() as conn:
+            lag = conn.execute(text("""
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+                    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                END
+            """), {"primary_lsn": primary_lsn}).scalar()
+        # Atrasada sin ninguna transacción reproducida: no se sabe cuánto, se descarta
+        return float(lag) if lag is not None else None
+    except Exception:
+        return None
+
+
+def _replica_reached(lsn: str) -> bool:
+    """True si la réplica ya reprodujo el WAL del primario hasta lsn."""
+    try:
+        with replica_engine.connect() as conn:
+            return bool(conn.execute(
+                text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"), {"lsn": lsn}
+            ).scalar())
+    except Exception:
+        return False
+
+
+def replica_lag_seconds() -> float | None:
+    """Retraso de la réplica, medido como mucho cada REPLICA_CHECK_INTERVAL_SECONDS."""
+    if replica_engine is None:
+        return None
+    with _replica_lock:
+        now = time.monotonic()
+        if now - _replica_state["checked_at"] >= REPLICA_CHECK_INTERVAL_SECONDS:
+            _replica_state["lag"] = _measure_replica_lag()
+            _replica_state["checked_at"] = now
+        return _replica_state["lag"]
+
+
+def _mark_replica_down():
+    with _replica_lock:
+        _replica_state["lag"] = None
+        _replica_state["checked_at"] = time.monotonic()
+
+
+def mark_write():
+    """
+    Registra la posición WAL del primario tras una escritura ya confirmada.
+    Mientras la réplica no la haya reproducido, las lecturas van al primario
+    (read-your-writes). También sirve tras observar en el primario un cambio
+    hecho por otro proceso (p. ej. la cola del worker de cargas vaciándose).
+
+    Se lleva por proceso y no por sesión: las lecturas de st.cache_data se
+    comparten entre sesiones, y otra sesión podría volver a llenar desde la
+    réplica atrasada la entrada que quien escribió acaba de invalidar.
+    """
+    if replica_engine is None:
+        return
+    lsn = _primary_lsn()
+    with _replica_lock:
+        _replica_state["write_lsn"] = lsn
+
+
+def _use_replica() -> bool:
+    lag = replica_lag_seconds()
+    if lag is None or lag > REPLICA_MAX_LAG_SECONDS:
+        return False
+    with _replica_lock:
+        write_lsn = _replica_state["write_lsn"]
+    if write_lsn is None:
+        return True
+    if not _replica_reached(write_lsn):
+        return False
+    with _replica_lock:
+        # Solo si no hubo otra escritura mientras se consultaba
+        if _replica_state["write_lsn"] == write_lsn:
+            _replica_state["write_lsn"] = None
+    return True
+
+
+def ReadSessionLocal():
+    """
+    Fábrica de sesiones para páginas de solo lectura: usa la réplica si está
+    configurada, sana y dentro del retraso tolerado; si no, el primario.
+    """
+    if ReplicaSessionLocal is not None and _use_replica():
+        return ReplicaSessionLocal()
+    return SessionLocal()
+
+
+def run_read(fn, *args, **kwargs):
+    """
+    Ejecuta fn(session, *args, **kwargs) en una sesión de lectura. Si la réplica
+    falla a mitad de la consulta, la marca como caída y repite en el primario.
+    """
+    session = ReadSessionLocal()
+    try:
+        return fn(session, *args, **kwargs)
+    except OperationalError:
+        if session.get_bind() is engine:
+            raise
+        _mark_replica_down()
+    finally:
+        session.close()
+
+    with SessionLocal() as session:
+        return fn(session, *args, **kwargs)
@@ -0,0 +1,83 @@
+# database/notifications.py
+"""
+Oyente de NOTIFY request_changed: una conexión LISTEN por proceso que lleva un
+contador de versión por solicitud. Las sesiones que miran una solicitud comparan
+ese contador (en memoria, sin consultar la DB) y solo re-consultan si cambió.
+"""
+
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+import streamlit as st
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from database.db import engine
+from database.crud.documents import REQUEST_CHANGED_CHANNEL
+
+log = logging.getLogger("request_listener")
+
+_POLL_TIMEOUT_SECONDS = 5
+_RECONNECT_MAX_SECONDS = 60
+
+
+class RequestChangeListener:
+    def __init__(self, dsn: str):
+        self._dsn = dsn
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        # Cambia cada vez que se (re)conecta: lo ocurrido sin conexión no llegó como evento
+        self._epoch = 0
+        self._thread = threading.Thread(target=self._run, name="request-change-listener", daemon=True)
+        self._thread.start()
+
+    def version(self, request_id: int) -> tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._versions.get(request_id, 0)
+
+    def _bump(self, request_id: int):
+        with self._lock:
+            self._versions[request_id] = self._versions.get(request_id, 0) + 1
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                conn = psycopg2.connect(self._dsn)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {REQUEST_CHANGED_CHANNEL}")
+                with self._lock:
+                    self._epoch += 1
+                delay = 1
+                self._listen(conn)
+            except Exception:
+                log.exception("Conexión LISTEN perdida; reintentando en %ss", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_MAX_SECONDS)
+
+    def _listen(self, conn):
+        try:
+            while True:
+                if select.select([conn], [], [], _POLL_TIMEOUT_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = conn.notifies.pop(0).payload
+                    if payload.isdigit():
+                        self._bump(int(payload))
+        finally:
+            conn.close()
+
+
+def _listener_dsn() -> str:
+    # Misma base que el engine, con el nombre de driver que entiende psycopg2
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+@st.cache_resource(show_spinner=False)
+def get_request_listener() -> RequestChangeListener:
+    """Oyente compartido del proceso (un hilo y una conexión para todas las sesiones)."""
+    return RequestChangeListener(_listener_dsn())
@@ -2,6 +2,10 @@ import streamlit as st
 import re
 from database.crud.clientes import insert_client_request, get_profile_id
 from services.sheets_writer import save_request
+from database.db import SessionLocal, run_read, mark_write
+from database.crud.companies import find_similar_companies, get_or_create_company
+from ui.helpers import company_key
+from forms.upload_documents_form import clear_caches as clear_upload_caches
 
 EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
@@ -55,6 +59,30 @@ def forms():
             key="frecuencia_recordatorio"
         )
 
+    # -------- Posibles duplicados de la compañía --------
+    existing_company = None
+    needs_company_choice = False
+    if company_name and company_name.strip():
+        candidates = run_read(find_similar_companies, company_name)
+        exact = [c for c in candidates if c["normalized_key"] == company_key(company_name)]
+        if exact:
+            existing_company = exact[0]
+            st.info(f"ℹ️ Se asociará a la compañía existente **{existing_company['name']}**.")
+        elif candidates:
+            by_id = {c["id"]: c for c in candidates}
+            st.warning("⚠️ Hay compañías registradas con un nombre parecido. ¿Es alguna de ellas?")
+            choice = st.radio(
+                "Compañía",
+                [c["id"] for c in candidates] + ["nueva"],
+                format_func=lambda cid: "No, es una compañía nueva" if cid == "nueva" else by_id[cid]["name"],
+                index=None,
+                key="company_match"
+            )
+            if choice is None:
+                needs_company_choice = True
+            elif choice != "nueva":
+                existing_company = by_id[choice]
+
     # -------- Botón de guardado (sin st.form) --------
     if st.button("Guardar", key="guardar_general"):
         # Validaciones mínimas
@@ -67,11 +95,23 @@ def forms():
         if tipo_solicitud.lower() == "proveedor" and not requested_by:
             st.error("❌ Debes ingresar el nombre de quien solicita (proveedor).")
             return
+        if needs_company_choice:
+            st.error("❌ Indica si la compañía es una de las existentes o una nueva.")
+            return
+
+        # Compañía canónica: la existente elegida o una nueva
+        if existing_company:
+            company_id = existing_company["id"]
+            company_name = existing_company["name"]
+        else:
+            with SessionLocal() as session, session.begin():
+                company_id = get_or_create_company(session, company_name)
 
         # Persistir en DB
         request_id = insert_client_request(
             profile_id=profile_id,
             company_name=company_name,
+            company_id=company_id,
             email=email or None,
             trading=trading,
             location=location or None,
@@ -80,6 +120,9 @@ def forms():
             requested_by=requested_by,
             requested_by_type=requested_by_type
         )
+        mark_write()
+        # La nueva compañía/solicitud debe aparecer ya en el formulario de carga
+        clear_upload_caches()
 
         # Guardar también en Google Sheets (incluye request_id para trazabilidad)
         save_request({
@@ -1,34 +1,40 @@
 # form_documents_existing.py
 
 import os
-import unicodedata
+import re
+import uuid
+import shutil
+import zipfile
+import difflib
 import streamlit as st
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
-from database.db import SessionLocal
-from database.crud.documents import (
-    get_all_company_names,
-    get_profiles_list,
-    get_profile_id_by_name,
-    get_requests_by_company_and_profile,
-    get_required_document_types,
-    get_uploaded_documents_map,
-    upsert_uploaded_document,
-    get_request_meta,
-    update_request_meta
-)
-from services.google_drive_utils import init_drive, find_or_create_folder, upload_to_drive
+from database.db import SessionLocal, run_read, mark_write
+from database.crud.companies import get_companies
+from database.crud.documents import get_profiles_list, get_uploaded_documents_map, get_request_notes, append_request_note
+from database.crud.archive import get_archived_requests, restore_request
+from database.crud.upload_jobs import STAGING_DIR, enqueue_upload_job, retry_upload_job, get_upload_jobs_status
+from database.crud.upload_page import UploadPage, load_upload_page
+from services.cache import cached
+from ui.helpers import slug, format_size, drive_status_suffix, render_note_log, NOTES_PAGE_SIZE
 
 CO_TZ = ZoneInfo("America/Bogota")
 
-def _slug(s: str) -> str:
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    return s.strip().lower()
+# Claves de session_state compartidas entre fragments
+SELECTION_KEY = "upload_selection"
+FLASH_KEY = "upload_flash"
 
+# Carga masiva: similitud mínima para proponer un tipo de documento, ventaja
+# mínima sobre el segundo más parecido y tamaño máximo (descomprimido) de cada
+# entrada del ZIP
+ZIP_MATCH_THRESHOLD = 0.5
+ZIP_MATCH_MARGIN = 0.1
+ZIP_MAX_ENTRY_BYTES = 50 * 1024 * 1024
+ZIP_IGNORE = "(ignorar)"
 
 def is_security_verification(doc_name: str) -> bool:
-    return "verificaciones de seguridad" in _slug(doc_name)
+    return "verificaciones de seguridad" in slug(doc_name)
 
 def split_csv_list(s: str):
     if not s:
@@ -39,6 +45,55 @@ def sanitize_name_for_csv(name: str) -> str:
     return name.replace(",", " - ").replace("/", "_").replace("\\", "_").strip()
 
 
+def _name_tokens(s: str) -> list[str]:
+    # Sin palabras de una o dos letras ("de", "y"); los números se conservan
+    # ("Certificación comercial 1" vs. "... 2")
+    return [t for t in re.split(r"[^a-z0-9]+", slug(s)) if len(t) > 2 or t.isdigit()]
+
+def _ordinals(tokens) -> set[str]:
+    # Números cortos: consecutivos de tipos hermanos (los años y códigos son más largos)
+    return {t.lstrip("0") or "0" for t in tokens if t.isdigit() and len(t) <= 2}
+
+def _same_word(a: str, b: str) -> bool:
+    # Plurales y erratas ("certificados"), no palabras distintas ("certificado"/"certificacion")
+    return a == b or (not a.isdigit() and difflib.SequenceMatcher(None, a, b).ratio() >= 0.85)
+
+def match_document_type(file_name: str, required_docs) -> tuple[int | None, float]:
+    """
+    Propone el tipo de documento para un archivo según las palabras que comparten
+    los nombres normalizados (sin tildes ni mayúsculas): cuánto del nombre del tipo
+    aparece en el archivo y cuánto del archivo pertenece al tipo. Devuelve
+    (document_type_id, puntaje); el id es None si el mejor tipo no supera al
+    segundo por ZIP_MATCH_MARGIN.
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    file_tokens = set(_name_tokens(stem))
+    file_ordinals = _ordinals(file_tokens)
+    # Años y otros números largos no dicen nada del tipo: no cuentan en contra
+    file_words = {t for t in file_tokens if not (t.isdigit() and len(t) >= 4)}
+
+    scores = []
+    for doc in required_docs:
+        doc_tokens = set(_name_tokens(doc["name"]))
+        if not doc_tokens or not file_words:
+            continue
+        doc_ordinals = _ordinals(doc_tokens)
+        if file_ordinals and doc_ordinals and not file_ordinals & doc_ordinals:
+            # "comercial_2" nunca es "Certificación comercial 1"
+            continue
+        covered = sum(1 for d in doc_tokens if any(_same_word(f, d) for f in file_tokens))
+        belongs = sum(1 for f in file_words if any(_same_word(f, d) for d in doc_tokens))
+        scores.append(((covered / len(doc_tokens) + belongs / len(file_words)) / 2, doc["id"]))
+
+    if not scores:
+        return None, 0.0
+    scores.sort(key=lambda s: s[0], reverse=True)
+    best_score, best_id = scores[0]
+    if len(scores) > 1 and best_score - scores[1][0] < ZIP_MATCH_MARGIN:
+        return None, best_score
+    return best_id, best_score
+
+
 def _to_colombia_tz(dt: datetime | None) -> datetime | None:
 
     if not dt:
@@ -48,264 +103,642 @@ def _to_colombia_tz(dt: datetime | None) -> datetime | None:
     return dt.astimezone(CO_TZ)
 
 
-def forms():
-    st.subheader("📎 Carga de documentos")
+# --------------------
+# Lecturas cacheadas (compartidas entre fragments)
+# --------------------
+# Los datos de referencia se cachean aparte (services.cache, compartida entre réplicas); todo lo de la compañía/perfil/solicitud
+# elegida llega en una sola consulta (load_upload_page) que comparten los fragments.
+# Tras guardar se invalidan con _clear_request_caches().
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_companies(include_archived: bool):
+    return run_read(get_companies, include_archived)
+
+@cached("reference", ttl=3600)
+def _load_profiles():
+    return run_read(get_profiles_list)
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _load_page(company_id: int, profile_name: str, request_id: int | None) -> UploadPage:
+    return run_read(load_upload_page, company_id, profile_name, request_id, NOTES_PAGE_SIZE + 1)
+
+def _page(selection: dict) -> UploadPage:
+    # Mismos argumentos que usó el selector: los fragments leen de la misma entrada de caché
+    return _load_page(*selection["page_args"])
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_archived_requests(company_id: int, profile_id: int):
+    return run_read(get_archived_requests, None, company_id, profile_id)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _load_archived_uploads(request_id: int):
+    return {k: dict(v) for k, v in run_read(get_uploaded_documents_map, request_id, True).items()}
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _load_notes_page(request_id: int, kind: str, limit: int, before_id: int | None):
+    return run_read(get_request_notes, request_id, kind, limit, before_id)
+
+@st.cache_data(ttl=2, show_spinner=False)
+def _load_job_status(request_id: int):
+    # Siempre al primario: el estado de la cola cambia cada pocos segundos
+    with SessionLocal() as session:
+        return get_upload_jobs_status(session, request_id)
+
+def _notes_fetcher(page: UploadPage):
+    """La primera página de cada bitácora viene en la carga de la página; "Cargar más" consulta aparte."""
+    def fetch(request_id: int, kind: str, limit: int, before_id: int | None):
+        if before_id is None and limit <= NOTES_PAGE_SIZE + 1:
+            return page.notes[kind][:limit]
+        return _load_notes_page(request_id, kind, limit, before_id)
+    return fetch
+
+def _clear_request_caches():
+    _load_page.clear()
+    _load_notes_page.clear()
+
+def clear_caches():
+    """Para las páginas que crean compañías o solicitudes (forms/request_form.py)."""
+    _load_companies.clear()
+    _clear_request_caches()
+
+
+def _uploader_key(request_id: int, doc_id: int) -> str:
+    # La "generación" cambia tras cada guardado para vaciar los uploaders ya procesados
+    gen = st.session_state.get(f"uploader_gen_{request_id}", 0)
+    return f"uploader_{request_id}_{doc_id}_{gen}"
+
+def _is_uploaded(doc_name: str, rec: dict | None) -> bool:
+    link_csv = rec.get("drive_link") if rec else None
+    if is_security_verification(doc_name):
+        return bool(split_csv_list(link_csv))
+    return bool(link_csv)
+
+def _pending_count(required_docs, uploaded_map) -> int:
+    return sum(1 for d in required_docs if not _is_uploaded(d["name"], uploaded_map.get(d["id"])))
+
+def _has_active_jobs(job_status: dict) -> bool:
+    return any(j["status"] in ("queued", "in_progress") for jobs in job_status.values() for j in jobs)
+
+
+def _upload_progress_text(job: dict) -> str:
+    """Avance que guarda el worker, p. ej. " — 45% · 1.2 MB/s · 1 reintento(s)"."""
+    total = job.get("bytes_total")
+    if not total:
+        return ""
+    parts = [f"{int(100 * (job.get('bytes_uploaded') or 0) / total)}%"]
+    if job.get("bytes_per_second"):
+        parts.append(f"{format_size(int(job['bytes_per_second']))}/s")
+    if job.get("upload_retries"):
+        parts.append(f"{job['upload_retries']} reintento(s)")
+    return " — " + " · ".join(parts)
+
+
+def _render_job_status(jobs: list[dict]):
+    """Estado de los archivos del documento que siguen en la cola de carga."""
+    for job in jobs:
+        if job["status"] == "queued" and job["attempts"] == 0:
+            st.caption(f"⏳ En cola: {job['file_name']}")
+        elif job["status"] == "queued":
+            st.caption(f"⏳ Reintentando ({job['attempts']}/{job['max_attempts']}): {job['file_name']}")
+        elif job["status"] == "in_progress":
+            st.caption(f"🔄 Subiendo: {job['file_name']}{_upload_progress_text(job)}")
+        else:
+            c1, c2 = st.columns([4, 1])
+            c1.caption(f"⚠️ Falló: {job['file_name']} — {job['last_error'] or 'error desconocido'}")
+            if c2.button("Reintentar", key=f"retry_job_{job['id']}"):
+                with SessionLocal() as session, session.begin():
+                    retry_upload_job(session, job["id"])
+                mark_write()
+                _clear_request_caches()
+                _load_job_status.clear()
+                st.rerun(scope="app")
+
+
+# --------------------
+# Fragments
+# --------------------
+@st.fragment
+def _selectors_fragment():
+    """
+    Compañía / perfil / solicitud. Guarda la selección en session_state y solo
+    relanza la app completa cuando la selección cambia.
+    """
+    selection = _render_selectors()
+    if selection != st.session_state.get(SELECTION_KEY):
+        st.session_state[SELECTION_KEY] = selection
+        st.rerun()
+
+
+def _render_selectors() -> dict | None:
+    # El archivo solo se consulta si se pide explícitamente; va antes de los selectores
+    # porque también habilita compañías que solo tienen solicitudes archivadas
+    include_archived = st.checkbox("Incluir archivadas", key="upload_include_archived")
+    companies = _load_companies(include_archived)
+    company_names = {c["id"]: c["name"] for c in companies}
+    if st.session_state.get("company_selector") not in company_names:
+        # Elegida con el archivo visible y ahora oculto
+        st.session_state.pop("company_selector", None)
+    profiles = _load_profiles()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        company_id = st.selectbox(
+            "Nombre de la compañía",
+            list(company_names),
+            format_func=lambda cid: company_names.get(cid, str(cid)),
+            index=None if companies else None,
+            placeholder="Selecciona la compañía...",
+            key="company_selector"
+        )
+    with col2:
+        profile_name = st.selectbox(
+            "Perfil",
+            profiles,
+            index=None if profiles else None,
+            placeholder="Selecciona el perfil...",
+            key="profile_selector"
+        )
 
-    session = SessionLocal()
+    if not company_id or not profile_name:
+        st.info("Selecciona una compañía y un perfil para continuar.")
+        return None
 
-    try:
-        companies = get_all_company_names(session)
-        profiles = get_profiles_list(session)
-
-        col1, col2 = st.columns(2)
-        with col1:
-            company_name = st.selectbox(
-                "Nombre de la compañía",
-                companies,
-                index=None if companies else None,
-                placeholder="Selecciona la compañía...",
-                key="company_selector"
-            )
-        with col2:
-            profile_name = st.selectbox(
-                "Perfil",
-                profiles,
-                index=None if profiles else None,
-                placeholder="Selecciona el perfil...",
-                key="profile_selector"
-            )
-
-        if not company_name or not profile_name:
-            st.info("Selecciona una compañía y un perfil para continuar.")
-            return
+    # La solicitud elegida (si ya hay una) viaja en la misma consulta que las opciones;
+    # la clave depende de compañía y perfil para que el selector se reinicie al cambiarlos
+    request_key = f"request_selector_{company_id}_{profile_name}"
+    chosen = st.session_state.get(request_key)
+    page_args = (company_id, profile_name, chosen)
+    page = _load_page(*page_args)
 
-        profile_id = get_profile_id_by_name(session, profile_name)
-        if not profile_id:
-            st.error("❌ El perfil seleccionado no existe en la base de datos.")
-            return
+    if not page.profile_id:
+        st.error("❌ El perfil seleccionado no existe en la base de datos.")
+        return None
 
-        # 2) Buscar solicitudes existentes por compañía + perfil
-        requests = get_requests_by_company_and_profile(session, company_name, profile_id)
-        if not requests:
-            st.warning("No hay solicitudes para esta compañía y perfil. Crea primero una solicitud en el formulario de registro.")
-            return
+    archived = {r["id"]: r for r in _load_archived_requests(company_id, page.profile_id)} if include_archived else {}
+
+    labels = {r["id"]: f"ID {r['id']} • {r['created_at'].strftime('%Y-%m-%d %H:%M')}" for r in page.requests}
+    labels.update({
+        rid: f"ID {rid} • {r['created_at'].strftime('%Y-%m-%d %H:%M')} • 🗄️ archivada"
+        for rid, r in archived.items()
+    })
+    if not labels:
+        st.warning("No hay solicitudes para esta compañía y perfil. Crea primero una solicitud en el formulario de registro.")
+        return None
 
-        options = [f"ID {r['id']} • {r['created_at'].strftime('%Y-%m-%d %H:%M')}" for r in requests]
-        idx = 0
-        if len(options) > 1:
-            idx = st.selectbox(
-                "Selecciona la solicitud",
-                list(range(len(options))),
-                format_func=lambda i: options[i],
-                index=None,
-                placeholder="Selecciona una solicitud..."
-            )
-            if idx is None:
-                st.info("Selecciona una solicitud para continuar.")
-                return
-
-        selected_request = requests[idx if len(options) > 1 else 0]
-        request_id = selected_request["id"]
-
-
-        required_docs = get_required_document_types(session, profile_id)
-        uploaded_map = get_uploaded_documents_map(session, request_id)
-
-        st.caption("Sube los documentos. Los ya subidos muestran enlace.")
-        uploaded_buffers = {}
-        pending_count = 0
-
-        for doc in required_docs:
-            doc_id = doc["id"]
-            doc_name = doc["name"]
-            already = uploaded_map.get(doc_id)
-            link_csv = already.get("drive_link") if already else None
-            names_csv = already.get("file_name") if already else ""
-
-            allow_multi = is_security_verification(doc_name)
-
-            if allow_multi:
-                # Mostrar múltiples links si existen (CSV)
-                urls = split_csv_list(link_csv) if link_csv else []
-                names = split_csv_list(names_csv) if names_csv else []
-                if urls:
-                    st.markdown(f"✅ **{doc_name}** — {len(urls)} archivo(s):")
-                    for i, u in enumerate(urls):
-                        label = names[i] if i < len(names) else f"Archivo {i+1}"
-                        st.markdown(f"- [{label}]({u})")
-                else:
-                    st.markdown(f"❌ **{doc_name}** — No cargado")
+    if chosen is not None and chosen not in labels:
+        # Elegida antes con otro filtro (p. ej. una archivada con el archivo oculto)
+        st.session_state.pop(request_key, None)
+
+    if len(labels) > 1:
+        chosen = st.selectbox(
+            "Selecciona la solicitud",
+            list(labels),
+            format_func=lambda rid: labels[rid],
+            index=None,
+            placeholder="Selecciona una solicitud...",
+            key=request_key
+        )
+        if chosen is None:
+            st.info("Selecciona una solicitud para continuar.")
+            return None
+    else:
+        chosen = next(iter(labels))
+
+    selection = {
+        "company_id": company_id,
+        "company_name": company_names[company_id],
+        "profile_name": profile_name,
+        "profile_id": page.profile_id,
+        "request_id": chosen,
+        "archived": chosen in archived,
+        "page_args": page_args,
+    }
+    if selection["archived"]:
+        selection["archived_at"] = archived[chosen]["archived_at"]
+    elif page.request_id != chosen:
+        selection["page_args"] = (company_id, profile_name, chosen)
+    return selection
+
+
+@st.fragment
+def _archived_fragment(selection: dict):
+    """Solicitud archivada: documentos en solo lectura y opción de restaurarla."""
+    request_id = selection["request_id"]
+    st.info(
+        f"🗄️ Solicitud archivada el {selection['archived_at'].strftime('%Y-%m-%d')}. "
+        "Restáurala para cargar documentos o agregar notas."
+    )
+
+    uploaded_map = _load_archived_uploads(request_id)
+    for doc in _page(selection).required_docs:
+        rec = uploaded_map.get(doc["id"])
+        urls = split_csv_list(rec.get("drive_link") if rec else "")
+        names = split_csv_list(rec.get("file_name") if rec else "")
+        if not urls:
+            st.markdown(f"❌ **{doc['name']}** — No cargado")
+            continue
+        links = ", ".join(
+            f"[{names[i] if i < len(names) else f'Archivo {i+1}'}]({u})" for i, u in enumerate(urls)
+        )
+        st.markdown(f"✅ **{doc['name']}** — {links}")
+
+    if st.button("Restaurar solicitud", key=f"btn_restore_{request_id}"):
+        try:
+            with SessionLocal() as session, session.begin():
+                restored = restore_request(session, request_id)
+        except Exception as e:
+            st.error(f"❌ Error al restaurar: {e}")
+            return
+        mark_write()
+        _clear_request_caches()
+        _load_companies.clear()
+        _load_archived_requests.clear()
+        _load_archived_uploads.clear()
+        st.session_state[FLASH_KEY] = "✅ Solicitud restaurada." if restored else "La solicitud ya estaba activa."
+        st.rerun(scope="app")
+
+
+@st.fragment
+def _checklist_fragment(selection: dict):
+    """Lista de documentos con sus uploaders; adjuntar un archivo solo relanza este fragment."""
+    request_id = selection["request_id"]
+    page = _page(selection)
+    required_docs, uploaded_map, job_status = page.required_docs, page.uploaded_map, page.jobs
+    mirror, last_sync_at = page.drive_mirror, page.last_drive_sync_at
+
+    st.caption("Sube los documentos. Los ya subidos muestran enlace.")
+
+    for doc in required_docs:
+        doc_id = doc["id"]
+        doc_name = doc["name"]
+        already = uploaded_map.get(doc_id)
+        link_csv = already.get("drive_link") if already else None
+        names_csv = already.get("file_name") if already else ""
+        uploaded_at = already.get("uploaded_at") if already else None
+
+        allow_multi = is_security_verification(doc_name)
+
+        if allow_multi:
+            # Mostrar múltiples links si existen (CSV)
+            urls = split_csv_list(link_csv) if link_csv else []
+            names = split_csv_list(names_csv) if names_csv else []
+            if urls:
+                st.markdown(f"✅ **{doc_name}** — {len(urls)} archivo(s):")
+                for i, u in enumerate(urls):
+                    label = names[i] if i < len(names) else f"Archivo {i+1}"
+                    st.markdown(f"- [{label}]({u}){drive_status_suffix(u, mirror, last_sync_at, uploaded_at)}")
             else:
-                # Comportamiento normal 1:1
-                if link_csv:
-                    st.markdown(f"✅ **{doc_name}** — [Ver archivo]({link_csv})")
-                    continue
-                else:
-                    req_mark = " (obligatorio)" if doc.get("is_required") else ""
-                    st.markdown(f"❌ **{doc_name}**{req_mark} — No cargado")
-
-            # Uploader (múltiple solo para verificaciones)
-            uploaded_buffers[doc_id] = st.file_uploader(
-                label=f"📁 Subir {doc_name}",
-                type=["pdf"],
-                key=f"uploader_{request_id}_{doc_id}",
-                accept_multiple_files=allow_multi
-            )
-            st.write("")  # espaciado
-
-            # contar pendientes solo si no hay nada aún
-            if allow_multi:
-                urls = split_csv_list(link_csv) if link_csv else []
-                if not urls:
-                    pending_count += 1
+                st.markdown(f"❌ **{doc_name}** — No cargado")
+        else:
+            # Comportamiento normal 1:1
+            if link_csv:
+                st.markdown(f"✅ **{doc_name}** — [Ver archivo]({link_csv}){drive_status_suffix(link_csv, mirror, last_sync_at, uploaded_at)}")
+                _render_job_status(job_status.get(doc_id, []))
+                # Reemplazo: la versión actual queda en el historial
+                with st.expander("Subir nueva versión"):
+                    st.file_uploader(
+                        label=f"📁 Nueva versión de {doc_name}",
+                        type=["pdf"],
+                        key=_uploader_key(request_id, doc_id),
+                    )
+                continue
             else:
-                if not link_csv:
-                    pending_count += 1
+                req_mark = " (obligatorio)" if doc.get("is_required") else ""
+                st.markdown(f"❌ **{doc_name}**{req_mark} — No cargado")
 
-        # --- Seguimiento y comentarios (siempre visibles) ---
-        st.markdown("---")
-        st.subheader("🧭 Seguimiento y comentarios")
+        _render_job_status(job_status.get(doc_id, []))
 
-        meta = get_request_meta(session, request_id) or {}
-        notif_default = (meta.get("notification_followup") or "").strip()
-        comments_default = (meta.get("general_comments") or "").strip()
+        # Uploader (múltiple solo para verificaciones)
+        st.file_uploader(
+            label=f"📁 Subir {doc_name}",
+            type=["pdf"],
+            key=_uploader_key(request_id, doc_id),
+            accept_multiple_files=allow_multi
+        )
+        st.write("")  # espaciado
+
+
+def _zip_entries(zf: zipfile.ZipFile) -> tuple[list[zipfile.ZipInfo], list[str]]:
+    """PDFs del ZIP (sin carpetas ni metadatos de macOS) y nombres de los que exceden el tamaño máximo."""
+    entries, too_big = [], []
+    for info in zf.infolist():
+        base = os.path.basename(info.filename)
+        if info.is_dir() or not base or base.startswith(".") or "__MACOSX" in info.filename:
+            continue
+        if not base.lower().endswith(".pdf"):
+            continue
+        if info.file_size > ZIP_MAX_ENTRY_BYTES:
+            too_big.append(base)
+            continue
+        entries.append(info)
+    return entries, too_big
+
+
+@st.fragment
+def _zip_fragment(selection: dict):
+    """
+    Carga masiva: un ZIP con todos los documentos. Se propone un tipo de documento
+    por archivo según su nombre; lo confirmado se encola en un solo lote. Las
+    entradas se leen del ZIP por bloques al copiarlas a staging, sin descomprimir todo.
+    """
+    request_id = selection["request_id"]
+    gen = st.session_state.get(f"uploader_gen_{request_id}", 0)
+
+    uploaded_zip = st.file_uploader("📦 ZIP con los documentos", type=["zip"], key=f"zip_{request_id}_{gen}")
+    if not uploaded_zip:
+        return
 
-        seguimiento_text = st.text_area(
-            "Seguimiento de notificación",
-            value=notif_default,
-            placeholder="Ej.: 2025-08-20: Enviado correo a contacto@empresa.com\n2025-08-22: Respondieron adjuntando doc. pendiente...",
-            key=f"seguimiento_{request_id}",
-            height=150
+    try:
+        zf = zipfile.ZipFile(uploaded_zip)
+    except zipfile.BadZipFile:
+        st.error("❌ El archivo no es un ZIP válido.")
+        return
+
+    required_docs = _page(selection).required_docs
+    docs_by_id = {d["id"]: d for d in required_docs}
+    entries, too_big = _zip_entries(zf)
+    if too_big:
+        st.warning("Se omiten por tamaño: " + ", ".join(too_big))
+    if not entries:
+        st.info("El ZIP no contiene archivos PDF.")
+        return
+
+    st.caption("Revisa el tipo de documento propuesto para cada archivo. Los marcados como (ignorar) no se cargan.")
+    options = [None] + list(docs_by_id)
+    assigned: dict[int, list[zipfile.ZipInfo]] = {}
+    for i, info in enumerate(entries):
+        doc_id, score = match_document_type(info.filename, required_docs)
+        proposed = doc_id if score >= ZIP_MATCH_THRESHOLD else None
+        c1, c2 = st.columns([2, 3])
+        c1.markdown(f"`{os.path.basename(info.filename)}`")
+        if proposed:
+            c1.caption(f"Coincidencia {score:.0%}")
+        chosen = c2.selectbox(
+            "Tipo de documento",
+            options,
+            index=options.index(proposed),
+            format_func=lambda d: ZIP_IGNORE if d is None else docs_by_id[d]["name"],
+            key=f"zipmap_{request_id}_{gen}_{i}",
+            label_visibility="collapsed",
         )
+        if chosen:
+            assigned.setdefault(chosen, []).append(info)
+
+    # Documentos 1:1 con más de un archivo asignado: hay que elegir uno
+    conflicts = [
+        docs_by_id[d]["name"] for d, infos in assigned.items()
+        if len(infos) > 1 and not is_security_verification(docs_by_id[d]["name"])
+    ]
+    if conflicts:
+        st.error("Estos documentos solo admiten un archivo: " + ", ".join(conflicts))
+
+    total = sum(len(infos) for infos in assigned.values())
+    if st.button(f"Cargar {total} archivo(s) del ZIP", key=f"btn_zip_{request_id}_{gen}", disabled=not total or bool(conflicts)):
+        items = [
+            _pending_item(docs_by_id[d], os.path.basename(info.filename), lambda info=info: zf.open(info))
+            for d, infos in assigned.items()
+            for info in infos
+        ]
+        try:
+            with st.spinner("Preparando archivos..."):
+                queued, _ = _enqueue_uploads(selection, items, "", "")
+        except Exception as e:
+            st.error(f"❌ Error al guardar: {e}")
+            return
 
+        _clear_request_caches()
+        _load_job_status.clear()
+        st.session_state[f"uploader_gen_{request_id}"] = gen + 1
+        st.session_state[FLASH_KEY] = f"✅ {queued} archivo(s) del ZIP en cola de carga."
+        st.rerun(scope="app")
+
+
+@st.fragment(run_every=3)
+def _job_watch_fragment(request_id: int):
+    """
+    Solo se monta mientras hay archivos en cola: consulta el estado cada 3 s y,
+    cuando la cola de la solicitud se vacía, refresca checklist y notas.
+    """
+    # El TTL de 2 s es menor que el intervalo del fragment: cada pasada lee el estado actual
+    job_status = _load_job_status(request_id)
+    if _has_active_jobs(job_status):
+        active = sum(1 for jobs in job_status.values() for j in jobs if j["status"] in ("queued", "in_progress"))
+        st.caption(f"🔄 {active} archivo(s) subiéndose a Drive...")
+        for jobs in job_status.values():
+            for j in jobs:
+                if j["status"] == "in_progress":
+                    st.caption(f"• {j['file_name']}{_upload_progress_text(j)}")
+        return
+    # Las escrituras del worker no pasan por mark_write de este proceso: se registra
+    # lo visto en el primario para que la página no se recargue desde una réplica atrasada
+    mark_write()
+    _clear_request_caches()
+    st.rerun(scope="app")
+
+
+@st.fragment
+def _notes_fragment(selection: dict):
+    """Seguimiento, comentarios y botón de guardado; editar notas solo relanza este fragment."""
+    request_id = selection["request_id"]
+
+    flash = st.session_state.pop(FLASH_KEY, None)
+    if flash:
+        st.success(flash)
+
+    st.subheader("🧭 Seguimiento y comentarios")
+
+    # Cada guardado agrega entradas nuevas a la bitácora; lo ya guardado no se reescribe
+    gen = st.session_state.get(f"notes_gen_{request_id}", 0)
+    page = _page(selection)
+    fetch_notes = _notes_fetcher(page)
+    colN, colC = st.columns(2)
+    with colN:
+        st.markdown("**Seguimiento de notificación**")
+        render_note_log(request_id, "seguimiento", fetch_notes, "upl")
+        seguimiento_text = st.text_area(
+            "Nueva entrada de seguimiento",
+            placeholder="Ej.: Enviado correo a contacto@empresa.com / Respondieron adjuntando doc. pendiente...",
+            key=f"seguimiento_{request_id}_{gen}",
+            height=100
+        )
+    with colC:
+        st.markdown("**Comentarios generales**")
+        render_note_log(request_id, "comentario", fetch_notes, "upl")
         comentarios_text = st.text_area(
-            "Comentarios generales",
-            value=comments_default,
+            "Nuevo comentario",
             placeholder="Observaciones generales de la solicitud / riesgos / acuerdos / notas internas.",
-            key=f"comentarios_{request_id}",
-            height=150
+            key=f"comentarios_{request_id}_{gen}",
+            height=100
         )
 
-        # Botón único: guarda documentos (si hay) y notas SIEMPRE
-        label_btn = "Guardar documentos y notas" if pending_count > 0 else "Guardar notas"
-        if st.button(label_btn, key=f"btn_guardar_integrado_{request_id}"):
-            with st.spinner("Guardando cambios..."):
-                try:
-                    changes = 0
-
-                    # 1) Subir documentos seleccionados (si hay alguno)
-                    any_file_selected = any(bool(uploaded_buffers.get(d["id"])) for d in required_docs)
-                    if any_file_selected:
-                        service = init_drive()
-                        shared_drive_id = st.secrets["drive"].get("shared_drive_id")
-                        parent_folder_id = st.secrets["drive"].get("parent_folder_id")
-
-                        folder_name = f"Solicitud - {company_name} - {profile_name}"
-                        folder_id = find_or_create_folder(
-                            service,
-                            folder_name,
-                            shared_drive_id=shared_drive_id if not parent_folder_id else None,
-                            parent_folder_id=parent_folder_id,
-                        )
-
-                        for doc in required_docs:
-                            doc_id = doc["id"]
-                            doc_name = doc["name"]
-                            files = uploaded_buffers.get(doc_id)
-
-                            if not files:
-                                continue
-
-                            # Normaliza a lista (si no es múltiple, Streamlit retorna UploadedFile)
-                            if not isinstance(files, list):
-                                files = [files]
-
-                            if is_security_verification(doc_name):
-                                # Cargar listas existentes (CSV) si las hubiera
-                                already = uploaded_map.get(doc_id)
-                                existing_links = split_csv_list(already.get("drive_link") if already else "")
-                                existing_names = split_csv_list(already.get("file_name") if already else "")
-
-                                new_links, new_names = [], []
-
-                                for i, file in enumerate(files):
-                                    if file is None:
-                                        continue
-
-                                    safe_name = sanitize_name_for_csv(file.name)
-                                    tmp_path = f"/tmp/{request_id}_{doc_id}_{i}_{safe_name}"
-                                    with open(tmp_path, "wb") as f:
-                                        f.write(file.getbuffer())
-
-                                    drive_link = upload_to_drive(service, folder_id, tmp_path, safe_name)
-
-                                    new_names.append(safe_name)
-                                    new_links.append(drive_link)
-                                    changes += 1
-
-                                    try:
-                                        os.remove(tmp_path)
-                                    except Exception:
-                                        pass
-
-                                # Unir existentes + nuevas en CSV
-                                all_names = existing_names + new_names
-                                all_links = existing_links + new_links
-
-                                upsert_uploaded_document(
-                                    session=session,
-                                    request_id=request_id,
-                                    document_type_id=doc_id,
-                                    file_name=", ".join(all_names),
-                                    drive_link=", ".join(all_links),
-                                    uploaded_by=(getattr(st, "user", None).name if getattr(st, "user", None) else "system")
-                                )
-
-                            else:
-                                # Documentos normales: 1:1 (si suben varios por error, se usará el último upsert)
-                                for i, file in enumerate(files):
-                                    if file is None:
-                                        continue
-
-                                    safe_name = file.name.replace("/", "_").replace("\\", "_")
-                                    tmp_path = f"/tmp/{request_id}_{doc_id}_{i}_{safe_name}"
-                                    with open(tmp_path, "wb") as f:
-                                        f.write(file.getbuffer())
-
-                                    drive_link = upload_to_drive(service, folder_id, tmp_path, safe_name)
-
-                                    upsert_uploaded_document(
-                                        session=session,
-                                        request_id=request_id,
-                                        document_type_id=doc_id,
-                                        file_name=safe_name,
-                                        drive_link=drive_link,
-                                        uploaded_by=(getattr(st, "user", None).name if getattr(st, "user", None) else "system")
-                                    )
-                                    changes += 1
-
-                                    try:
-                                        os.remove(tmp_path)
-                                    except Exception:
-                                        pass
-
-                    # 2) Guardar seguimiento y comentarios SIEMPRE
-                    update_request_meta(session, request_id, seguimiento_text, comentarios_text)
-
-                    session.commit()
-
-                    if changes:
-                        st.success(f"✅ {changes} documento(s) cargado(s)/actualizado(s) y notas guardadas.")
-                    else:
-                        st.success("✅ Notas guardadas.")
-
-                except Exception as e:
-                    session.rollback()
-                    st.error(f"❌ Error al guardar: {e}")
-
-        # Mensaje informativo si no hay pendientes
-        if pending_count == 0:
-            st.info("No hay documentos pendientes por subir. Puedes actualizar las notas y guardarlas.")
+    required_docs = page.required_docs
+    pending_count = _pending_count(required_docs, page.uploaded_map)
+
+    # Botón único: guarda documentos (si hay) y las entradas nuevas (si hay)
+    label_btn = "Guardar documentos y notas" if pending_count > 0 else "Guardar notas"
+    if st.button(label_btn, key=f"btn_guardar_integrado_{request_id}"):
+        with st.spinner("Guardando cambios..."):
+            saved = _save(selection, required_docs, seguimiento_text, comentarios_text)
+        if saved:
+            # Refresca checklist y notas con el estado ya persistido
+            st.rerun(scope="app")
+
+    # Mensaje informativo si no hay pendientes
+    if pending_count == 0:
+        st.info("No hay documentos pendientes por subir. Puedes agregar notas y guardarlas.")
+
 
+def _current_user_name() -> str:
+    return getattr(st, "user", None).name if getattr(st, "user", None) else "system"
+
+
+def _collect_pending_files(request_id: int, required_docs) -> list[dict]:
+    items = []
+    for doc in required_docs:
+        files = st.session_state.get(_uploader_key(request_id, doc["id"]))
+        if not files:
+            continue
+
+        # Normaliza a lista (si no es múltiple, Streamlit retorna UploadedFile)
+        if not isinstance(files, list):
+            files = [files]
+        files = [f for f in files if f is not None]
+
+        multi = is_security_verification(doc["name"])
+        if not multi:
+            # Documentos normales: 1:1 (si suben varios por error, se usa el último)
+            files = files[-1:]
+        for file in files:
+            items.append(_pending_item(doc, file.name, lambda f=file: _rewound(f)))
+    return items
+
+
+def _rewound(file):
+    file.seek(0)
+    return file
+
+
+def _pending_item(doc: dict, file_name: str, open_fn) -> dict:
+    """open_fn() devuelve un flujo binario con el contenido; se lee una sola vez al copiarlo a staging."""
+    multi = is_security_verification(doc["name"])
+    if multi:
+        safe_name = sanitize_name_for_csv(file_name)
+    else:
+        safe_name = file_name.replace("/", "_").replace("\\", "_")
+    return {"doc_id": doc["id"], "multi": multi, "open": open_fn, "safe_name": safe_name}
+
+
+def _stage_file(open_fn) -> str:
+    """Copia el archivo por bloques al área de staging compartida con el worker de cargas."""
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    path = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+    src = open_fn()
+    try:
+        with open(path, "wb") as f:
+            shutil.copyfileobj(src, f)
     finally:
-        session.close()
+        # Las entradas de un ZIP se cierran aquí; el UploadedFile lo gestiona Streamlit
+        if isinstance(src, zipfile.ZipExtFile):
+            src.close()
+    return path
+
+
+def _enqueue_uploads(selection: dict, items: list[dict], seguimiento_text: str, comentarios_text: str) -> tuple[int, int]:
+    """
+    Deja los archivos en staging y, en una transacción corta, encola un trabajo
+    por archivo y agrega las notas. La subida a Drive la hace workers/upload_worker.py.
+    Devuelve (archivos encolados, notas agregadas).
+    """
+    request_id = selection["request_id"]
+    uploaded_by = _current_user_name()
+    folder_name = f"Solicitud - {selection['company_name']} - {selection['profile_name']}"
+
+    staged = []
+    try:
+        for it in items:
+            staged.append((it, _stage_file(it["open"])))
+
+        with SessionLocal() as session, session.begin():
+            for it, path in staged:
+                enqueue_upload_job(
+                    session,
+                    request_id=request_id,
+                    document_type_id=it["doc_id"],
+                    multi=it["multi"],
+                    file_name=it["safe_name"],
+                    staging_path=path,
+                    folder_name=folder_name,
+                    uploaded_by=uploaded_by
+                )
+
+            # Solo se escriben las entradas nuevas (vacías o repetidas se omiten)
+            notes_added = sum([
+                append_request_note(session, request_id, "seguimiento", seguimiento_text, uploaded_by),
+                append_request_note(session, request_id, "comentario", comentarios_text, uploaded_by),
+            ])
+    except Exception:
+        # Sin trabajos en la DB, las copias en staging no las recogería nadie
+        for _, path in staged:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+    if staged or notes_added:
+        mark_write()
+    return len(staged), notes_added
+
+
+def _save(selection: dict, required_docs, seguimiento_text: str, comentarios_text: str) -> bool:
+    request_id = selection["request_id"]
+
+    try:
+        # Los archivos viven en el estado de los uploaders del fragment de checklist
+        items = _collect_pending_files(request_id, required_docs)
+        queued, notes_added = _enqueue_uploads(selection, items, seguimiento_text, comentarios_text)
+    except Exception as e:
+        st.error(f"❌ Error al guardar: {e}")
+        return False
+
+    _clear_request_caches()
+    _load_job_status.clear()
+
+    # Persistido: se vacían los uploaders y las notas
+    st.session_state[f"uploader_gen_{request_id}"] = st.session_state.get(f"uploader_gen_{request_id}", 0) + 1
+    st.session_state[f"notes_gen_{request_id}"] = st.session_state.get(f"notes_gen_{request_id}", 0) + 1
+    if queued and notes_added:
+        st.session_state[FLASH_KEY] = f"✅ {queued} archivo(s) en cola de carga y notas guardadas."
+    elif queued:
+        st.session_state[FLASH_KEY] = f"✅ {queued} archivo(s) en cola de carga."
+    elif notes_added:
+        st.session_state[FLASH_KEY] = "✅ Notas guardadas."
+    else:
+        st.session_state[FLASH_KEY] = "Sin cambios para guardar."
+    return True
+
+
+def forms():
+    st.subheader("📎 Carga de documentos")
+
+    _selectors_fragment()
+
+    selection = st.session_state.get(SELECTION_KEY)
+    if not selection:
+        return
+
+    if selection.get("archived"):
+        _archived_fragment(selection)
+        return
+
+    with st.expander("📦 Carga masiva desde ZIP"):
+        _zip_fragment(selection)
+
+    _checklist_fragment(selection)
+
+    if _has_active_jobs(_page(selection).jobs):
+        _job_watch_fragment(selection["request_id"])
+
+    # --- Seguimiento y comentarios (siempre visibles) ---
+    st.markdown("---")
+    _notes_fragment(selection)
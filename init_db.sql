@@ -46,7 +46,7 @@ CREATE TABLE uploaded_documents (
 -- Insertar perfiles base
 INSERT INTO profiles (name) VALUES
   ('cliente'),
-  ('proveedor'),
+  ('proveedor');
 
 -- =============================
 -- DOCUMENTOS PARA PERFIL CLIENTE
@@ -99,4 +99,312 @@ INSERT INTO document_types (profile_id, name) VALUES
 ((SELECT id FROM profiles WHERE name = 'proveedor'), 'Documentos de limpieza y desinfección'),
 ((SELECT id FROM profiles WHERE name = 'proveedor'), 'Plan de contingencia'),
 ((SELECT id FROM profiles WHERE name = 'proveedor'), 'Póliza de Responsabilidad Civil'),
-((SELECT id FROM profiles WHERE name = 'proveedor'), 'Certificación BASC')
+((SELECT id FROM profiles WHERE name = 'proveedor'), 'Certificación BASC');
+
+-- =============================
+-- ESPEJO LOCAL DE METADATOS DE DRIVE (workers/drive_sync.py)
+-- =============================
+CREATE TABLE IF NOT EXISTS drive_files (
+    file_id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    name TEXT,
+    size_bytes BIGINT,
+    trashed BOOLEAN NOT NULL DEFAULT FALSE,
+    modified_time TIMESTAMPTZ,
+    synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_drive_files_parent ON drive_files(parent_id);
+
+-- Page token del feed changes.list por unidad compartida
+CREATE TABLE IF NOT EXISTS drive_sync_state (
+    drive_id TEXT PRIMARY KEY,
+    page_token TEXT NOT NULL,
+    last_synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- =============================
+-- MARCAS DE MODIFICACIÓN (ETag / Last-Modified del API)
+-- =============================
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_clients_requests_updated_at ON clients_requests(updated_at);
+CREATE INDEX IF NOT EXISTS idx_clients_requests_company_created ON clients_requests(company_name, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_uploaded_documents_uploaded_at ON uploaded_documents(uploaded_at);
+
+-- =============================
+-- BÚSQUEDA DE TEXTO COMPLETO (español, sin tildes)
+-- =============================
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END $$;
+
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS notification_followup TEXT;
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS general_comments TEXT;
+
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('es_unaccent', coalesce(company_name, '')), 'A') ||
+        setweight(to_tsvector('es_unaccent', coalesce(notification_followup, '')), 'B') ||
+        setweight(to_tsvector('es_unaccent', coalesce(general_comments, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_clients_requests_search ON clients_requests USING GIN (search_tsv);
+
+-- Nombres de archivo: separadores (_ . -) como espacios para indexar cada palabra
+ALTER TABLE uploaded_documents ADD COLUMN IF NOT EXISTS search_tsv tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('es_unaccent', regexp_replace(coalesce(file_name, ''), '[_.\-]+', ' ', 'g')), 'C')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_uploaded_documents_search ON uploaded_documents USING GIN (search_tsv);
+
+-- =============================
+-- BITÁCORA DE SEGUIMIENTO Y COMENTARIOS (solo inserciones)
+-- =============================
+CREATE TABLE IF NOT EXISTS request_notes (
+    id BIGSERIAL PRIMARY KEY,
+    request_id INTEGER NOT NULL REFERENCES clients_requests(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL CHECK (kind IN ('seguimiento', 'comentario')),
+    author TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    body TEXT NOT NULL,
+    body_hash TEXT NOT NULL,
+    search_tsv tsvector GENERATED ALWAYS AS (setweight(to_tsvector('es_unaccent', body), 'B')) STORED
+);
+
+CREATE INDEX IF NOT EXISTS idx_request_notes_request_time ON request_notes(request_id, kind, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_request_notes_search ON request_notes USING GIN (search_tsv);
+
+-- Migración: cada texto existente pasa a ser la primera entrada de su bitácora
+INSERT INTO request_notes (request_id, kind, author, created_at, body, body_hash)
+SELECT cr.id, 'seguimiento', 'histórico', COALESCE(cr.updated_at, cr.created_at),
+       TRIM(cr.notification_followup), encode(sha256(convert_to(TRIM(cr.notification_followup), 'UTF8')), 'hex')
+FROM clients_requests cr
+WHERE COALESCE(TRIM(cr.notification_followup), '') <> ''
+  AND NOT EXISTS (SELECT 1 FROM request_notes n WHERE n.request_id = cr.id AND n.kind = 'seguimiento');
+
+INSERT INTO request_notes (request_id, kind, author, created_at, body, body_hash)
+SELECT cr.id, 'comentario', 'histórico', COALESCE(cr.updated_at, cr.created_at),
+       TRIM(cr.general_comments), encode(sha256(convert_to(TRIM(cr.general_comments), 'UTF8')), 'hex')
+FROM clients_requests cr
+WHERE COALESCE(TRIM(cr.general_comments), '') <> ''
+  AND NOT EXISTS (SELECT 1 FROM request_notes n WHERE n.request_id = cr.id AND n.kind = 'comentario');
+
+-- =============================
+-- COMPAÑÍAS CANÓNICAS
+-- =============================
+-- normalized_key = nombre sin tildes, en minúsculas y solo [a-z0-9]
+-- ("ACME S.A.S." y "Acme SAS" -> "acmesas"); misma regla que company_key() en ui/helpers.py
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS companies (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    normalized_key TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_companies_key_trgm ON companies USING GIN (normalized_key gin_trgm_ops);
+
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS company_id INTEGER REFERENCES companies(id);
+CREATE INDEX IF NOT EXISTS idx_clients_requests_company_profile ON clients_requests(company_id, profile_id, created_at DESC);
+
+-- Migración: una compañía por clave normalizada (se conserva el nombre más antiguo)
+INSERT INTO companies (name, normalized_key)
+SELECT DISTINCT ON (k) company_name, k
+FROM (
+    SELECT company_name, created_at,
+           regexp_replace(lower(unaccent(company_name)), '[^a-z0-9]', '', 'g') AS k
+    FROM clients_requests
+) s
+WHERE k <> ''
+ORDER BY k, created_at
+ON CONFLICT (normalized_key) DO NOTHING;
+
+UPDATE clients_requests cr
+SET company_id = c.id
+FROM companies c
+WHERE cr.company_id IS NULL
+  AND c.normalized_key = regexp_replace(lower(unaccent(cr.company_name)), '[^a-z0-9]', '', 'g');
+
+-- =============================
+-- HISTORIAL DE VERSIONES DE DOCUMENTOS (particionado por mes)
+-- =============================
+-- uploaded_documents es la versión vigente (tabla pequeña que lee la UI);
+-- cada carga queda además como fila inmutable aquí. Sin FK a clients_requests:
+-- el historial debe conservarse aunque la solicitud se archive o elimine.
+-- Para sacar meses antiguos del conjunto activo:
+--   ALTER TABLE uploaded_document_versions DETACH PARTITION uploaded_document_versions_2024_01;
+CREATE TABLE IF NOT EXISTS uploaded_document_versions (
+    id BIGSERIAL,
+    request_id INTEGER NOT NULL,
+    document_type_id INTEGER NOT NULL,
+    file_name TEXT,
+    drive_link TEXT,
+    uploaded_by TEXT,
+    uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, uploaded_at)
+) PARTITION BY RANGE (uploaded_at);
+
+CREATE INDEX IF NOT EXISTS idx_doc_versions_request_type
+    ON uploaded_document_versions(request_id, document_type_id, uploaded_at DESC);
+
+-- Crea (si falta) la partición mensual que contiene ts
+CREATE OR REPLACE FUNCTION ensure_document_versions_partition(ts TIMESTAMP) RETURNS void AS $$
+DECLARE
+    start_month DATE := date_trunc('month', ts)::date;
+    part_name TEXT := 'uploaded_document_versions_' || to_char(start_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part_name) IS NULL THEN
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF uploaded_document_versions FOR VALUES FROM (%L) TO (%L)',
+                part_name, start_month, (start_month + INTERVAL '1 month')::date
+            );
+        EXCEPTION WHEN duplicate_table THEN
+            NULL; -- otra sesión la creó al mismo tiempo
+        END;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Migración: la versión vigente de cada documento es su primera versión registrada
+SELECT ensure_document_versions_partition(CAST(CURRENT_TIMESTAMP AS TIMESTAMP));
+SELECT ensure_document_versions_partition(m)
+FROM (SELECT DISTINCT date_trunc('month', uploaded_at) AS m FROM uploaded_documents WHERE uploaded_at IS NOT NULL) s;
+
+INSERT INTO uploaded_document_versions (request_id, document_type_id, file_name, drive_link, uploaded_by, uploaded_at)
+SELECT ud.request_id, ud.document_type_id, ud.file_name, ud.drive_link, ud.uploaded_by, ud.uploaded_at
+FROM uploaded_documents ud
+WHERE ud.uploaded_at IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM uploaded_document_versions v
+      WHERE v.request_id = ud.request_id AND v.document_type_id = ud.document_type_id
+  );
+
+-- =============================
+-- ANALÍTICA DE ONBOARDING (rollups diarios incrementales)
+-- =============================
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS requested_by TEXT;
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS requested_by_type TEXT;
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS first_upload_at TIMESTAMP;
+ALTER TABLE clients_requests ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_clients_requests_created_at ON clients_requests(created_at);
+CREATE INDEX IF NOT EXISTS idx_clients_requests_first_upload_at ON clients_requests(first_upload_at);
+CREATE INDEX IF NOT EXISTS idx_clients_requests_completed_at ON clients_requests(completed_at);
+
+-- Una fila por día y dimensión (trading, comercial/solicitante, perfil)
+CREATE TABLE IF NOT EXISTS onboarding_daily_rollup (
+    day DATE NOT NULL,
+    trading TEXT NOT NULL DEFAULT '',
+    requested_by TEXT NOT NULL DEFAULT '',
+    profile_id INTEGER NOT NULL,
+    created_count INTEGER NOT NULL DEFAULT 0,
+    first_upload_count INTEGER NOT NULL DEFAULT 0,
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    hours_to_first_upload_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    hours_to_completion_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, trading, requested_by, profile_id)
+);
+
+-- Marca de agua de cada refresco incremental
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL
+);
+
+-- Migración: primera carga desde el historial y completitud actual
+UPDATE clients_requests cr
+SET first_upload_at = s.first_at
+FROM (
+    SELECT request_id, MIN(uploaded_at) AS first_at
+    FROM uploaded_document_versions
+    GROUP BY request_id
+) s
+WHERE s.request_id = cr.id AND cr.first_upload_at IS NULL;
+
+UPDATE clients_requests cr
+SET completed_at = s.last_at
+FROM (
+    SELECT ud.request_id, MAX(ud.uploaded_at) AS last_at
+    FROM uploaded_documents ud
+    JOIN document_types dt ON dt.id = ud.document_type_id AND dt.is_required
+    GROUP BY ud.request_id
+) s
+WHERE s.request_id = cr.id
+  AND cr.completed_at IS NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM document_types dt
+      LEFT JOIN uploaded_documents ud ON ud.request_id = cr.id AND ud.document_type_id = dt.id
+      WHERE dt.profile_id = cr.profile_id AND dt.is_required
+        AND COALESCE(TRIM(ud.drive_link), '') = ''
+  );
+
+-- =============================
+-- COLA DE CARGAS A DRIVE (workers/upload_worker.py)
+-- =============================
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    request_id INTEGER NOT NULL REFERENCES clients_requests(id) ON DELETE CASCADE,
+    document_type_id INTEGER NOT NULL REFERENCES document_types(id),
+    multi BOOLEAN NOT NULL DEFAULT FALSE,        -- documento con varios archivos (CSV)
+    file_name TEXT NOT NULL,
+    staging_path TEXT NOT NULL,                  -- copia local del archivo hasta subirlo
+    folder_name TEXT NOT NULL,                   -- carpeta destino en Drive
+    uploaded_by TEXT,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'in_progress', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,                      -- lease del worker; vencido => se reclama
+    drive_link TEXT,                             -- fijado apenas el archivo llega a Drive
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_ready ON upload_jobs(run_after, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_leased ON upload_jobs(locked_until) WHERE status = 'in_progress';
+CREATE INDEX IF NOT EXISTS idx_upload_jobs_request ON upload_jobs(request_id, document_type_id, created_at);
+
+-- =============================
+-- ARCHIVO DE SOLICITUDES (workers/archive_requests.py)
+-- =============================
+-- Solicitudes completadas o inactivas hace tiempo salen de las tablas activas.
+-- Mismas columnas (sin search_tsv generado ni FKs) + archived_at. Si se agrega
+-- una columna a la tabla activa, agregarla también aquí: database/crud/archive.py
+-- copia las columnas que existen en ambas (leídas de information_schema).
+CREATE TABLE IF NOT EXISTS clients_requests_archive (LIKE clients_requests);
+ALTER TABLE clients_requests_archive DROP COLUMN IF EXISTS search_tsv;
+ALTER TABLE clients_requests_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_requests_archive_id ON clients_requests_archive(id);
+CREATE INDEX IF NOT EXISTS idx_clients_requests_archive_company_profile
+    ON clients_requests_archive(company_id, profile_id, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS uploaded_documents_archive (LIKE uploaded_documents);
+ALTER TABLE uploaded_documents_archive DROP COLUMN IF EXISTS search_tsv;
+CREATE INDEX IF NOT EXISTS idx_uploaded_documents_archive_request ON uploaded_documents_archive(request_id);
+
+CREATE TABLE IF NOT EXISTS request_notes_archive (LIKE request_notes);
+ALTER TABLE request_notes_archive DROP COLUMN IF EXISTS search_tsv;
+CREATE INDEX IF NOT EXISTS idx_request_notes_archive_request_time
+    ON request_notes_archive(request_id, kind, created_at DESC, id DESC);
+
+-- Candidatas: completadas hace tiempo o sin actividad
+CREATE INDEX IF NOT EXISTS idx_clients_requests_last_activity
+    ON clients_requests (GREATEST(created_at, COALESCE(updated_at, created_at)));
+
+-- Progreso de la carga reanudable (upload_to_drive): sesión, bytes confirmados y métricas
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS resumable_uri TEXT;
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS bytes_uploaded BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS bytes_total BIGINT;
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS upload_retries INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS bytes_per_second DOUBLE PRECISION;
+
+-- Archivos de staging de trabajos fallidos ya eliminados por workers/upload_worker.py
+ALTER TABLE upload_jobs ADD COLUMN IF NOT EXISTS staging_removed_at TIMESTAMP;
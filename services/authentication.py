@@ -1,5 +1,19 @@
 import streamlit as st
 
+
+# --- Roles ---
+def identity_role(email: str | None) -> str:
+
+    if not email:
+        return "other"
+
+    usernames = {"compliance", "compliance1", "compliance2", "sjaafar"}
+    domains = {"@tradingsolutions.com", "@tradingsol.com"}
+
+    allowed_emails = {u + d for u in usernames for d in domains}
+    return "compliance" if email.lower() in allowed_emails else "other"
+
+
 def check_authentication():
     if "authenticated" not in st.session_state:
         st.session_state.authenticated = False
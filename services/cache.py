@@ -0,0 +1,354 @@
+# services/cache.py
+"""
+Caché compartida entre réplicas de la app, workers y API.
+
+Dos backends:
+    LocalBackend   LRU en memoria del proceso, con TTL y tope de entradas.
+    RedisBackend   Redis (o compatible); se usa si CACHE_URL=redis://... está
+                   definido y el paquete redis está instalado. El tope de tamaño
+                   lo pone el servidor (maxmemory + volatile-lru, ver docker-compose).
+                   Los valores se guardan como JSON (nunca pickle: quien pudiera
+                   escribir en Redis ejecutaría código en la app) y, si Redis no
+                   responde, se deja de consultar por CACHE_BREAKER_SECONDS.
+
+Las claves viven en namespaces versionados ("reference", "drive_folders", ...):
+invalidate(namespace) sube la versión, con lo que todas las entradas anteriores
+dejan de leerse y caducan solas. Con Redis el cambio de versión se difunde por
+pub/sub a todas las réplicas.
+
+Lo que no se puede serializar a JSON (handles de gspread, clientes) se guarda
+con local=True: siempre en la memoria del proceso. Las tuplas vuelven como listas.
+
+Uso:
+    cache = get_cache()
+    folder_id = cache.get_or_set("drive_folders", name, lambda: crear(...), ttl=86400)
+
+    @cached("reference", ttl=3600)
+    def _load_profiles(): ...
+
+    python -m services.cache --invalidate reference   # tras editar perfiles/tipos de documento
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+
+try:
+    import redis
+except ImportError:  # backend opcional
+    redis = None
+
+log = logging.getLogger("cache")
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+# Sin TTL explícito las entradas igual caducan: en Redis solo se desalojan claves con TTL
+CACHE_DEFAULT_TTL_SECONDS = int(os.getenv("CACHE_DEFAULT_TTL_SECONDS", "86400"))
+KEY_PREFIX = "compliance:cache"
+INVALIDATION_CHANNEL = f"{KEY_PREFIX}:invalidate"
+# Las versiones leídas de Redis se revalidan cada tanto por si se perdió un mensaje
+VERSION_REFRESH_SECONDS = 30
+# Tras un fallo de Redis la caché compartida se omite este tiempo (cada intento
+# cuesta hasta socket_timeout y la página no debe esperarlo en cada lectura)
+CACHE_BREAKER_SECONDS = int(os.getenv("CACHE_BREAKER_SECONDS", "30"))
+
+
+def _cache_url() -> str | None:
+    try:
+        import streamlit as st
+        return st.secrets["CACHE_URL"]
+    except Exception:
+        return os.getenv("CACHE_URL")
+
+
+class BackendUnavailable(Exception):
+    """El backend compartido está en pausa tras un fallo reciente."""
+
+
+def _encode(o):
+    # Tipos que devuelven las consultas y JSON no conoce
+    if isinstance(o, datetime):
+        return {"__datetime__": o.isoformat()}
+    if isinstance(o, date):
+        return {"__date__": o.isoformat()}
+    if isinstance(o, Decimal):
+        return {"__decimal__": str(o)}
+    raise TypeError(f"No serializable en la caché compartida: {type(o).__name__}")
+
+
+def _decode(d: dict):
+    if len(d) == 1:
+        (tag, value), = d.items()
+        if tag == "__datetime__":
+            return datetime.fromisoformat(value)
+        if tag == "__date__":
+            return date.fromisoformat(value)
+        if tag == "__decimal__":
+            return Decimal(value)
+    return d
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=_encode, ensure_ascii=False).encode("utf-8")
+
+
+def loads(raw: bytes):
+    return json.loads(raw, object_hook=_decode)
+
+
+class LocalBackend:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float | None, object]] = OrderedDict()
+        self._versions: Counter = Counter()
+
+    def get(self, key: str):
+        """(True, valor) si está vigente; (False, None) si no."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value, ttl: float | None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def version(self, namespace: str) -> int:
+        with self._lock:
+            return self._versions[namespace]
+
+    def bump_version(self, namespace: str) -> int:
+        with self._lock:
+            self._versions[namespace] += 1
+            return self._versions[namespace]
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        # namespace -> (versión, leída en)
+        self._versions: dict[str, tuple[int, float]] = {}
+        threading.Thread(target=self._listen, name="cache-invalidations", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    namespace, version = message["data"].decode().rsplit(":", 1)
+                    with self._lock:
+                        self._versions[namespace] = (int(version), time.monotonic())
+            except Exception:
+                log.warning("Se perdió la suscripción a invalidaciones de caché; se reintenta", exc_info=True)
+                # Mientras no hubo suscripción pudieron perderse invalidaciones
+                with self._lock:
+                    self._versions.clear()
+                time.sleep(5)
+
+    def _call(self, method: str, *args, **kwargs):
+        """Comando a Redis con cortocircuito: tras un fallo no se intenta hasta que pase la pausa."""
+        if time.monotonic() < self._down_until:
+            raise BackendUnavailable()
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except redis.RedisError:
+            self._down_until = time.monotonic() + CACHE_BREAKER_SECONDS
+            raise
+
+    def get(self, key: str):
+        raw = self._call("get", key)
+        if raw is None:
+            return False, None
+        return True, loads(raw)
+
+    def set(self, key: str, value, ttl: float | None):
+        self._call("set", key, dumps(value), ex=int(ttl or CACHE_DEFAULT_TTL_SECONDS))
+
+    def delete(self, key: str):
+        self._call("delete", key)
+
+    def version(self, namespace: str) -> int:
+        with self._lock:
+            cached = self._versions.get(namespace)
+        if cached and time.monotonic() - cached[1] < VERSION_REFRESH_SECONDS:
+            return cached[0]
+        # Las claves de versión no tienen TTL: volatile-lru nunca las desaloja
+        version = int(self._call("get", f"{KEY_PREFIX}:version:{namespace}") or 0)
+        with self._lock:
+            self._versions[namespace] = (version, time.monotonic())
+        return version
+
+    def bump_version(self, namespace: str) -> int:
+        version = self.client.incr(f"{KEY_PREFIX}:version:{namespace}")
+        with self._lock:
+            self._versions[namespace] = (version, time.monotonic())
+        self.client.publish(INVALIDATION_CHANNEL, f"{namespace}:{version}")
+        return version
+
+
+class Cache:
+    def __init__(self, shared, local: LocalBackend):
+        self.shared = shared
+        self.local = local
+        self._stats_lock = threading.Lock()
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._errors = 0
+
+    def _backend(self, local: bool):
+        return self.local if local else self.shared
+
+    def _full_key(self, backend, namespace: str, key) -> str:
+        return f"{KEY_PREFIX}:{namespace}:v{backend.version(namespace)}:{key}"
+
+    def _count(self, stat_key: str, hit: bool):
+        with self._stats_lock:
+            (self._hits if hit else self._misses)[stat_key] += 1
+
+    def get(self, namespace: str, key, *, local: bool = False, label: str | None = None):
+        """
+        (True, valor) o (False, None). Las estadísticas se agrupan por namespace
+        y label (p. ej. la función cacheada), nunca por clave: las claves pueden
+        ser ilimitadas.
+        """
+        backend = self._backend(local)
+        try:
+            found, value = backend.get(self._full_key(backend, namespace, key))
+        except BackendUnavailable:
+            found, value = False, None
+        except Exception:
+            # La caché nunca debe tumbar la página: un backend caído cuenta como fallo
+            log.warning("Caché no disponible leyendo %s:%s", namespace, key, exc_info=True)
+            with self._stats_lock:
+                self._errors += 1
+            found, value = False, None
+        self._count(f"{namespace}:{label}" if label else namespace, found)
+        return found, value
+
+    def set(self, namespace: str, key, value, *, ttl: float | None = None, local: bool = False):
+        backend = self._backend(local)
+        try:
+            backend.set(self._full_key(backend, namespace, key), value, ttl)
+        except BackendUnavailable:
+            pass
+        except Exception:
+            log.warning("Caché no disponible escribiendo %s:%s", namespace, key, exc_info=True)
+            with self._stats_lock:
+                self._errors += 1
+
+    def get_or_set(self, namespace: str, key, loader, *, ttl: float | None = None, local: bool = False,
+                   label: str | None = None):
+        found, value = self.get(namespace, key, local=local, label=label)
+        if found:
+            return value
+        value = loader()
+        self.set(namespace, key, value, ttl=ttl, local=local)
+        return value
+
+    def delete(self, namespace: str, key, *, local: bool = False):
+        backend = self._backend(local)
+        try:
+            backend.delete(self._full_key(backend, namespace, key))
+        except BackendUnavailable:
+            pass
+        except Exception:
+            log.warning("Caché no disponible borrando %s:%s", namespace, key, exc_info=True)
+
+    def invalidate(self, namespace: str):
+        """Descarta todo el namespace en todas las réplicas (y en la memoria local)."""
+        self.local.bump_version(namespace)
+        if self.shared is not self.local:
+            self.shared.bump_version(namespace)
+
+    def stats(self) -> dict:
+        """Aciertos/fallos por namespace (y label) de este proceso."""
+        with self._stats_lock:
+            keys = set(self._hits) | set(self._misses)
+            per_key = {k: {"hits": self._hits[k], "misses": self._misses[k]} for k in sorted(keys)}
+            return {
+                "backend": type(self.shared).__name__,
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "errors": self._errors,
+                "keys": per_key,
+            }
+
+
+_cache_lock = threading.Lock()
+_cache: Cache | None = None
+
+
+def get_cache() -> Cache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            local = LocalBackend()
+            shared = local
+            url = _cache_url()
+            if url:
+                if redis is None:
+                    log.warning("CACHE_URL definido pero el paquete redis no está instalado; se usa caché local")
+                else:
+                    shared = RedisBackend(url)
+            _cache = Cache(shared, local)
+        return _cache
+
+
+def cached(namespace: str, *, ttl: float | None = None, local: bool = False):
+    """Decorador: cachea el resultado por argumentos (repr) dentro del namespace."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            label = f"{fn.__module__}.{fn.__qualname__}"
+            key = f"{label}{args!r}{sorted(kwargs.items())!r}"
+            return get_cache().get_or_set(namespace, key, lambda: fn(*args, **kwargs), ttl=ttl, local=local,
+                                          label=label)
+        return wrapper
+    return decorator
+
+
+def format_cache_stats() -> str:
+    s = get_cache().stats()
+    total = s["hits"] + s["misses"]
+    ratio = s["hits"] / total * 100 if total else 0.0
+    return f"{s['backend']}: {s['hits']} aciertos, {s['misses']} fallos ({ratio:.0f}% aciertos), {s['errors']} errores"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Operaciones sobre la caché compartida.")
+    parser.add_argument("--invalidate", action="append", default=[], metavar="NAMESPACE",
+                        help="Invalida el namespace en todas las réplicas (se puede repetir).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    for namespace in args.invalidate:
+        get_cache().invalidate(namespace)
+        log.info("Namespace invalidado: %s", namespace)
+
+
+if __name__ == "__main__":
+    main()
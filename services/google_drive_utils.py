@@ -1,12 +1,30 @@
 # services/google_drive_utils.py
 
+import re
+import json
+import ssl
+import mimetypes
+import time
+import socket
+from dataclasses import dataclass, field
+import httplib2
 import streamlit as st
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
 
+from services.rate_limit import backoff_delay, execute, get_bucket, is_rate_limited
+
 DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+DRIVE_FILE_FIELDS = "id, name, parents, size, trashed, modifiedTime"
+
+# Cargas por bloques (múltiplo de 256 KB) y reintentos consecutivos permitidos por bloque
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_RETRIES = 8
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_FILE_ID_RE = re.compile(r"/d/([A-Za-z0-9_-]+)|[?&]id=([A-Za-z0-9_-]+)")
 
 def init_drive():
     sa_info = dict(st.secrets['google_drive_credentials'])
@@ -28,14 +46,14 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
                 f"trashed = false and "
                 f"'{parent_folder_id}' in parents"
             )
-            res = service.files().list(
+            res = execute("drive_query", service.files().list(
                 q=query,
                 corpora="allDrives",
                 includeItemsFromAllDrives=True,
                 supportsAllDrives=True,
                 fields="files(id, name)",
                 pageSize=10,
-            ).execute()
+            ))
             files = res.get("files", [])
             if files:
                 return files[0]["id"]
@@ -45,11 +63,11 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
                 "mimeType": "application/vnd.google-apps.folder",
                 "parents": [parent_folder_id],
             }
-            folder = service.files().create(
+            folder = execute("drive_write", service.files().create(
                 body=metadata,
                 supportsAllDrives=True,
                 fields="id"
-            ).execute()
+            ))
             return folder["id"]
 
         if shared_drive_id:
@@ -59,7 +77,7 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
                 f"mimeType = 'application/vnd.google-apps.folder' and "
                 f"trashed = false"
             )
-            res = service.files().list(
+            res = execute("drive_query", service.files().list(
                 q=query,
                 corpora="drive",
                 driveId=shared_drive_id,
@@ -67,7 +85,7 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
                 supportsAllDrives=True,
                 fields="files(id, name)",
                 pageSize=10,
-            ).execute()
+            ))
             files = res.get("files", [])
             if files:
                 return files[0]["id"]
@@ -77,11 +95,11 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
                 "mimeType": "application/vnd.google-apps.folder",
                 "parents": [shared_drive_id],  # raíz de la unidad
             }
-            folder = service.files().create(
+            folder = execute("drive_write", service.files().create(
                 body=metadata,
                 supportsAllDrives=True,
                 fields="id"
-            ).execute()
+            ))
             return folder["id"]
 
         raise ValueError("Debes proporcionar shared_drive_id o parent_folder_id.")
@@ -89,30 +107,201 @@ def find_or_create_folder(service, folder_name: str, *, shared_drive_id: str | N
     except HttpError as e:
         raise RuntimeError(f"Error buscando/creando carpeta en Drive: {e}")
 
-def upload_to_drive(service, folder_id: str, file_path: str, file_name: str) -> str:
+@dataclass
+class UploadStats:
+    total_bytes: int
+    bytes_sent: int = 0
+    resumed_from: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def bytes_per_second(self) -> float:
+        # Solo lo enviado en esta ejecución (lo retomado ya estaba en Drive)
+        elapsed = time.monotonic() - self.started_at
+        return (self.bytes_sent - self.resumed_from) / elapsed if elapsed > 0 else 0.0
+
+def is_retryable_error(e: Exception) -> bool:
+    """Errores transitorios de Google: 5xx, 408/429, 403 por cuota y fallos de red."""
+    if isinstance(e, HttpError):
+        status = int(e.resp.status)
+        return status in _RETRYABLE_STATUS or is_rate_limited(e)
+    return isinstance(e, (ConnectionError, TimeoutError, socket.timeout, ssl.SSLError, httplib2.HttpLib2Error))
+
+def _resumable_status(http, resume_uri: str, total_bytes: int):
+    """
+    Consulta el estado de una sesión reanudable (PUT vacío con
+    Content-Range: bytes */total, protocolo documentado de Drive).
+    Devuelve ("partial", bytes confirmados), ("done", recurso creado) o
+    ("expired", None) si Drive ya no conoce la sesión.
+    """
+    resp, content = http.request(
+        resume_uri, method="PUT",
+        headers={"Content-Range": f"bytes */{total_bytes}", "Content-Length": "0"},
+    )
+    status = int(resp.status)
+    if status == 308:
+        # Range: bytes=0-N (sin cabecera: todavía no llegó ningún byte)
+        confirmed = resp.get("range")
+        return "partial", int(confirmed.rsplit("-", 1)[1]) + 1 if confirmed else 0
+    if status in (200, 201):
+        return "done", json.loads(content)
+    if status in (404, 410):
+        return "expired", None
+    raise HttpError(resp, content, uri=resume_uri)
+
+def upload_to_drive(service, folder_id: str, file_path: str, file_name: str, *,
+                    resume_uri: str | None = None, on_progress=None) -> str:
+    """
+    Sube el archivo por bloques de UPLOAD_CHUNK_SIZE con una sesión reanudable.
+    Los errores transitorios se reintentan con backoff y jitter desde el último byte
+    confirmado. on_progress(resumable_uri, stats) se llama tras cada bloque para
+    que el llamador guarde la sesión; con resume_uri se pregunta a Drive cuánto
+    tiene esa sesión y se continúa desde ahí (si ya venció, se empieza de cero).
+    El tipo MIME se deduce del nombre del archivo.
+    """
     try:
-        media = MediaFileUpload(file_path, mimetype="application/pdf", resumable=True)
-        metadata = {"name": file_name, "parents": [folder_id]}
-        file = service.files().create(
-            body=metadata,
-            media_body=media,
-            supportsAllDrives=True,
-            fields="id, webViewLink"
-        ).execute()
+        mimetype = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+        def new_request():
+            media = MediaFileUpload(file_path, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+            return media, service.files().create(
+                body={"name": file_name, "parents": [folder_id]},
+                media_body=media,
+                supportsAllDrives=True,
+                fields="id, webViewLink"
+            )
+
+        media, request = new_request()
+        stats = UploadStats(total_bytes=media.size())
+
+        # Cada bloque (y cada consulta de estado) consume un token de escritura de Drive
+        bucket = get_bucket("drive_write")
+        failures = 0
+        file = None
+
+        def retry_or_raise(e: Exception):
+            nonlocal failures
+            if is_rate_limited(e):
+                bucket.throttled()
+            if not is_retryable_error(e) or failures >= UPLOAD_MAX_RETRIES:
+                raise e
+            failures += 1
+            stats.retries += 1
+            time.sleep(backoff_delay(failures))
+
+        while resume_uri:
+            bucket.acquire()
+            try:
+                state, value = _resumable_status(request.http, resume_uri, stats.total_bytes)
+            except Exception as e:
+                retry_or_raise(e)
+                continue
+            if state == "partial":
+                request.resumable_uri = resume_uri
+                request.resumable_progress = value
+                stats.bytes_sent = stats.resumed_from = value
+            elif state == "done":
+                file = value
+            break
+
+        while file is None:
+            bucket.acquire()
+            try:
+                status, file = request.next_chunk(num_retries=0)
+            except Exception as e:
+                if isinstance(e, HttpError) and int(e.resp.status) in (404, 410) and request.resumable_uri \
+                        and failures < UPLOAD_MAX_RETRIES:
+                    # Sesión reanudable vencida o desconocida: nueva sesión desde el byte 0
+                    media, request = new_request()
+                    stats.bytes_sent = stats.resumed_from = 0
+                    failures += 1
+                    stats.retries += 1
+                    continue
+                retry_or_raise(e)
+                continue
+
+            bucket.succeeded()
+            failures = 0
+            if status:
+                stats.bytes_sent = status.resumable_progress
+            if on_progress and request.resumable_uri:
+                if file is not None:
+                    stats.bytes_sent = stats.total_bytes
+                on_progress(request.resumable_uri, stats)
 
         file_id = file["id"]
 
         # Dar permiso de lectura por enlace
         try:
-            service.permissions().create(
+            execute("drive_write", service.permissions().create(
                 fileId=file_id,
                 supportsAllDrives=True,
                 body={"type": "anyone", "role": "reader"},
-            ).execute()
+            ))
         except HttpError:
             pass
 
         return file.get("webViewLink") or f"https://drive.google.com/file/d/{file_id}/view"
 
-    except HttpError as e:
+    except (HttpError, OSError, httplib2.HttpLib2Error) as e:
         raise RuntimeError(f"Error subiendo archivo a Drive: {e}")
+
+
+def drive_file_id_from_link(link: str | None) -> str | None:
+    """Extrae el fileId de un webViewLink (https://drive.google.com/file/d/<id>/view)."""
+    if not link:
+        return None
+    m = _FILE_ID_RE.search(link)
+    if not m:
+        return None
+    return m.group(1) or m.group(2)
+
+def get_start_page_token(service, shared_drive_id: str) -> str:
+    try:
+        res = execute("drive_query", service.changes().getStartPageToken(
+            driveId=shared_drive_id,
+            supportsAllDrives=True,
+        ))
+        return res["startPageToken"]
+    except HttpError as e:
+        raise RuntimeError(f"Error obteniendo startPageToken de Drive: {e}")
+
+def list_changes_page(service, shared_drive_id: str, page_token: str) -> dict:
+    """
+    Una página del feed changes.list de la unidad compartida.
+    Devuelve la respuesta cruda: changes, nextPageToken y/o newStartPageToken.
+    """
+    try:
+        return execute("drive_query", service.changes().list(
+            pageToken=page_token,
+            driveId=shared_drive_id,
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True,
+            includeRemoved=True,
+            pageSize=1000,
+            fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({DRIVE_FILE_FIELDS}))",
+        ))
+    except HttpError as e:
+        raise RuntimeError(f"Error leyendo cambios de Drive: {e}")
+
+def iter_drive_files(service, shared_drive_id: str):
+    """Recorre (paginado) todos los archivos de la unidad compartida, incluidos los de la papelera."""
+    page_token = None
+    try:
+        while True:
+            res = execute("drive_query", service.files().list(
+                corpora="drive",
+                driveId=shared_drive_id,
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                fields=f"nextPageToken, files({DRIVE_FILE_FIELDS})",
+                pageSize=1000,
+                pageToken=page_token,
+            ))
+            yield from res.get("files", [])
+            page_token = res.get("nextPageToken")
+            if not page_token:
+                return
+    except HttpError as e:
+        raise RuntimeError(f"Error listando archivos de Drive: {e}")
@@ -0,0 +1,212 @@
+# services/rate_limit.py
+"""
+Limitador de llamadas a Google compartido por todo el proceso (sesiones de
+Streamlit y workers). Un token bucket por presupuesto de API:
+
+    drive_query   lecturas de Drive (files.list, changes.list, ...)
+    drive_write   escrituras en Drive (crear carpeta/archivo, cada bloque de una carga, permisos)
+    sheets_read   lecturas de Sheets
+    sheets_write  escrituras en Sheets
+
+- Cola justa: los que esperan se atienden por turnos entre sesiones (round-robin),
+  así una carga masiva no deja sin cupo a las demás sesiones.
+- AIMD: ante un 403 rateLimitExceeded/userRateLimitExceeded o un 429 el ritmo del
+  bucket baja a la mitad; cada llamada exitosa lo sube un poco hasta el máximo.
+- Métricas por bucket: llamadas, tiempo de espera (total/máximo) y señales de cuota.
+
+Ritmos (llamadas por segundo) configurables por variable de entorno
+GOOGLE_RATE_<PRESUPUESTO>, p. ej. GOOGLE_RATE_DRIVE_WRITE=3.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+from googleapiclient.errors import HttpError
+
+_DEFAULT_RATES = {
+    "drive_query": 10.0,
+    "drive_write": 3.0,
+    "sheets_read": 1.0,
+    "sheets_write": 1.0,
+}
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+THROTTLE_MAX_RETRIES = 5
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 64.0) -> float:
+    """Backoff exponencial con jitter completo: uniforme entre 0 y base * 2^attempt (tope cap)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _http_error_reason(e: HttpError) -> str:
+    try:
+        return json.loads(e.content)["error"]["errors"][0]["reason"]
+    except Exception:
+        return ""
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """Google pide bajar el ritmo: 429, o 403 con motivo de cuota (Drive/Sheets vía googleapiclient o gspread)."""
+    if isinstance(e, HttpError):
+        status = int(e.resp.status)
+        return status == 429 or (status == 403 and _http_error_reason(e) in _RATE_LIMIT_REASONS)
+    response = getattr(e, "response", None)  # gspread.exceptions.APIError
+    status = getattr(response, "status_code", None)
+    if status == 429:
+        return True
+    return status == 403 and any(r in (getattr(response, "text", "") or "") for r in _RATE_LIMIT_REASONS)
+
+
+def _client_key() -> str:
+    """Sesión de Streamlit que llama (o el hilo, fuera de Streamlit): unidad de la cola justa."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return threading.current_thread().name
+
+
+class TokenBucket:
+    def __init__(self, name: str, rate: float, burst: float | None = None):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        # cliente -> tickets en espera; el orden de las claves es el turno
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._stats = {"calls": 0, "wait_total": 0.0, "wait_max": 0.0, "throttled": 0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _head(self):
+        return next(iter(self._queues.values()))[0]
+
+    def _leave(self, client: str, ticket):
+        queue = self._queues[client]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[client]
+        else:
+            # Le toca a otro cliente antes de su siguiente llamada
+            self._queues.move_to_end(client)
+
+    def acquire(self, client: str | None = None) -> float:
+        """Bloquea hasta obtener un token en su turno. Devuelve los segundos esperados."""
+        client = client or _client_key()
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._queues.setdefault(client, deque()).append(ticket)
+            try:
+                while True:
+                    self._refill(time.monotonic())
+                    if self._head() is ticket:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            break
+                        self._cond.wait((1 - self._tokens) / self.rate)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._leave(client, ticket)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self._stats["calls"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        return waited
+
+    def throttled(self):
+        """Google pidió bajar el ritmo: reducción multiplicativa y sin ráfaga acumulada."""
+        with self._cond:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._stats["throttled"] += 1
+
+    def succeeded(self):
+        """Aumento aditivo hasta el ritmo configurado."""
+        if self.rate >= self.max_rate:
+            return
+        with self._cond:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def stats(self) -> dict:
+        with self._cond:
+            calls = self._stats["calls"]
+            return {
+                **self._stats,
+                "wait_avg": self._stats["wait_total"] / calls if calls else 0.0,
+                "rate": self.rate,
+                "max_rate": self.max_rate,
+                "waiting": sum(len(q) for q in self._queues.values()),
+            }
+
+
+_buckets_lock = threading.Lock()
+_buckets: dict[str, TokenBucket] = {}
+
+
+def get_bucket(api: str) -> TokenBucket:
+    with _buckets_lock:
+        if api not in _buckets:
+            if api not in _DEFAULT_RATES:
+                raise ValueError(f"Presupuesto de API desconocido: {api}")
+            rate = float(os.getenv(f"GOOGLE_RATE_{api.upper()}", _DEFAULT_RATES[api]))
+            _buckets[api] = TokenBucket(api, rate)
+        return _buckets[api]
+
+
+def google_call(api: str, fn, *args, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) con un token del presupuesto api. Si Google
+    responde que se excedió la cuota, baja el ritmo del bucket y reintenta con
+    backoff y jitter; cualquier otro error se propaga.
+    """
+    bucket = get_bucket(api)
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt >= THROTTLE_MAX_RETRIES:
+                raise
+            bucket.throttled()
+            attempt += 1
+            time.sleep(backoff_delay(attempt))
+            continue
+        bucket.succeeded()
+        return result
+
+
+def execute(api: str, request):
+    """google_call para una petición de googleapiclient: execute(api, service.files().list(...))."""
+    return google_call(api, request.execute)
+
+
+def rate_limit_stats() -> dict[str, dict]:
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    return {b.name: b.stats() for b in buckets}
+
+
+def format_rate_limit_stats() -> str:
+    return "; ".join(
+        f"{name}: {s['calls']} llamadas, espera media {s['wait_avg']:.2f}s (máx {s['wait_max']:.1f}s), "
+        f"{s['throttled']} avisos de cuota, ritmo {s['rate']:.1f}/{s['max_rate']:.1f} por s"
+        for name, s in rate_limit_stats().items()
+    )
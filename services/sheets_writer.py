@@ -1,3 +1,4 @@
+import threading
 import gspread
 from google.oauth2.service_account import Credentials
 import streamlit as st
@@ -5,6 +6,9 @@ from googleapiclient.discovery import build
 from datetime import datetime
 import pytz
 
+from services.cache import get_cache
+from services.rate_limit import execute, google_call
+
 credentials = Credentials.from_service_account_info(
     st.secrets["google_sheets_credentials"],
     scopes=[
@@ -18,45 +22,207 @@ sheets_service = build("sheets", "v4", credentials=credentials)
 COMPLIANCE_ID = st.secrets["general"]["compliance_id"]
 colombia_timezone = pytz.timezone('America/Bogota')
 
-def get_or_create_worksheet(sheet_name: str, headers: list = None):
+REQUESTS_SHEET = "Solicitudes de Creacion"
+# La columna ID (request_id) es la llave con la que workers/sheets_sync.py reconcilia la hoja
+REQUEST_HEADERS = [
+    "ID", "Fecha", "Solicitante", "Tipo de perfil", "Nombre Compañia", "Nombre Completo", "Cedula", "Correo",
+    "Cuenta Trading", "Direccion", "Idioma", "Frecuencia Recordatorio", "Documentos requeridos", "Estado",
+]
+STATUS_LABELS = {"pendiente": "Pendiente", "en_progreso": "En progreso", "completa": "Completa"}
+
+# Handles cacheados (solo en memoria del proceso: no se pueden serializar):
+# abrir la hoja cuesta una llamada a la API por vez
+_handles_lock = threading.Lock()
+
+def _get_spreadsheet():
+    return get_cache().get_or_set(
+        "sheets_handles", COMPLIANCE_ID,
+        lambda: google_call("sheets_read", client_gcp.open_by_key, COMPLIANCE_ID),
+        local=True,
+    )
+
+def _open_worksheet(sheet_name: str, headers: list = None):
+    sheet = _get_spreadsheet()
     try:
-        sheet = client_gcp.open_by_key(COMPLIANCE_ID)
-        try:
-            worksheet = sheet.worksheet(sheet_name)
-        except gspread.exceptions.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title=sheet_name, rows="1000", cols="30")
-            if headers:
-                worksheet.append_row(headers)
-            st.warning(f"Worksheet '{sheet_name}' was created.")
+        return google_call("sheets_read", sheet.worksheet, sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        worksheet = google_call("sheets_write", sheet.add_worksheet, title=sheet_name, rows="1000", cols="30")
+        if headers:
+            google_call("sheets_write", worksheet.append_row, headers)
+        st.warning(f"Worksheet '{sheet_name}' was created.")
         return worksheet
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error("No se encontró la hoja de cálculo.")
-        return None
 
-def save_request(request_info: dict):
+def get_or_create_worksheet(sheet_name: str, headers: list = None):
+    with _handles_lock:
+        try:
+            return get_cache().get_or_set(
+                "sheets_handles", f"{COMPLIANCE_ID}:{sheet_name}",
+                lambda: _open_worksheet(sheet_name, headers),
+                local=True,
+            )
+        except gspread.exceptions.SpreadsheetNotFound:
+            st.error("No se encontró la hoja de cálculo.")
+            return None
+
+def _format_date(dt) -> str:
+    if not dt:
+        return ""
+    if isinstance(dt, str):
+        return dt
+    if dt.tzinfo is None:
+        dt = pytz.utc.localize(dt)
+    return dt.astimezone(colombia_timezone).strftime("%Y-%m-%d %H:%M:%S")
 
-    headers = ["Fecha", "Solicitante", "Tipo de perfil", "Nombre Compañia", "Nombre Completo", "Cedula", "Correo", "Cuenta Trading", "Direccion", "Idioma", "Frecuencia Recordatorio"]
+def request_row(request_info: dict) -> list[str]:
+    """Fila de la hoja de solicitudes, en el orden de REQUEST_HEADERS. Todo como texto."""
+    values = [
+        request_info.get("request_id"),
+        _format_date(request_info.get("created_at")),
+        request_info.get("requested_by"),
+        request_info.get("tipo_solicitud"),
+        request_info.get("company_name"),
+        request_info.get("nombre_completo"),
+        request_info.get("cedula"),
+        request_info.get("email"),
+        request_info.get("trading"),
+        request_info.get("location"),
+        request_info.get("language"),
+        request_info.get("reminder_frequency"),
+        request_info.get("progress"),
+        STATUS_LABELS.get(request_info.get("status") or "pendiente", ""),
+    ]
+    return ["" if v is None else str(v) for v in values]
 
-    ws = get_or_create_worksheet("Solicitudes de Creacion", headers)
+def save_request(request_info: dict):
+
+    ws = get_or_create_worksheet(REQUESTS_SHEET, REQUEST_HEADERS)
 
     if not ws:
         return
 
-    colombia_timezone = pytz.timezone("America/Bogota")
-    fecha_creacion = datetime.now(pytz.utc).astimezone(colombia_timezone).strftime("%Y-%m-%d %H:%M:%S")
-
-    row = [
-        fecha_creacion,
-        request_info.get("requested_by", ""),
-        request_info.get("tipo_solicitud", ""),
-        request_info.get("company_name", ""),
-        request_info.get("nombre_completo", ""),
-        request_info.get("cedula", ""),
-        request_info.get("email", ""),
-        request_info.get("trading", ""),
-        request_info.get("location", ""),
-        request_info.get("language", ""),
-        request_info.get("reminder_frequency", ""),
+    # El avance lo completa después la sincronización completa (workers/sheets_sync.py)
+    row = request_row({**request_info, "created_at": datetime.now(pytz.utc), "status": "pendiente"})
+    google_call("sheets_write", ws.append_row, row, value_input_option="RAW")
+
+
+def _pad(row: list, width: int) -> list[str]:
+    row = [str(v) for v in row[:width]]
+    return row + [""] * (width - len(row))
+
+def plan_sheet_updates(current: list[list], headers: list[str], desired: dict[int, list[str]]) -> dict[int, list[str]]:
+    """
+    Compara la hoja actual (filas tal como las devuelve values.get) con el estado
+    deseado {request_id: fila} y devuelve solo las filas a escribir {n° de fila: valores}.
+
+    Las filas se emparejan por la columna ID. Las que no tienen un ID vigente
+    (solicitudes borradas, duplicados, filas antiguas sin ID) se reutilizan para
+    las solicitudes nuevas; las que sobran se vacían.
+    """
+    width = len(headers)
+    updates = {}
+    if not current or _pad(current[0], width) != headers:
+        updates[1] = list(headers)
+
+    existing, free = {}, []
+    for row_no, row in enumerate(current[1:], start=2):
+        key = str(row[0]).strip() if row else ""
+        if key.isdigit() and int(key) in desired and int(key) not in existing:
+            existing[int(key)] = row_no
+        else:
+            free.append(row_no)
+
+    next_row = max(len(current), 1) + 1
+    for request_id, values in desired.items():
+        row_no = existing.get(request_id)
+        if row_no is not None:
+            if _pad(current[row_no - 1], width) != values:
+                updates[row_no] = values
+            continue
+        if free:
+            row_no = free.pop(0)
+        else:
+            row_no, next_row = next_row, next_row + 1
+        updates[row_no] = values
+
+    for row_no in free:
+        if any(_pad(current[row_no - 1], width)):
+            updates[row_no] = [""] * width
+    return updates
+
+def _contiguous_blocks(updates: dict[int, list[str]]):
+    """Agrupa filas consecutivas en bloques (fila inicial, [filas]) para enviar menos rangos."""
+    block_start, block = None, []
+    for row_no in sorted(updates):
+        if block and row_no != block_start + len(block):
+            yield block_start, block
+            block_start, block = None, []
+        if block_start is None:
+            block_start = row_no
+        block.append(updates[row_no])
+    if block:
+        yield block_start, block
+
+def _grow_grid(sheet_id: int, rows: int, cols: int):
+    """
+    Amplía la hoja hasta rows x cols si es más chica. El tamaño se lee de la API
+    (el handle cacheado no ve las filas que agrega save_request) y solo se
+    agregan filas o columnas al final: nunca se fija un tamaño absoluto, que
+    podría recortar la hoja.
+    """
+    meta = execute("sheets_read", sheets_service.spreadsheets().get(
+        spreadsheetId=COMPLIANCE_ID,
+        fields="sheets(properties(sheetId,gridProperties(rowCount,columnCount)))",
+    ))
+    grid = next(
+        s["properties"]["gridProperties"] for s in meta.get("sheets", [])
+        if s["properties"]["sheetId"] == sheet_id
+    )
+    requests = [
+        {"appendDimension": {"sheetId": sheet_id, "dimension": dimension, "length": needed - actual}}
+        for dimension, needed, actual in (
+            ("ROWS", rows, grid.get("rowCount", 0)),
+            ("COLUMNS", cols, grid.get("columnCount", 0)),
+        )
+        if needed > actual
+    ]
+    if requests:
+        execute("sheets_write", sheets_service.spreadsheets().batchUpdate(
+            spreadsheetId=COMPLIANCE_ID, body={"requests": requests},
+        ))
+
+def sync_requests_sheet(desired: dict[int, list[str]]) -> int:
+    """
+    Reconcilia la hoja de solicitudes con el estado deseado: un values.get para
+    leerla, diff en memoria y un único values.batchUpdate con los rangos que cambian.
+    Devuelve el número de filas escritas.
+    """
+    ws = get_or_create_worksheet(REQUESTS_SHEET, REQUEST_HEADERS)
+    if not ws:
+        return 0
+
+    width = len(REQUEST_HEADERS)
+    last_col = gspread.utils.rowcol_to_a1(1, width)[:-1]
+    title = ws.title.replace("'", "''")
+
+    current = execute("sheets_read", sheets_service.spreadsheets().values().get(
+        spreadsheetId=COMPLIANCE_ID,
+        range=f"'{title}'!A1:{last_col}",
+        valueRenderOption="FORMATTED_VALUE",
+    )).get("values", [])
+
+    updates = plan_sheet_updates(current, REQUEST_HEADERS, desired)
+    if not updates:
+        return 0
+
+    # values.batchUpdate no amplía la cuadrícula: se agregan filas/columnas antes si hace falta
+    _grow_grid(ws.id, max(updates), width)
 
+    data = [
+        {"range": f"'{title}'!A{start}:{last_col}{start + len(rows) - 1}", "values": rows}
+        for start, rows in _contiguous_blocks(updates)
     ]
-    ws.append_row(row, value_input_option="USER_ENTERED")
\ No newline at end of file
+    execute("sheets_write", sheets_service.spreadsheets().values().batchUpdate(
+        spreadsheetId=COMPLIANCE_ID,
+        body={"valueInputOption": "RAW", "data": data},
+    ))
+    return len(updates)
@@ -0,0 +1,101 @@
+# ui/helpers.py
+
+import re
+import unicodedata
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import streamlit as st
+
+from services.google_drive_utils import drive_file_id_from_link
+
+CO_TZ = ZoneInfo("America/Bogota")
+NOTES_PAGE_SIZE = 5
+
+
+def slug(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    return s.strip().lower()
+
+
+def company_key(name: str) -> str:
+    """Clave única de compañía: slug sin signos ni espacios ("ACME S.A.S." -> "acmesas")."""
+    return re.sub(r"[^a-z0-9]", "", slug(name or ""))
+
+
+def format_size(size_bytes: int | None) -> str:
+    if size_bytes is None:
+        return ""
+    size = float(size_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _as_utc(dt: datetime | None) -> datetime | None:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def drive_links_file_ids(links: list[str]) -> list[str]:
+    return [fid for fid in (drive_file_id_from_link(u) for u in links) if fid]
+
+
+def drive_status_suffix(link: str | None, mirror: dict, last_sync_at: datetime | None, uploaded_at: datetime | None) -> str:
+    """
+    Texto a añadir junto a un enlace según el espejo local de Drive (tabla drive_files):
+    tamaño si existe, aviso si está en la papelera o si ya no aparece en la unidad.
+    Un archivo ausente solo se marca como faltante si fue subido antes de la última sincronización.
+    """
+    file_id = drive_file_id_from_link(link)
+    if not file_id:
+        return ""
+
+    rec = mirror.get(file_id)
+    if rec:
+        if rec.get("trashed"):
+            return " — ⚠️ en la papelera de Drive"
+        size = format_size(rec.get("size_bytes"))
+        return f" · {size}" if size else ""
+
+    last_sync_at, uploaded_at = _as_utc(last_sync_at), _as_utc(uploaded_at)
+    if last_sync_at and uploaded_at and uploaded_at < last_sync_at:
+        return " — ⚠️ no encontrado en Drive"
+    return ""
+
+
+def render_note_log(request_id: int, kind: str, fetch_page, key_prefix: str) -> int:
+    """
+    Pinta las NOTES_PAGE_SIZE entradas más recientes de la bitácora y un botón
+    "Cargar más" que trae la página anterior (keyset por id).
+    fetch_page(request_id, kind, limit, before_id) -> entradas de la más reciente a la más antigua.
+    Devuelve el número de entradas pintadas.
+    """
+    older_key = f"{key_prefix}_older_{request_id}_{kind}"
+
+    first = fetch_page(request_id, kind, NOTES_PAGE_SIZE + 1, None)
+    older = st.session_state.get(older_key, {"entries": [], "has_more": None})
+
+    entries = first[:NOTES_PAGE_SIZE]
+    seen = {e["id"] for e in entries}
+    entries += [e for e in older["entries"] if e["id"] not in seen]
+    has_more = older["has_more"] if older["has_more"] is not None else len(first) > NOTES_PAGE_SIZE
+
+    for e in entries:
+        ts = _as_utc(e["created_at"]).astimezone(CO_TZ).strftime("%Y-%m-%d %H:%M")
+        body = e["body"].replace("\n", "  \n")
+        st.markdown(f"**{ts}** · {e.get('author') or '—'}  \n{body}")
+
+    if has_more and st.button("Cargar más", key=f"{older_key}_more"):
+        page = fetch_page(request_id, kind, NOTES_PAGE_SIZE + 1, entries[-1]["id"])
+        st.session_state[older_key] = {
+            "entries": older["entries"] + page[:NOTES_PAGE_SIZE],
+            "has_more": len(page) > NOTES_PAGE_SIZE,
+        }
+        st.rerun()
+
+    return len(entries)
@@ -0,0 +1,92 @@
+# views/analytics.py
+
+import streamlit as st
+from datetime import date, timedelta
+
+from database.db import run_read
+from database.crud.documents import get_profiles_list, get_profile_id_by_name
+from database.crud.analytics import (
+    get_onboarding_series,
+    get_rollup_dimensions,
+    get_rollup_last_refresh,
+)
+from workers.analytics_refresh import refresh_once
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_dimensions():
+    dims = run_read(get_rollup_dimensions)
+    profiles = {name: run_read(get_profile_id_by_name, name) for name in run_read(get_profiles_list)}
+    return dims, profiles
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_series(date_from, date_to, trading, requested_by, profile_id):
+    return run_read(get_onboarding_series, date_from, date_to, trading, requested_by, profile_id)
+
+
+def show():
+    """
+    Tiempos de onboarding y backlog por trading, comercial y perfil.
+    Solo lee los rollups diarios (onboarding_daily_rollup).
+    """
+    st.subheader("📈 Analítica de onboarding")
+
+    dims, profiles = _load_dimensions()
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        period = st.date_input(
+            "Periodo",
+            value=(date.today() - timedelta(days=90), date.today()),
+            key="an_period"
+        )
+    with col2:
+        trading = st.selectbox("Trading", dims["trading"], index=None, placeholder="Todos", key="an_trading")
+    with col3:
+        requested_by = st.selectbox("Comercial / solicitante", dims["requested_by"], index=None, placeholder="Todos", key="an_requested_by")
+    with col4:
+        profile_name = st.selectbox("Perfil", list(profiles), index=None, placeholder="Todos", key="an_profile")
+
+    if not isinstance(period, (list, tuple)) or len(period) != 2:
+        st.info("Selecciona fecha inicial y final.")
+        return
+    date_from, date_to = period
+
+    series = _load_series(date_from, date_to, trading, requested_by, profiles.get(profile_name))
+    if not series:
+        st.info("No hay datos para el periodo y filtros seleccionados.")
+    else:
+        created = sum(r["created"] for r in series)
+        completed = sum(r["completed"] for r in series)
+        first_uploads = sum(r["first_uploads"] for r in series)
+        h_first = sum((r["avg_hours_to_first_upload"] or 0) * r["first_uploads"] for r in series)
+        h_complete = sum((r["avg_hours_to_completion"] or 0) * r["completed"] for r in series)
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Solicitudes creadas", created)
+        m2.metric("Completadas", completed)
+        m3.metric("Días a primer documento", f"{h_first / first_uploads / 24:.1f}" if first_uploads else "—")
+        m4.metric("Días a completitud", f"{h_complete / completed / 24:.1f}" if completed else "—")
+
+        chart = {
+            "day": [r["day"] for r in series],
+            "Creadas": [r["created"] for r in series],
+            "Completadas": [r["completed"] for r in series],
+            "Backlog": [r["backlog"] for r in series],
+        }
+        st.markdown("**Backlog (solicitudes abiertas)**")
+        st.line_chart(chart, x="day", y="Backlog")
+        st.markdown("**Creadas vs. completadas por día**")
+        st.bar_chart(chart, x="day", y=["Creadas", "Completadas"])
+
+    last_refresh = run_read(get_rollup_last_refresh)
+    colA, colB = st.columns([3, 1])
+    with colA:
+        st.caption(f"Última actualización de rollups: {last_refresh.strftime('%Y-%m-%d %H:%M') if last_refresh else 'nunca'}")
+    with colB:
+        if st.button("Actualizar ahora", key="an_refresh"):
+            with st.spinner("Actualizando rollups..."):
+                refresh_once()
+            _load_series.clear()
+            _load_dimensions.clear()
+            st.rerun()
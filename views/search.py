@@ -0,0 +1,66 @@
+# views/search.py
+
+import streamlit as st
+from database.db import run_read
+from database.crud.search import search_requests
+
+PAGE_SIZE = 20
+
+
+def show(current_user_email: str | None = None, is_admin: bool = False):
+    """
+    Búsqueda en seguimiento, comentarios, nombre de compañía y archivos cargados.
+    - Admin: busca en todas las solicitudes.
+    - No admin: solo en las que creó.
+    """
+    st.subheader("🔎 Buscar en solicitudes")
+
+    query = st.text_input(
+        "Buscar",
+        placeholder='Ej.: póliza vencida, "cámara de comercio", rut -proveedor',
+        key="search_query"
+    ).strip()
+
+    if not query:
+        st.info("Escribe uno o más términos. Admite frases entre comillas y exclusiones con '-'.")
+        return
+
+    # Nueva búsqueda -> volver a la primera página
+    if st.session_state.get("search_last_query") != query:
+        st.session_state["search_last_query"] = query
+        st.session_state["search_page"] = 0
+    page = st.session_state.get("search_page", 0)
+
+    email_filter = None if is_admin else (current_user_email or None)
+    results = run_read(search_requests, query, email_filter, PAGE_SIZE, page * PAGE_SIZE)
+
+    if not results:
+        st.warning("Sin resultados.")
+        return
+
+    total = results[0]["total"]
+    first, last = page * PAGE_SIZE + 1, page * PAGE_SIZE + len(results)
+    st.caption(f"Resultados {first}–{last} de {total}")
+
+    for r in results:
+        st.markdown(
+            f"**{r['company_name']}** · {r['profile_name']} · ID {r['id']} • "
+            f"{r['created_at'].strftime('%Y-%m-%d %H:%M')}"
+            + (f" • {r['created_by_email']}" if r.get("created_by_email") else "")
+        )
+        snippet = (r.get("snippet") or "").strip()
+        if snippet:
+            st.markdown(f"> {snippet}")
+        if r.get("matched_files"):
+            st.caption(f"📎 {r['matched_files']}")
+        st.write("---")
+
+    col1, _, col3 = st.columns([1, 3, 1])
+    with col1:
+        if page > 0 and st.button("← Anteriores", key="search_prev"):
+            st.session_state["search_page"] = page - 1
+            st.rerun()
+    with col3:
+        if last < total and st.button("Siguientes →", key="search_next"):
+            st.session_state["search_page"] = page + 1
+            st.rerun()
@@ -1,33 +1,223 @@
 # views/visualization.py
 
+import time
 import streamlit as st
-import unicodedata
-from database.db import SessionLocal
+from database.db import SessionLocal, run_read
+from database.notifications import get_request_listener
 from database.crud.documents import (
     get_profiles_list,           # <- lista de NOMBRES de perfil
     get_profile_id_by_name,      # <- resuelve ID a partir del nombre
     get_required_document_types,
     get_uploaded_documents_map,
-    get_request_meta,
+    get_request_notes,
+    list_document_versions,
     get_requests_for_progress,   # <- devuelve todas o por email del creador
 )
+from database.crud.archive import get_archived_requests
+from database.crud.drive_files import get_drive_files_by_ids, get_last_drive_sync_at
+from services.cache import cached
+from ui.helpers import slug, drive_links_file_ids, drive_status_suffix, render_note_log, NOTES_PAGE_SIZE
+
+# Cada cuánto el detalle mira (en memoria) si llegó un NOTIFY de la solicitud
+LIVE_CHECK_SECONDS = 2
+# Lo que no llega por NOTIFY (p. ej. el espejo de Drive) se refresca igual pasado este tiempo
+DETAIL_MAX_AGE_SECONDS = 300
+DETAIL_KEY = "pv_detail"
 
 # --------------------
 # Helpers
 # --------------------
-def _slug(s: str) -> str:
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    return s.strip().lower()
-
 def is_security_verification(doc_name: str) -> bool:
     # Solo este documento admite múltiples archivos (CSV en file_name/drive_link)
-    return "verificaciones de seguridad" in _slug(doc_name)
+    return "verificaciones de seguridad" in slug(doc_name)
 
 def split_csv_list(s: str):
     if not s:
         return []
     return [x.strip() for x in s.split(",") if x and x.strip()]
 
+# --------------------
+# Datos de referencia (caché compartida entre réplicas)
+# --------------------
+@cached("reference", ttl=3600)
+def _load_profile_ids() -> dict[str, int]:
+    """Nombre de perfil -> id, para todos los perfiles definidos."""
+    def fetch(session):
+        return {name: get_profile_id_by_name(session, name) for name in get_profiles_list(session) or []}
+    return {name: pid for name, pid in run_read(fetch).items() if pid}
+
+@cached("reference", ttl=3600)
+def _load_required_docs(profile_id: int) -> list[dict]:
+    return [dict(d) for d in run_read(get_required_document_types, profile_id)]
+
+# --------------------
+# Detalle de la solicitud (en vivo)
+# --------------------
+def _fetch_request_detail(session, request_id: int, profile_id: int, archived: bool) -> dict:
+    """Todo lo que pinta el detalle de una solicitud."""
+    required_docs = [dict(d) for d in _load_required_docs(profile_id)]
+    uploaded_map = {k: dict(v) for k, v in get_uploaded_documents_map(session, request_id, archived=archived).items()}
+    all_links = [u for rec in uploaded_map.values() for u in split_csv_list(rec.get("drive_link") or "")]
+    return {
+        "required_docs": required_docs,
+        "uploaded_map": uploaded_map,
+        "mirror": get_drive_files_by_ids(session, drive_links_file_ids(all_links)),
+        "last_sync_at": get_last_drive_sync_at(session),
+        "versions": list_document_versions(session, request_id),
+        "notes": {
+            kind: get_request_notes(session, request_id, kind, NOTES_PAGE_SIZE + 1, archived=archived)
+            for kind in ("seguimiento", "comentario")
+        },
+    }
+
+
+def _notes_fetcher(detail: dict, archived: bool):
+    """La primera página de cada bitácora ya viene en el detalle; "Cargar más" consulta aparte."""
+    def fetch(request_id: int, kind: str, limit: int, before_id: int | None):
+        if before_id is None and limit <= NOTES_PAGE_SIZE + 1:
+            return detail["notes"][kind][:limit]
+        return run_read(get_request_notes, request_id, kind, limit, before_id, archived)
+    return fetch
+
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def _request_detail_fragment(request_id: int, profile_id: int, archived: bool):
+    """
+    Progreso, documentos y notas de la solicitud. Cada LIVE_CHECK_SECONDS compara
+    la versión que lleva el oyente de NOTIFY (en memoria); solo si cambió vuelve
+    a consultar, y solo los datos de esta solicitud.
+    """
+    version = get_request_listener().version(request_id)
+    entry = st.session_state.get(DETAIL_KEY)
+    fresh = (
+        entry is not None
+        and entry["request_id"] == request_id
+        and entry["version"] == version
+        and time.monotonic() - entry["fetched_at"] < DETAIL_MAX_AGE_SECONDS
+    )
+    if not fresh:
+        if entry is not None and entry["request_id"] == request_id and entry["version"] != version:
+            # Tras un NOTIFY se lee del primario: la réplica puede no tener aún el cambio
+            with SessionLocal() as session:
+                detail = _fetch_request_detail(session, request_id, profile_id, archived)
+        else:
+            detail = run_read(_fetch_request_detail, request_id, profile_id, archived)
+        entry = {"request_id": request_id, "version": version, "fetched_at": time.monotonic(), "detail": detail}
+        st.session_state[DETAIL_KEY] = entry
+
+    _render_request_detail(request_id, entry["detail"], archived)
+
+
+def _render_request_detail(request_id: int, detail: dict, archived: bool):
+    # 5) Cálculo de progreso (ANTES de listar documentos)
+    required_docs = detail["required_docs"]   # [{id, name, is_required}, ...]
+    uploaded_map  = detail["uploaded_map"]    # {document_type_id: {...}}
+
+    if not required_docs:
+        st.info("Este perfil no tiene tipos de documentos configurados.")
+        return
+
+    total_required = sum(1 for d in required_docs if d.get("is_required"))
+
+    uploaded_required = 0
+    for d in required_docs:
+        if not d.get("is_required"):
+            continue
+        rec = uploaded_map.get(d["id"])
+        if not rec:
+            continue
+        if is_security_verification(d["name"]):
+            urls = split_csv_list(rec.get("drive_link") or "")
+            if urls:
+                uploaded_required += 1
+        else:
+            if (rec.get("drive_link") or "").strip():
+                uploaded_required += 1
+
+    completion = int(round((uploaded_required / total_required) * 100)) if total_required else 100
+
+    colA, colB = st.columns([1, 3])
+    with colA:
+        st.metric("Completitud", f"{completion}%")
+        st.caption(f"{uploaded_required}/{total_required} requeridos cargados" if total_required else "Sin documentos requeridos")
+    with colB:
+        st.text("")
+        st.text("")
+        st.text("")
+        st.progress(completion / 100)
+
+    # 6) Detalle de documentos (estado en Drive desde el espejo local, sin llamadas a Drive)
+    mirror, last_sync_at = detail["mirror"], detail["last_sync_at"]
+
+    # Historial de versiones de toda la solicitud
+    versions_by_doc = {}
+    for v in detail["versions"]:
+        versions_by_doc.setdefault(v["document_type_id"], []).append(v)
+
+    st.write("---")
+    st.caption("Estado de documentos.")
+
+    for doc in required_docs:
+        doc_id = doc["id"]
+        doc_name = doc["name"]
+        is_required = bool(doc.get("is_required"))
+        row = uploaded_map.get(doc_id)
+        uploaded_at = row.get("uploaded_at") if row else None
+
+        if is_security_verification(doc_name):
+            # Múltiples enlaces separados por comas
+            links_csv = row.get("drive_link") if row else ""
+            names_csv = row.get("file_name") if row else ""
+            urls = split_csv_list(links_csv)
+            names = split_csv_list(names_csv)
+
+            if urls:
+                st.markdown(f"✅ **{doc_name}**{' (obligatorio)' if is_required else ''} — {len(urls)} archivo(s):")
+                for i, u in enumerate(urls):
+                    label = names[i] if i < len(names) else f"Archivo {i+1}"
+                    st.markdown(f"- [{label}]({u}){drive_status_suffix(u, mirror, last_sync_at, uploaded_at)}")
+            else:
+                st.markdown(f"❌ **{doc_name}**{' (obligatorio)' if is_required else ''} — No cargado")
+        else:
+            link = row.get("drive_link") if row else None
+            if (link or "").strip():
+                st.markdown(f"✅ **{doc_name}**{' (obligatorio)' if is_required else ''} — [Ver archivo]({link}){drive_status_suffix(link, mirror, last_sync_at, uploaded_at)}")
+                previous = [v for v in versions_by_doc.get(doc_id, []) if v["drive_link"] != link]
+                if previous:
+                    with st.expander(f"Versiones anteriores ({len(previous)})"):
+                        for v in previous:
+                            when = v["uploaded_at"].strftime("%Y-%m-%d %H:%M")
+                            st.markdown(f"- [{v['file_name'] or 'Archivo'}]({v['drive_link']}) · {when} · {v.get('uploaded_by') or '—'}")
+            else:
+                st.markdown(f"❌ **{doc_name}**{' (obligatorio)' if is_required else ''} — No cargado")
+
+    # 7) Seguimiento y comentarios (solo si hay entradas en la bitácora)
+    notif = detail["notes"]["seguimiento"]
+    comms = detail["notes"]["comentario"]
+
+    if notif or comms:
+        st.write("---")
+        st.markdown("**Seguimiento y comentarios**")
+
+        fetch_page = _notes_fetcher(detail, archived)
+        if notif and comms:
+            colN, colC = st.columns(2)
+            with colN:
+                with st.expander("Ver seguimiento", expanded=True):
+                    render_note_log(request_id, "seguimiento", fetch_page, "pv")
+            with colC:
+                with st.expander("Ver comentarios", expanded=True):
+                    render_note_log(request_id, "comentario", fetch_page, "pv")
+        elif notif:
+            st.markdown("**Seguimiento de notificación**")
+            with st.expander("Ver seguimiento", expanded=True):
+                render_note_log(request_id, "seguimiento", fetch_page, "pv")
+        else:
+            st.markdown("**Comentarios generales**")
+            with st.expander("Ver comentarios", expanded=True):
+                render_note_log(request_id, "comentario", fetch_page, "pv")
+
+
 # --------------------
 # Main
 # --------------------
@@ -38,185 +228,102 @@ def show(current_user_email: str | None = None, is_admin: bool = False):
     Luego se filtra por compañía/perfil dentro del conjunto permitido.
     """
     st.subheader("📊 Progreso de carga de documentos")
+    include_archived = st.checkbox("Incluir archivadas", key="pv_include_archived")
 
-    session = SessionLocal()
-    try:
-        # 1) Traer solicitudes según rol
-        email_filter = None if is_admin else (current_user_email or None)
-        requests = get_requests_for_progress(session, only_for_email=email_filter)
-        if not requests:
-            st.info("No hay solicitudes para mostrar.")
-            return
+    # 1) Traer solicitudes según rol. Página de solo lectura: réplica si está
+    # disponible y al día (run_read vuelve al primario si falla)
+    email_filter = None if is_admin else (current_user_email or None)
 
-        # 2) Construir listas a partir del conjunto filtrado
-        companies = sorted({r.get("company_name") for r in requests if r.get("company_name")})
-
-        # Mapa nombre->id para TODOS los perfiles definidos en el sistema
-        all_profile_names = get_profiles_list(session) or []  # p.ej. ["Cliente", "Proveedor", ...]
-        name_to_id = {}
-        for name in all_profile_names:
-            pid = get_profile_id_by_name(session, name)
-            if pid:
-                name_to_id[name] = pid
-
-        # Perfiles realmente presentes en las solicitudes filtradas (disponibles para selección)
-        present_profile_ids = {r.get("profile_id") for r in requests if r.get("profile_id") is not None}
-        available_profiles = [(name, pid) for name, pid in name_to_id.items() if pid in present_profile_ids]
-        # Orden alfabético por nombre
-        available_profiles.sort(key=lambda x: x[0])
-
-        col1, col2 = st.columns(2)
-        with col1:
-            company_name = st.selectbox(
-                "Nombre de la compañía",
-                companies,
-                index=None,
-                placeholder="Selecciona la compañía...",
-                key="pv_company_selector"
-            )
-        with col2:
-            profile_name = st.selectbox(
-                "Perfil",
-                [name for (name, _) in available_profiles],
-                index=None,
-                placeholder="Selecciona el perfil...",
-                key="pv_profile_selector"
-            )
-
-        if not company_name or not profile_name:
-            st.info("Selecciona compañía y perfil para continuar.")
-            return
+    def fetch_requests(session):
+        rows = get_requests_for_progress(session, only_for_email=email_filter)
+        if include_archived:
+            # El archivo solo se consulta cuando se pide
+            rows += get_archived_requests(session, only_for_email=email_filter)
+            rows.sort(key=lambda r: r["created_at"], reverse=True)
+        return rows
 
-        # Resolver profile_id a partir del nombre elegido
-        profile_id = name_to_id.get(profile_name)
-        if not profile_id:
-            st.error("❌ El perfil seleccionado no existe en la base de datos.")
-            return
+    requests = run_read(fetch_requests)
+    if not requests:
+        st.info("No hay solicitudes para mostrar.")
+        return
 
-        # 3) Filtrar las solicitudes (dentro del conjunto permitido) por compañía y perfil
-        filtered_requests = [
-            r for r in requests
-            if r.get("company_name") == company_name and r.get("profile_id") == profile_id
-        ]
-        if not filtered_requests:
-            st.warning("No hay solicitudes para esta compañía y perfil (con los permisos actuales).")
-            return
+    # 2) Construir listas a partir del conjunto filtrado
+    # Compañías canónicas (id -> nombre) presentes en el conjunto permitido
+    company_names = {r["company_id"]: r["company_name"] for r in requests if r.get("company_id")}
+    companies = sorted(company_names, key=lambda cid: company_names[cid])
+
+    # Mapa nombre->id para TODOS los perfiles definidos en el sistema
+    name_to_id = _load_profile_ids()  # p.ej. {"Cliente": 1, "Proveedor": 2, ...}
+
+    # Perfiles realmente presentes en las solicitudes filtradas (disponibles para selección)
+    present_profile_ids = {r.get("profile_id") for r in requests if r.get("profile_id") is not None}
+    available_profiles = [(name, pid) for name, pid in name_to_id.items() if pid in present_profile_ids]
+    # Orden alfabético por nombre
+    available_profiles.sort(key=lambda x: x[0])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        company_id = st.selectbox(
+            "Nombre de la compañía",
+            companies,
+            format_func=lambda cid: company_names.get(cid, str(cid)),
+            index=None,
+            placeholder="Selecciona la compañía...",
+            key="pv_company_selector"
+        )
+    with col2:
+        profile_name = st.selectbox(
+            "Perfil",
+            [name for (name, _) in available_profiles],
+            index=None,
+            placeholder="Selecciona el perfil...",
+            key="pv_profile_selector"
+        )
+
+    if not company_id or not profile_name:
+        st.info("Selecciona compañía y perfil para continuar.")
+        return
+
+    # Resolver profile_id a partir del nombre elegido
+    profile_id = name_to_id.get(profile_name)
+    if not profile_id:
+        st.error("❌ El perfil seleccionado no existe en la base de datos.")
+        return
+
+    # 3) Filtrar las solicitudes (dentro del conjunto permitido) por compañía y perfil
+    filtered_requests = [
+        r for r in requests
+        if r.get("company_id") == company_id and r.get("profile_id") == profile_id
+    ]
+    if not filtered_requests:
+        st.warning("No hay solicitudes para esta compañía y perfil (con los permisos actuales).")
+        return
 
-        # 4) Elegir solicitud si hay varias
-        options = [
-            f"ID {r['id']} • {r['created_at'].strftime('%Y-%m-%d %H:%M')} • {r.get('created_by_email') or ''}"
-            for r in filtered_requests
-        ]
-        idx = 0
-        if len(options) > 1:
-            idx = st.selectbox(
-                "Selecciona la solicitud",
-                list(range(len(options))),
-                index=None,
-                placeholder="Selecciona una solicitud...",
-                format_func=lambda i: options[i],
-                key="pv_request_selector"
-            )
-            if idx is None:
-                st.info("Selecciona una solicitud para continuar.")
-                return
-
-        selected_request = filtered_requests[idx]
-        request_id = selected_request["id"]
-
-        # 5) Cálculo de progreso (ANTES de listar documentos)
-        required_docs = get_required_document_types(session, profile_id)  # [{id, name, is_required}, ...]
-        uploaded_map  = get_uploaded_documents_map(session, request_id)   # {document_type_id: {...}}
-
-        if not required_docs:
-            st.info("Este perfil no tiene tipos de documentos configurados.")
+    # 4) Elegir solicitud si hay varias
+    options = [
+        f"ID {r['id']} • {r['created_at'].strftime('%Y-%m-%d %H:%M')} • {r.get('created_by_email') or ''}"
+        + (" • archivada" if r.get("archived") else "")
+        for r in filtered_requests
+    ]
+    idx = 0
+    if len(options) > 1:
+        idx = st.selectbox(
+            "Selecciona la solicitud",
+            list(range(len(options))),
+            index=None,
+            placeholder="Selecciona una solicitud...",
+            format_func=lambda i: options[i],
+            key="pv_request_selector"
+        )
+        if idx is None:
+            st.info("Selecciona una solicitud para continuar.")
             return
 
-        total_required = sum(1 for d in required_docs if d.get("is_required"))
-
-        uploaded_required = 0
-        for d in required_docs:
-            if not d.get("is_required"):
-                continue
-            rec = uploaded_map.get(d["id"])
-            if not rec:
-                continue
-            if is_security_verification(d["name"]):
-                urls = split_csv_list(rec.get("drive_link") or "")
-                if urls:
-                    uploaded_required += 1
-            else:
-                if (rec.get("drive_link") or "").strip():
-                    uploaded_required += 1
-
-        completion = int(round((uploaded_required / total_required) * 100)) if total_required else 100
-
-        colA, colB = st.columns([1, 3])
-        with colA:
-            st.metric("Completitud", f"{completion}%")
-            st.caption(f"{uploaded_required}/{total_required} requeridos cargados" if total_required else "Sin documentos requeridos")
-        with colB:
-            st.text("")
-            st.text("")
-            st.text("")
-            st.progress(completion / 100)
-
-        # 6) Detalle de documentos
-        st.write("---")
-        st.caption("Estado de documentos.")
-
-        for doc in required_docs:
-            doc_id = doc["id"]
-            doc_name = doc["name"]
-            is_required = bool(doc.get("is_required"))
-            row = uploaded_map.get(doc_id)
-
-            if is_security_verification(doc_name):
-                # Múltiples enlaces separados por comas
-                links_csv = row.get("drive_link") if row else ""
-                names_csv = row.get("file_name") if row else ""
-                urls = split_csv_list(links_csv)
-                names = split_csv_list(names_csv)
-
-                if urls:
-                    st.markdown(f"✅ **{doc_name}**{' (obligatorio)' if is_required else ''} — {len(urls)} archivo(s):")
-                    for i, u in enumerate(urls):
-                        label = names[i] if i < len(names) else f"Archivo {i+1}"
-                        st.markdown(f"- [{label}]({u})")
-                else:
-                    st.markdown(f"❌ **{doc_name}**{' (obligatorio)' if is_required else ''} — No cargado")
-            else:
-                link = row.get("drive_link") if row else None
-                if (link or "").strip():
-                    st.markdown(f"✅ **{doc_name}**{' (obligatorio)' if is_required else ''} — [Ver archivo]({link})")
-                else:
-                    st.markdown(f"❌ **{doc_name}**{' (obligatorio)' if is_required else ''} — No cargado")
-
-        # 7) Seguimiento y comentarios (solo si hay info)
-        meta = get_request_meta(session, request_id) or {}
-        notif = (meta.get("notification_followup") or "").strip()
-        comms = (meta.get("general_comments") or "").strip()
-
-        if notif or comms:
-            st.write("---")
-            st.markdown("**Seguimiento y comentarios**")
-
-            if notif and comms:
-                colN, colC = st.columns(2)
-                with colN:
-                    with st.expander("Ver seguimiento", expanded=True):
-                        st.markdown(notif)
-                with colC:
-                    with st.expander("Ver comentarios", expanded=True):
-                        st.markdown(comms)
-            elif notif:
-                st.markdown("**Seguimiento de notificación**")
-                with st.expander("Ver seguimiento", expanded=True):
-                    st.markdown(notif)
-            else:
-                st.markdown("**Comentarios generales**")
-                with st.expander("Ver comentarios", expanded=True):
-                    st.markdown(comms)
+    selected_request = filtered_requests[idx]
+    request_id = selected_request["id"]
+    archived = bool(selected_request.get("archived"))
+    if archived:
+        st.info(f"🗄️ Solicitud archivada el {selected_request['archived_at'].strftime('%Y-%m-%d')}.")
 
-    finally:
-        session.close()
+    # 5-7) Detalle en vivo de la solicitud elegida
+    _request_detail_fragment(request_id, profile_id, archived)
@@ -0,0 +1,48 @@
+# workers/analytics_refresh.py
+"""
+Refresca incrementalmente los rollups de analítica de onboarding.
+
+    python -m workers.analytics_refresh            # bucle continuo
+    python -m workers.analytics_refresh --once     # una pasada y termina
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from database.db import SessionLocal
+from database.crud.analytics import refresh_onboarding_rollup
+
+log = logging.getLogger("analytics_refresh")
+
+REFRESH_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_REFRESH_INTERVAL_SECONDS", "300"))
+
+
+def refresh_once() -> int:
+    with SessionLocal() as session, session.begin():
+        return refresh_onboarding_rollup(session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresca los rollups de analítica de onboarding.")
+    parser.add_argument("--once", action="store_true", help="Ejecuta una sola pasada.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    while True:
+        try:
+            groups = refresh_once()
+            log.info("Rollup actualizado: %s grupo(s) recalculado(s)", groups)
+        except Exception:
+            log.exception("Fallo refrescando rollups; se reintenta en el próximo ciclo")
+            if args.once:
+                raise
+        if args.once:
+            return
+        time.sleep(REFRESH_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
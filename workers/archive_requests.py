@@ -0,0 +1,68 @@
+# workers/archive_requests.py
+"""
+Archiva solicitudes completadas o inactivas para mantener pequeñas las tablas
+activas (clients_requests, uploaded_documents, request_notes).
+
+    python -m workers.archive_requests            # una pasada diaria
+    python -m workers.archive_requests --once     # una pasada y termina
+
+Cada lote va en su propia transacción corta, con lock_timeout y statement_timeout,
+para no bloquear a la app mientras se vacía un histórico grande.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from database.db import SessionLocal
+from database.crud.archive import archive_requests_batch
+
+log = logging.getLogger("archive_requests")
+
+ARCHIVE_COMPLETED_AFTER_DAYS = int(os.getenv("ARCHIVE_COMPLETED_AFTER_DAYS", "180"))
+ARCHIVE_INACTIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_INACTIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "86400"))
+
+
+def archive_once() -> int:
+    """Archiva por lotes hasta que no queden candidatas. Devuelve el total movido."""
+    total = 0
+    while True:
+        with SessionLocal() as session, session.begin():
+            session.execute(text("SET LOCAL lock_timeout = '5s'"))
+            session.execute(text("SET LOCAL statement_timeout = '60s'"))
+            moved = archive_requests_batch(
+                session, ARCHIVE_COMPLETED_AFTER_DAYS, ARCHIVE_INACTIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+            )
+        total += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            return total
+        log.info("Lote archivado: %s solicitud(es)", moved)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiva solicitudes completadas o inactivas.")
+    parser.add_argument("--once", action="store_true", help="Ejecuta una sola pasada.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    while True:
+        try:
+            total = archive_once()
+            log.info("Archivo completado: %s solicitud(es) movida(s)", total)
+        except Exception:
+            log.exception("Fallo archivando; se reintenta en el próximo ciclo")
+            if args.once:
+                raise
+        if args.once:
+            return
+        time.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# workers/drive_sync.py
+"""
+Mantiene la tabla drive_files como espejo local de la unidad compartida
+siguiendo el feed changes.list de Drive.
+
+    python -m workers.drive_sync            # bucle continuo
+    python -m workers.drive_sync --once     # una pasada y termina
+
+El page token se guarda en drive_sync_state en la misma transacción que los
+cambios aplicados, así que un reinicio continúa desde la última página confirmada.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import streamlit as st
+
+from database.db import SessionLocal
+from database.crud.drive_files import (
+    get_drive_sync_state,
+    save_drive_sync_state,
+    upsert_drive_files,
+    delete_drive_files,
+)
+from services.google_drive_utils import (
+    init_drive,
+    get_start_page_token,
+    list_changes_page,
+    iter_drive_files,
+)
+from services.rate_limit import format_rate_limit_stats
+
+log = logging.getLogger("drive_sync")
+
+SYNC_INTERVAL_SECONDS = int(os.getenv("DRIVE_SYNC_INTERVAL_SECONDS", "60"))
+BATCH_SIZE = 500
+
+
+def full_resync(service, shared_drive_id: str) -> None:
+    # El token se pide ANTES del listado: los cambios ocurridos durante el
+    # recorrido se vuelven a aplicar después (el upsert es idempotente).
+    token = get_start_page_token(service, shared_drive_id)
+
+    batch, total = [], 0
+    for f in iter_drive_files(service, shared_drive_id):
+        batch.append(f)
+        if len(batch) >= BATCH_SIZE:
+            with SessionLocal() as session, session.begin():
+                upsert_drive_files(session, batch)
+            total += len(batch)
+            batch = []
+    with SessionLocal() as session, session.begin():
+        upsert_drive_files(session, batch)
+        save_drive_sync_state(session, shared_drive_id, token)
+    total += len(batch)
+    log.info("Resincronización completa: %s archivos", total)
+
+
+def sync_changes(service, shared_drive_id: str) -> int:
+    with SessionLocal() as session:
+        state = get_drive_sync_state(session, shared_drive_id)
+    if not state:
+        full_resync(service, shared_drive_id)
+        return 0
+
+    page_token = state["page_token"]
+    applied = 0
+    while page_token:
+        res = list_changes_page(service, shared_drive_id, page_token)
+        changes = res.get("changes", [])
+
+        upserts = [c["file"] for c in changes if not c.get("removed") and c.get("file")]
+        removed = [c["fileId"] for c in changes if c.get("removed")]
+
+        next_token = res.get("nextPageToken")
+        new_start = res.get("newStartPageToken")
+
+        with SessionLocal() as session, session.begin():
+            upsert_drive_files(session, upserts)
+            delete_drive_files(session, removed)
+            save_drive_sync_state(session, shared_drive_id, next_token or new_start)
+
+        applied += len(changes)
+        page_token = next_token  # None cuando llega newStartPageToken: fin del feed
+
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza metadatos de Drive en drive_files.")
+    parser.add_argument("--once", action="store_true", help="Ejecuta una sola pasada.")
+    parser.add_argument("--full", action="store_true", help="Fuerza un listado completo antes de seguir el feed.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    shared_drive_id = st.secrets["drive"].get("shared_drive_id")
+    if not shared_drive_id:
+        raise SystemExit("drive.shared_drive_id no está definido; el feed de cambios requiere una unidad compartida.")
+
+    service = init_drive()
+    if args.full:
+        full_resync(service, shared_drive_id)
+
+    while True:
+        try:
+            applied = sync_changes(service, shared_drive_id)
+            if applied:
+                log.info("Cambios aplicados: %s", applied)
+                log.info("Cuota de Google: %s", format_rate_limit_stats())
+        except Exception:
+            log.exception("Fallo sincronizando Drive; se reintenta en el próximo ciclo")
+            if args.once:
+                raise
+        if args.once:
+            return
+        time.sleep(SYNC_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
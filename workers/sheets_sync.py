@@ -0,0 +1,76 @@
+# workers/sheets_sync.py
+"""
+Sincroniza la hoja "Solicitudes de Creacion" con clients_requests: calcula el
+estado deseado (una fila por solicitud, con su avance) y escribe solo lo que
+cambió. Corrige también filas que quedaron a medias o faltan por un guardado fallido.
+
+    python -m workers.sheets_sync            # bucle continuo
+    python -m workers.sheets_sync --once     # una pasada y termina
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from database.db import SessionLocal
+from database.crud.documents import get_requests_for_sheet
+from services.rate_limit import format_rate_limit_stats
+from services.sheets_writer import request_row, sync_requests_sheet
+
+log = logging.getLogger("sheets_sync")
+
+SYNC_INTERVAL_SECONDS = int(os.getenv("SHEETS_SYNC_INTERVAL_SECONDS", "600"))
+
+
+def desired_rows() -> dict[int, list[str]]:
+    with SessionLocal() as session:
+        rows = get_requests_for_sheet(session)
+    return {
+        r["id"]: request_row({
+            "request_id": r["id"],
+            "created_at": r["created_at"],
+            "requested_by": r["requested_by"],
+            "tipo_solicitud": r["profile_name"],
+            "company_name": r["company_name"],
+            "nombre_completo": r["colaborador_nombre"],
+            "cedula": r["colaborador_cedula"],
+            "email": r["email"],
+            "trading": r["trading"],
+            "location": r["location"],
+            "language": r["language"],
+            "reminder_frequency": r["reminder_frequency"],
+            "progress": f"{r['required_uploaded']}/{r['required_total']}",
+            "status": r["status"],
+        })
+        for r in rows
+    }
+
+
+def sync_once() -> int:
+    return sync_requests_sheet(desired_rows())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza la hoja de solicitudes con la base de datos.")
+    parser.add_argument("--once", action="store_true", help="Ejecuta una sola pasada.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    while True:
+        try:
+            written = sync_once()
+            log.info("Hoja sincronizada: %s fila(s) escrita(s)", written)
+            log.info("Cuota de Google: %s", format_rate_limit_stats())
+        except Exception:
+            log.exception("Fallo sincronizando la hoja; se reintenta en el próximo ciclo")
+            if args.once:
+                raise
+        if args.once:
+            return
+        time.sleep(SYNC_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# workers/upload_worker.py
+"""
+Consume la cola upload_jobs: sube a Drive los archivos que el formulario dejó
+en el área de staging y registra el resultado en la DB.
+
+    python -m workers.upload_worker            # bucle continuo
+    python -m workers.upload_worker --once     # procesa lo pendiente y termina
+
+Se pueden levantar varias instancias: cada trabajo se reclama con
+FOR UPDATE SKIP LOCKED y un lease (locked_until) que, si el worker muere,
+vence y deja el trabajo disponible de nuevo.
+
+Cada trabajo pasa por tres pasos, cada uno en su propia transacción corta:
+  1. reclamar el trabajo;
+  2. subir a Drive (sin transacción abierta) y guardar el enlace en el trabajo;
+  3. registrar documento, versión y marcas de progreso y cerrar el trabajo.
+Si el paso 3 falla, el reintento reutiliza el enlace del paso 2 y no vuelve a subir.
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from database.db import SessionLocal
+from database.crud.documents import (
+    get_uploaded_documents_map,
+    upsert_uploaded_document,
+    append_uploaded_document_file,
+    record_document_version,
+    set_first_upload_at_if_null,
+    touch_request_progress,
+)
+from database.crud.upload_jobs import (
+    claim_upload_job,
+    set_upload_job_link,
+    save_upload_progress,
+    complete_upload_job,
+    fail_upload_job,
+    take_expired_staging_files,
+)
+from services.google_drive_utils import init_drive, find_or_create_folder, upload_to_drive
+from services.cache import get_cache, format_cache_stats
+from services.rate_limit import format_rate_limit_stats
+
+log = logging.getLogger("upload_worker")
+
+POLL_INTERVAL_SECONDS = float(os.getenv("UPLOAD_WORKER_POLL_SECONDS", "2"))
+LEASE_SECONDS = int(os.getenv("UPLOAD_WORKER_LEASE_SECONDS", "900"))
+RETRY_BASE_SECONDS = 30
+FOLDER_CACHE_TTL_SECONDS = 86400
+STAGING_CLEANUP_INTERVAL_SECONDS = 3600
+
+
+def _retry_delay(attempts: int) -> int:
+    # Backoff exponencial con jitter: ~30s, 60s, 120s, ...
+    return int(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)) * random.uniform(0.8, 1.2))
+
+
+class LeaseLost(Exception):
+    """El lease venció y otro worker reclamó el trabajo: este abandona la carga."""
+
+
+class UploadWorker:
+    def __init__(self):
+        self.service = init_drive()
+        self.shared_drive_id = st.secrets["drive"].get("shared_drive_id")
+        self.parent_folder_id = st.secrets["drive"].get("parent_folder_id")
+        self._staging_cleaned_at = 0.0
+
+    def _folder_key(self, folder_name: str) -> str:
+        return f"{self.parent_folder_id or self.shared_drive_id}:{folder_name}"
+
+    def _folder_id(self, folder_name: str) -> str:
+        # Compartida entre workers/réplicas: la carpeta se busca (o crea) una vez
+        return get_cache().get_or_set(
+            "drive_folders",
+            self._folder_key(folder_name),
+            lambda: find_or_create_folder(
+                self.service,
+                folder_name,
+                shared_drive_id=self.shared_drive_id if not self.parent_folder_id else None,
+                parent_folder_id=self.parent_folder_id,
+            ),
+            ttl=FOLDER_CACHE_TTL_SECONDS,
+        )
+
+    def run_once(self) -> bool:
+        """Procesa un trabajo. Devuelve False si no había ninguno listo."""
+        with SessionLocal() as session, session.begin():
+            job = claim_upload_job(session, LEASE_SECONDS)
+        if not job:
+            return False
+
+        last = {}
+
+        def on_progress(resumable_uri, stats):
+            last["stats"] = stats
+            # Cada bloque renueva el lease: una carga larga no se reclama a mitad de camino
+            with SessionLocal() as session, session.begin():
+                owned = save_upload_progress(
+                    session, job["id"], job["attempts"], LEASE_SECONDS, resumable_uri,
+                    stats.bytes_sent, stats.total_bytes, stats.retries, stats.bytes_per_second
+                )
+            if not owned:
+                raise LeaseLost(f"El trabajo {job['id']} fue reclamado por otro worker")
+
+        try:
+            drive_link = job["drive_link"]
+            if not drive_link:
+                # Si un intento anterior dejó una sesión reanudable, se continúa desde su último byte
+                drive_link = upload_to_drive(
+                    self.service, self._folder_id(job["folder_name"]), job["staging_path"], job["file_name"],
+                    resume_uri=job["resumable_uri"], on_progress=on_progress,
+                )
+                with SessionLocal() as session, session.begin():
+                    set_upload_job_link(session, job["id"], drive_link)
+
+            with SessionLocal() as session, session.begin():
+                self._record(session, job, drive_link)
+                complete_upload_job(session, job["id"])
+
+        except LeaseLost as e:
+            # El trabajo (y su archivo de staging) ahora es del otro worker
+            log.warning("%s; se abandona este intento", e)
+            return True
+
+        except Exception as e:
+            log.exception("Trabajo %s falló (intento %s)", job["id"], job["attempts"])
+            # Por si la carpeta cacheada ya no existe: el reintento la vuelve a buscar
+            get_cache().delete("drive_folders", self._folder_key(job["folder_name"]))
+            retry = _retry_delay(job["attempts"]) if job["attempts"] < job["max_attempts"] else None
+            with SessionLocal() as session, session.begin():
+                fail_upload_job(session, job["id"], str(e), retry)
+            return True
+
+        try:
+            os.remove(job["staging_path"])
+        except OSError:
+            pass
+        stats = last.get("stats")
+        if stats:
+            log.info("Trabajo %s completado: %s (%.0f KB/s, %s reintento(s), retomado desde %s bytes)",
+                     job["id"], job["file_name"], stats.bytes_per_second / 1024, stats.retries, stats.resumed_from)
+        else:
+            log.info("Trabajo %s completado: %s", job["id"], job["file_name"])
+        log.info("Cuota de Google: %s", format_rate_limit_stats())
+        log.info("Caché: %s", format_cache_stats())
+        return True
+
+    def cleanup_staging(self):
+        """Borra los archivos de trabajos fallidos que ya no se pueden reintentar (a lo sumo cada hora)."""
+        if time.monotonic() - self._staging_cleaned_at < STAGING_CLEANUP_INTERVAL_SECONDS:
+            return
+        self._staging_cleaned_at = time.monotonic()
+        with SessionLocal() as session, session.begin():
+            paths = take_expired_staging_files(session)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if paths:
+            log.info("Staging: %s archivo(s) de trabajos fallidos eliminados", len(paths))
+
+    def _record(self, session, job: dict, drive_link: str):
+        request_id, doc_id = job["request_id"], job["document_type_id"]
+
+        if job["multi"]:
+            recorded = append_uploaded_document_file(
+                session, request_id, doc_id, job["file_name"], drive_link, job["uploaded_by"]
+            )
+        else:
+            # 1:1: una carga sobre un documento existente lo reemplaza como nueva versión
+            current = get_uploaded_documents_map(session, request_id).get(doc_id)
+            recorded = not current or current.get("drive_link") != drive_link
+            if recorded:
+                upsert_uploaded_document(
+                    session=session,
+                    request_id=request_id,
+                    document_type_id=doc_id,
+                    file_name=job["file_name"],
+                    drive_link=drive_link,
+                    uploaded_by=job["uploaded_by"]
+                )
+
+        if recorded:
+            record_document_version(session, request_id, doc_id, job["file_name"], drive_link, job["uploaded_by"])
+            set_first_upload_at_if_null(session, request_id, datetime.now(timezone.utc))
+            touch_request_progress(session, request_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa la cola de cargas a Drive.")
+    parser.add_argument("--once", action="store_true", help="Procesa lo pendiente y termina.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    worker = UploadWorker()
+    while True:
+        try:
+            worked = worker.run_once()
+        except Exception:
+            log.exception("Error en el ciclo del worker")
+            worked = False
+        if not worked:
+            try:
+                worker.cleanup_staging()
+            except Exception:
+                log.exception("Error limpiando el staging")
+            if args.once:
+                return
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    main()